@@ -1 +1,5 @@
 # App package
+import time
+
+# Start of the app's own imports, for measuring cold starts (services/readiness.py)
+STARTED_AT = time.perf_counter()
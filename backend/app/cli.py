@@ -0,0 +1,247 @@
+"""
+Offline Bulk Analysis
+
+Runs the analysis pipeline over every tactic proof in a directory or Lake
+project and writes one JSON line per proof, without the HTTP server.
+
+Usage (from backend/):
+    python -m app.cli path/to/project --out timelines.jsonl --jobs 4 --lean-limit 8
+
+Files are handed out to a pool of worker processes; each worker analyzes
+the proofs of a file concurrently, and a semaphore shared by all workers
+caps the number of Lean sessions in flight. Records are appended to the
+output as they finish, so an interrupted run can be resumed by running
+the same command again: proofs that already have a complete record (for
+the same source) are skipped. With SEARCH_INDEX_PATH set, complete
+timelines are also added to the search index.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from .config import get_settings
+from .models import ProofTimeline
+from .routers.proof import build_analysis
+from .services.corpus import LeanDeclaration, find_lean_files, split_declarations
+from .services.deadline import Deadline, deadline_scope
+from .services.search_index import SearchIndex, get_search_index
+
+
+# Per-process state set up by _init_worker
+_work: Any = None
+_results: Any = None
+_lean_slots: Any = None
+
+# How often a worker retries the shared Lean semaphore
+LEAN_SLOT_POLL_INTERVAL = 0.05
+
+# Timelines added to the search index per transaction
+INDEX_BATCH_SIZE = 200
+
+
+def record_id(file: str, name: str) -> str:
+    return f"{file}::{name}"
+
+
+def load_done(out_path: Path) -> set[tuple[str, str]]:
+    """
+    (id, key) pairs with a complete record in an existing output file.
+
+    A record cut off by an interrupted run is removed so new records start
+    on a fresh line.
+    """
+    if not out_path.exists():
+        return set()
+    data = out_path.read_bytes()
+    complete_up_to = data.rfind(b"\n") + 1
+    if complete_up_to < len(data):
+        with open(out_path, "r+b") as f:
+            f.truncate(complete_up_to)
+
+    done = set()
+    for line in data[:complete_up_to].splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("complete"):
+            done.add((record["id"], record["key"]))
+    return done
+
+
+def _init_worker(work, results, lean_slots) -> None:
+    global _work, _results, _lean_slots
+    _work, _results, _lean_slots = work, results, lean_slots
+
+
+def run_worker(root: str, done: set[tuple[str, str]], per_file: int, timeout: float) -> int:
+    """Worker process entry point: analyze files from the work queue until it is drained."""
+    try:
+        return asyncio.run(_worker_main(Path(root), done, per_file, timeout))
+    finally:
+        # Queue order is kept per producer, so this arrives after the worker's records
+        _results.put(None)
+
+
+async def _worker_main(root: Path, done: set[tuple[str, str]], per_file: int, timeout: float) -> int:
+    analyzed = 0
+    while True:
+        path = await asyncio.to_thread(_work.get)
+        if path is None:
+            return analyzed
+        analyzed += await _analyze_file(root, Path(path), done, per_file, timeout)
+
+
+async def _analyze_file(root: Path, path: Path, done: set[tuple[str, str]], per_file: int, timeout: float) -> int:
+    rel = path.relative_to(root).as_posix()
+    try:
+        source = path.read_text(encoding="utf-8")
+    except (OSError, UnicodeDecodeError) as e:
+        _results.put(json.dumps({"id": record_id(rel, ""), "file": rel, "complete": False, "error": f"Unreadable file: {e}"}))
+        return 0
+
+    todo = [d for d in split_declarations(source) if (record_id(rel, d.name), d.key) not in done]
+    limit = asyncio.Semaphore(per_file)
+
+    async def analyze(declaration: LeanDeclaration) -> None:
+        async with limit:
+            record = await _analyze_declaration(rel, declaration, timeout)
+        _results.put(json.dumps(record, ensure_ascii=False))
+
+    await asyncio.gather(*(analyze(d) for d in todo))
+    return len(todo)
+
+
+async def _analyze_declaration(rel: str, declaration: LeanDeclaration, timeout: float) -> dict[str, Any]:
+    # The semaphore is shared across processes, so it can't be awaited
+    while not _lean_slots.acquire(block=False):
+        await asyncio.sleep(LEAN_SLOT_POLL_INTERVAL)
+    started = time.perf_counter()
+    try:
+        with deadline_scope(Deadline(timeout)):
+            response, complete = await build_analysis(declaration.code)
+    finally:
+        _lean_slots.release()
+
+    return {
+        "id": record_id(rel, declaration.name),
+        "key": declaration.key,
+        "file": rel,
+        "declaration": declaration.name,
+        "kind": declaration.kind,
+        "line": declaration.line,
+        "line_offset": declaration.line_offset,
+        "complete": complete and response.error is None,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        "timeline": response.timeline.model_dump(mode="json") if response.timeline else None,
+        "error": response.error,
+    }
+
+
+def run(args: argparse.Namespace) -> int:
+    root = args.path.resolve()
+    files = find_lean_files(root)
+    if not files:
+        print(f"No .lean files found under {root}", file=sys.stderr)
+        return 1
+    if root.is_file():
+        root = root.parent
+
+    done = set() if args.restart else load_done(args.out)
+    # Biggest files first so a large file doesn't start last
+    files.sort(key=lambda p: p.stat().st_size, reverse=True)
+
+    ctx = multiprocessing.get_context("spawn")
+    work, results = ctx.Queue(), ctx.Queue()
+    lean_slots = ctx.BoundedSemaphore(args.lean_limit)
+    for path in files:
+        work.put(str(path))
+    for _ in range(args.jobs):
+        work.put(None)
+
+    written = failed = 0
+    started = time.perf_counter()
+    print(f"Analyzing {len(files)} files with {args.jobs} workers ({len(done)} proofs already done)", file=sys.stderr)
+
+    # Records are indexed by this (single) process, so workers never contend for the index
+    index = get_search_index()
+    pending_index: list[tuple[str, str, ProofTimeline]] = []
+
+    mode = "w" if args.restart else "a"
+    with open(args.out, mode, encoding="utf-8") as out, ProcessPoolExecutor(
+        max_workers=args.jobs,
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(work, results, lean_slots),
+    ) as pool:
+        workers = [
+            pool.submit(run_worker, str(root), done, args.per_file, args.timeout)
+            for _ in range(args.jobs)
+        ]
+        finished = 0
+        while finished < args.jobs:
+            try:
+                line = results.get(timeout=0.5)
+            except queue.Empty:
+                flush_index(index, pending_index)
+                if any(w.done() and w.exception() for w in workers):
+                    break
+                continue
+            if line is None:
+                finished += 1
+                continue
+            out.write(line + "\n")
+            out.flush()
+            written += 1
+            record = json.loads(line)
+            if not record.get("complete"):
+                failed += 1
+            elif index is not None and record["timeline"]:
+                pending_index.append((record["key"], record["id"], ProofTimeline.model_validate(record["timeline"])))
+                if len(pending_index) >= INDEX_BATCH_SIZE:
+                    flush_index(index, pending_index)
+            if written % 50 == 0:
+                print(f"  {written} proofs ({failed} incomplete), {time.perf_counter() - started:.0f}s", file=sys.stderr)
+
+        flush_index(index, pending_index)
+        for w in workers:
+            w.result()  # Re-raise worker crashes
+
+    print(f"Wrote {written} records to {args.out} ({failed} incomplete) in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return 0
+
+
+def flush_index(index: SearchIndex | None, pending: list[tuple[str, str, ProofTimeline]]) -> None:
+    if index is not None and pending:
+        index.add_many(pending)
+        pending.clear()
+
+
+def main(argv: list[str] | None = None) -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli",
+        description="Analyze every tactic proof in a directory or Lake project into JSONL timelines.",
+    )
+    parser.add_argument("path", type=Path, help="Lean file, directory or Lake project")
+    parser.add_argument("--out", type=Path, default=Path("timelines.jsonl"), help="JSONL output (appended to, for resuming)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--lean-limit", type=int, default=settings.max_concurrent_analyses,
+                        help="Lean sessions in flight across all workers")
+    parser.add_argument("--per-file", type=int, default=4, help="Proofs of one file analyzed concurrently")
+    parser.add_argument("--timeout", type=float, default=settings.max_request_deadline, help="Seconds allowed per proof")
+    parser.add_argument("--restart", action="store_true", help="Overwrite the output instead of resuming")
+    sys.exit(run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from pathlib import Path
 from typing import Any, Union, Optional
 from pydantic import field_validator
 
@@ -8,12 +9,40 @@ class Settings(BaseSettings):
     
     # Lean4Web API
     lean4web_url: str = "https://live.lean-lang.org"
+    # Additional Lean4Web endpoints to balance across (same formats as cors_origins)
+    lean4web_urls: Union[str, list[str]] = []
+    
+    # Endpoint balancing
+    breaker_failure_threshold: int = 3  # Consecutive failures before an endpoint is taken out
+    breaker_reset_timeout: float = 30.0  # Seconds before a tripped endpoint gets a trial request
+    hedge_requests: bool = False  # Duplicate slow sessions onto a second endpoint
+    hedge_percentile: float = 0.9  # Latency percentile after which a hedge is sent
+    
+    # Warm header documents
+    warm_header_slots: int = 4  # Headers kept pre-elaborated (0 disables)
+    warm_header_min_uses: float = 2.0  # Decayed use count before a header is warmed
+    warm_header_half_life: float = 600.0  # Seconds for a header's use count to halve
+    warm_header_timeout: float = 120.0  # Time allowed to elaborate a header when warming
+    
+    # Upstream message limits (per analysis)
+    lean_max_message_bytes: int = 4 * 1024 * 1024  # Largest single WebSocket message accepted from Lean
+    lean_max_session_bytes: int = 32 * 1024 * 1024  # Total bytes received per analysis
+    lean_max_session_messages: int = 20000  # Total messages received per analysis
+    lean_max_diagnostics: int = 200  # Diagnostics kept per analysis (errors first)
+    lean_max_diagnostic_chars: int = 4000  # Longer diagnostic messages are cut
+    lean_ws_compression: bool = True  # Offer permessage-deflate to Lean servers
+    lean_interactive_goals: bool = True  # Structured goals over Lean's RPC (getInteractiveGoals) instead of plainGoal
+    
+    # Record/replay of Lean sessions (for offline benchmarking)
+    lean_record_dir: Optional[str] = None  # Write a trace of every analysis here
+    lean_replay_dir: Optional[str] = None  # Answer from recorded traces instead of contacting Lean
+    lean_replay_speed: float = 1.0  # 1 = recorded timing, 10 = ten times faster, 0 = no delays
     
     # CORS
     # Allow string (for comma-separated env vars) or list
     cors_origins: Union[str, list[str]] = ["http://localhost:5173", "http://127.0.0.1:5173", "*"]
     
-    @field_validator("cors_origins", mode="after")
+    @field_validator("cors_origins", "lean4web_urls", mode="after")
     @classmethod
     def parse_cors_origins(cls, v: Any) -> list[str]:
         if isinstance(v, str):
@@ -28,9 +57,72 @@ class Settings(BaseSettings):
             return [origin.strip() for origin in v.split(",") if origin.strip()]
         return v
     
+    @property
+    def lean_endpoints(self) -> list[str]:
+        """All configured Lean4Web base URLs, primary first."""
+        urls = [self.lean4web_url, *self.lean4web_urls]
+        return list(dict.fromkeys(url.rstrip("/") for url in urls if url))
+    
     # App
     debug: bool = True
     
+    # Admission control
+    max_concurrent_analyses: int = 8  # Concurrent upstream Lean sessions
+    max_queued_analyses: int = 64  # Requests allowed to wait for a slot
+    request_deadline: float = 30.0  # Default end-to-end budget for one analysis (seconds)
+    max_request_deadline: float = 120.0  # Upper bound for deadlines requested by callers
+    post_processing_reserve: float = 1.0  # Part of the deadline kept back from Lean for building the timeline
+    # Identify clients by the last X-Forwarded-For hop. Only enable behind a proxy that
+    # appends it (render.yaml does); otherwise clients could pick their own key
+    admission_trust_proxy: bool = False
+    
+    # Startup pre-warm (see services/readiness.py)
+    startup_prewarm: bool = True  # Open a session to every Lean endpoint in the background on startup
+    prewarm_timeout: float = 60.0  # Seconds before the pre-warm gives up
+    # Headers opened as warm documents on startup, e.g. ["import Mathlib"]. The
+    # default "" is the header of sources without imports; [] opens none
+    prewarm_headers: list[str] = [""]
+    
+    # Per-request resource limits (0 disables; see services/limits.py)
+    max_source_bytes: int = 256 * 1024  # Larger sources are rejected with 413
+    max_tactic_steps: int = 2000  # Steps past this are left out of the timeline
+    max_goals_per_state: int = 64
+    max_hypotheses_per_state: int = 256
+    max_response_bytes: int = 16 * 1024 * 1024  # Estimated timeline size after which steps are left out
+    max_analysis_cpu_seconds: float = 10.0  # CPU time for building the steps before the analysis is stopped
+    
+    # Event loop health (see services/event_loop.py)
+    loop_monitor_interval: float = 0.1  # Seconds between lag probes (0 disables the monitor)
+    slow_callback_seconds: float = 0.25  # Log the loop thread's stack when it is blocked this long (0 disables)
+    offload_min_bytes: int = 256 * 1024  # Input size from which CPU-heavy stages leave the event loop (0 disables)
+    offload_workers: int = 2  # Threads for offloaded stages
+    
+    # Shared result store (SQLite, shared by all workers on a host)
+    shared_store_path: Optional[str] = None  # Disabled when unset
+    shared_store_max_bytes: int = 512 * 1024 * 1024  # Disk budget; LRU entries are evicted beyond it
+    shared_store_memory_bytes: int = 64 * 1024 * 1024  # SQLite page cache + memory map budget per worker
+    shared_store_lock_ttl: float = 300.0  # Seconds a compute lock outside a request holds; requests hold it until their deadline
+    
+    # Timeline cache (content-addressed GET /api/proof/timeline/{hash})
+    timeline_cache_bytes: int = 32 * 1024 * 1024  # In-memory LRU budget per worker
+    prebuilt_timelines_dir: Optional[str] = str(Path(__file__).resolve().parent.parent / "prebuilt_timelines")
+    
+    # Tactic transition cache (state before + tactic + environment -> state after)
+    transition_cache_entries: int = 50000  # Per worker (0 disables)
+    lean_toolchain: str = ""  # e.g. "leanprover/lean4:v4.9.0 mathlib@abc123"; part of the environment fingerprint
+    lean_toolchain_check_interval: float = 300.0  # Seconds before an endpoint's Lean version is asked for again
+    
+    # Large goal/hypothesis types (expanded via GET /api/proof/term/{hash})
+    term_elision_chars: int = 2000  # Longer types are replaced by a preview (0 disables)
+    term_preview_chars: int = 200
+    term_cache_bytes: int = 16 * 1024 * 1024  # In-memory budget per worker; the shared store keeps the rest
+    
+    # Step search index (SQLite FTS5, shared by all workers on a host)
+    search_index_path: Optional[str] = None  # Disabled when unset
+    
+    # Admin
+    admin_token: Optional[str] = None  # Enables admin-only features such as request profiling
+    
     # AI Integration
     openai_api_key: Optional[str] = None
     openai_model: str = "gpt-4o-mini"
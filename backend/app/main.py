@@ -4,11 +4,53 @@ Lean Proof Visualizer - Backend
 FastAPI application for analyzing Lean 4 proofs.
 """
 
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from .config import get_settings
-from .routers import proof_router
+from .routers import proof_router, search_router
+from .services import get_admission_controller, get_endpoint_pool, get_lean_client
+from .services.event_loop import get_loop_monitor, shutdown_offload_pool
+from .services.explainer import close_llm_client
+from .services.metrics import REGISTRY
+from .services.readiness import get_readiness, run_prewarm
+from .services.result_store import get_result_store
+from .services.search_index import get_search_index
+from .services.timeline_cache import get_timeline_cache
+from .services.terms import get_term_store
+from .services.transitions import get_transition_cache
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Record startup timings, open the search index, start the event loop
+    monitor and pre-warm Lean in the background, so the port opens
+    immediately.
+    """
+    settings = get_settings()
+    readiness = get_readiness()
+    # Opening the index runs its schema; do it here, off the event loop,
+    # rather than in the first request that touches it
+    await asyncio.to_thread(get_search_index)
+    readiness.mark("started")
+    background = []
+    monitor = get_loop_monitor()
+    if monitor is not None:
+        background.append(asyncio.create_task(monitor.run()))
+    if settings.startup_prewarm:
+        background.append(asyncio.create_task(run_prewarm(get_lean_client(), settings.prewarm_timeout, settings.prewarm_headers)))
+    try:
+        yield
+    finally:
+        for task in background:
+            task.cancel()
+        await close_llm_client()
+        shutdown_offload_pool()
 
 
 def create_app() -> FastAPI:
@@ -19,6 +61,7 @@ def create_app() -> FastAPI:
         title="Lean Proof Visualizer API",
         description="Analyze Lean 4 proofs and visualize state evolution",
         version="0.1.0",
+        lifespan=lifespan,
     )
     
     # CORS middleware
@@ -32,21 +75,55 @@ def create_app() -> FastAPI:
     
     # Include routers
     app.include_router(proof_router)
+    app.include_router(search_router)
     
     # Health check
     @app.get("/health")
     async def health():
-        return {"status": "healthy", "service": "lean-visualizer"}
+        warm_headers = get_lean_client().warm_headers
+        store = get_result_store()
+        transitions = get_transition_cache()
+        monitor = get_loop_monitor()
+        return {
+            "status": "healthy",
+            "service": "lean-visualizer",
+            "admission": get_admission_controller().stats(),
+            "lean": get_endpoint_pool().stats(),
+            "event_loop": monitor.stats() if monitor else None,
+            "warm_headers": warm_headers.stats() if warm_headers else None,
+            "result_store": store.stats() if store else None,
+            "timeline_cache": get_timeline_cache().stats(),
+            "terms": get_term_store().stats(),
+            "transitions": transitions.stats() if transitions else None,
+            # SQLite queries; keep them off the event loop
+            "search_index": await asyncio.to_thread(search_index_stats),
+        }
+    
+    def search_index_stats() -> dict | None:
+        search_index = get_search_index()
+        return search_index.stats() if search_index else None
+    
+    @app.get("/ready")
+    async def ready():
+        # Liveness is /health; this says whether Lean has answered yet
+        return get_readiness().stats()
+    
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
     
     @app.get("/")
     async def root():
         return {
             "message": "Lean Proof Visualizer API",
             "docs": "/docs",
-            "health": "/health"
+            "health": "/health",
+            "ready": "/ready",
+            "metrics": "/metrics"
         }
     
     return app
 
 
 app = create_app()
+get_readiness().mark("imported")
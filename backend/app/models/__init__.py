@@ -8,6 +8,15 @@ from .schemas import (
     ProofTimeline,
     AnalyzeRequest,
     AnalyzeResponse,
+    TraceSpan,
+    TraceMessage,
+    StepTiming,
+    ProfileTrace,
+    SearchHit,
+    SearchResponse,
+    TacticKindStats,
+    TacticStatsResponse,
+    TermResponse,
 )
 
 __all__ = [
@@ -19,4 +28,13 @@ __all__ = [
     "ProofTimeline",
     "AnalyzeRequest",
     "AnalyzeResponse",
+    "TraceSpan",
+    "TraceMessage",
+    "StepTiming",
+    "ProfileTrace",
+    "SearchHit",
+    "SearchResponse",
+    "TacticKindStats",
+    "TacticStatsResponse",
+    "TermResponse",
 ]
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class Hypothesis(BaseModel):
@@ -6,6 +6,7 @@ class Hypothesis(BaseModel):
     name: str
     type: str
     is_new: bool = False  # For diff highlighting
+    term: str | None = None  # Hash of the full type when `type` is an elided preview
 
 
 class Goal(BaseModel):
@@ -13,6 +14,10 @@ class Goal(BaseModel):
     id: str
     type: str
     is_new: bool = False
+    term: str | None = None  # Hash of the full type when `type` is an elided preview
+    user_name: str | None = None  # Case tag, e.g. `succ` after `induction`
+    mvar_id: str | None = None  # Lean's metavariable; unchanged while no tactic acts on the goal
+    hypotheses: list[Hypothesis] | None = None  # The goal's own context, when it differs from the state's
 
 
 class ProofState(BaseModel):
@@ -40,6 +45,9 @@ class TacticStep(BaseModel):
     state_after: ProofState
     diff: StateDiff
     explanation: str = ""
+    error: str | None = None  # Lean error reported on this step's line
+    elab_ms: float | None = None  # Estimated from Lean's progress reports; None when they don't separate this step
+    simulated: bool = False  # States guessed by the local simulator rather than reported by Lean
 
 
 class ProofTimeline(BaseModel):
@@ -48,14 +56,95 @@ class ProofTimeline(BaseModel):
     source_code: str
     success: bool
     error: str | None = None
+    elaboration_ms: float | None = None  # Lean's time to elaborate the document
+    slowest_steps: list[int] = []  # Indices of the steps with the highest elab_ms, slowest first
+    provisional: bool = False  # Preview built without Lean, to be replaced by the real timeline
+    truncated: list[str] = []  # Limits that cut the timeline short (steps, goals, hypotheses, response_bytes, cpu)
+
+
+class TraceSpan(BaseModel):
+    """A timed phase of a profiled request."""
+    name: str
+    start_ms: float  # Relative to the start of the request
+    duration_ms: float
+
+
+class TraceMessage(BaseModel):
+    """A JSON-RPC message exchanged with the Lean server."""
+    direction: str  # "send" or "recv"
+    method: str | None = None
+    id: int | str | None = None
+    at_ms: float
+    bytes: int
+    latency_ms: float | None = None  # For responses: time since the matching request
+
+
+class StepTiming(BaseModel):
+    """Processing cost of one timeline step."""
+    index: int
+    parse_ms: float
+    diff_ms: float
+    explain_ms: float
+
+
+class ProfileTrace(BaseModel):
+    """Timing breakdown of a single analysis request."""
+    total_ms: float
+    spans: list[TraceSpan] = []
+    messages: list[TraceMessage] = []
+    steps: list[StepTiming] = []
+    flamegraph: str | None = None  # Folded stacks ("a;b;c count" per line)
 
 
 class AnalyzeRequest(BaseModel):
     """Request to analyze Lean code."""
     code: str
+    timeout: float | None = Field(default=None, ge=2.0)  # Seconds; defaults to the server's request deadline
+    profile: bool = False  # Admin only: attach a timing trace
+    flamegraph: bool = False  # Admin only: also sample the event loop thread
+
+
+class SearchHit(BaseModel):
+    """A timeline step matching a search query."""
+    timeline_key: str  # Source hash; GET /api/proof/timeline/{key} returns the timeline
+    label: str | None = None  # Declaration the step belongs to, when known
+    step_index: int
+    line: int
+    tactic: str
+    goal: str | None = None  # First goal the tactic was applied to
+    error: str | None = None
+    score: float
+
+
+class TermResponse(BaseModel):
+    """Full text of an elided goal or hypothesis type."""
+    hash: str
+    text: str
+
+
+class TacticKindStats(BaseModel):
+    """Elaboration time of one kind of tactic (`simp`, `omega`, ...) across indexed timelines."""
+    kind: str
+    count: int  # Steps with a time estimate
+    mean_ms: float
+    max_ms: float
+    total_ms: float
+
+
+class TacticStatsResponse(BaseModel):
+    """Tactic kinds by total elaboration time."""
+    kinds: list[TacticKindStats]
+
+
+class SearchResponse(BaseModel):
+    """Ranked steps matching a search query."""
+    query: str
+    hits: list[SearchHit]
+    took_ms: float
 
 
 class AnalyzeResponse(BaseModel):
     """Response from proof analysis."""
     timeline: ProofTimeline | None = None
     error: str | None = None
+    profile: ProfileTrace | None = None
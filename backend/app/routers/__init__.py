@@ -1,4 +1,5 @@
 # Routers package
 from .proof import router as proof_router
+from .search import router as search_router
 
-__all__ = ["proof_router"]
+__all__ = ["proof_router", "search_router"]
@@ -4,8 +4,20 @@ Proof Analysis Router
 API endpoints for analyzing Lean proofs.
 """
 
-from fastapi import APIRouter
+import asyncio
+import hashlib
+import hmac
+import json
+import math
+import re
+import time
+from bisect import bisect_left, bisect_right
+from typing import AsyncIterator, Awaitable
 
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+
+from ..config import get_settings
 from ..models import (
     AnalyzeRequest,
     AnalyzeResponse,
@@ -15,6 +27,7 @@ from ..models import (
     Goal,
     Hypothesis,
     StateDiff,
+    TermResponse,
 )
 from ..services import (
     get_lean_client,
@@ -22,90 +35,542 @@ from ..services import (
     compute_diff,
     parse_goal_state,
     explain_tactic,
+    explain_step,
+    get_admission_controller,
+    client_key,
+    AdmissionRejected,
+)
+from ..services.metrics import (
+    ANALYSIS_PHASE_SECONDS,
+    ANALYSIS_STEPS,
+    ANALYSIS_CANCELLATIONS,
+    ANALYSES_IN_FLIGHT,
+    REQUEST_BYTES,
+    RESPONSE_BYTES,
 )
+from ..services.profiling import RequestTrace, StackSampler, current_trace, phase, tracing
+from ..services.deadline import Deadline, current_deadline, deadline_scope
+from ..services.result_store import source_hash
+from ..services.timeline_cache import get_timeline_cache, is_timeline_hash
+from ..services.search_index import get_search_index
+from ..services.event_loop import offload
+from ..services.limits import AnalysisBudget, SourceTooLarge, check_source, response_bytes
+from ..services.terms import TermTable, get_term_store
+from ..services.transitions import TRANSITION_INVALIDATIONS, TransitionCache, get_transition_cache
 
 
 router = APIRouter(prefix="/api/proof", tags=["proof"])
 
+# How often a running analysis checks whether the HTTP client went away
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# A timeline hash always names the same source, so its response never changes
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Steps listed in a timeline's slowest_steps
+SLOWEST_STEPS = 5
+
+# Building steps only awaits when it needs I/O; give the event loop a turn
+# at least this often so long timelines don't hold it
+YIELD_EVERY_STEPS = 50
+
+
+class ClientDisconnected(Exception):
+    """The HTTP client closed the connection before the analysis finished."""
+
 
 @router.post("/analyze", response_model=AnalyzeResponse)
-async def analyze_proof(request: AnalyzeRequest):
+async def analyze_proof(request: AnalyzeRequest, http_request: Request):
     """
     Analyze Lean code and return the proof timeline.
     
     Connects to Lean4Web via WebSocket to get real proof states.
+    Requests beyond the concurrency cap are queued per client and rejected
+    with 429 when they could not start before the request deadline.
+    
+    The deadline (`timeout`, or the configured default) covers queueing,
+    the Lean session and explanation; the analysis is cancelled when it
+    passes or when the client disconnects.
+    
+    Admins (X-Admin-Token) may set `profile` to get a timing trace back
+    with the timeline, and `flamegraph` to also sample the event loop.
+    
+    Sources over the configured size are rejected with 413; other limits
+    truncate the timeline (see `ProofTimeline.truncated`).
+    """
+    reject_oversized(request.code)
+    trace = None
+    if request.profile or request.flamegraph:
+        require_admin(http_request)
+        trace = RequestTrace()
+    
+    settings = get_settings()
+    deadline = Deadline(min(request.timeout or settings.request_deadline, settings.max_request_deadline))
+    
+    controller = get_admission_controller()
+    client_id = client_key(http_request.headers, http_request.client.host if http_request.client else None)
+    REQUEST_BYTES.observe(len(request.code.encode()))
+    
+    try:
+        async with controller.admit(client_id, deadline=deadline.remaining()):
+            with ANALYSES_IN_FLIGHT.track(), deadline_scope(deadline):
+                if trace is None:
+                    analysis = run_analysis(request.code)
+                else:
+                    analysis = run_profiled(request.code, trace, request.flamegraph)
+                response = await run_with_deadline(analysis, http_request, deadline)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=e.reason,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except ClientDisconnected:
+        # Nobody is listening; 499 only shows up in our own logs
+        return Response(status_code=499)
+    
+    with phase(ANALYSIS_PHASE_SECONDS, "serialize"):
+        body = await offload("serialize", response_bytes(response), response.model_dump_json)
+    RESPONSE_BYTES.observe(len(body))
+    return Response(content=body, media_type="application/json")
+
+
+@router.post("/analyze/stream")
+async def analyze_proof_stream(request: AnalyzeRequest, http_request: Request):
+    """
+    Analyze Lean code in two phases, as newline-delimited JSON events.
+    
+    1. `{"event": "preview", "timeline": ...}`: an approximate timeline
+       from the local tactic simulator, sent at once; it is marked
+       `provisional` and its steps `simulated`.
+    2. `{"event": "step", "step": ...}` for each step of the Lean-backed
+       timeline, replacing the preview step with the same index.
+    3. `{"event": "final", "response": ...}`: the AnalyzeResponse without
+       its steps (already sent), or with the error.
+    
+    The preview is skipped when the timeline is already cached. Queueing,
+    deadline and cancellation work as in `/analyze`; a request rejected by
+    admission control gets a final event with the error and `retry_after`.
+    """
+    if request.profile or request.flamegraph:
+        raise HTTPException(status_code=400, detail="Profiling is only available on /api/proof/analyze")
+    reject_oversized(request.code)
+    
+    settings = get_settings()
+    deadline = Deadline(min(request.timeout or settings.request_deadline, settings.max_request_deadline))
+    controller = get_admission_controller()
+    client_id = client_key(http_request.headers, http_request.client.host if http_request.client else None)
+    REQUEST_BYTES.observe(len(request.code.encode()))
+    code = request.code
+    
+    async def events() -> AsyncIterator[bytes]:
+        if await get_timeline_cache().get(source_hash(code)) is None:
+            preview = await build_preview(code)
+            yield stream_event("preview", timeline=preview.model_dump(mode="json"))
+        
+        retry_after = None
+        try:
+            async with controller.admit(client_id, deadline=deadline.remaining()):
+                with ANALYSES_IN_FLIGHT.track(), deadline_scope(deadline):
+                    response = await run_with_deadline(run_analysis(code), http_request, deadline)
+        except AdmissionRejected as e:
+            response = AnalyzeResponse(error=e.reason)
+            retry_after = e.retry_after
+        except ClientDisconnected:
+            return
+        
+        if response.timeline is not None:
+            for step in response.timeline.steps:
+                yield stream_event("step", step=step.model_dump(mode="json"))
+        final = response.model_dump(mode="json", exclude={"timeline": {"steps"}})
+        yield stream_event("final", response=final, retry_after=retry_after)
+    
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+
+
+def reject_oversized(code: str) -> None:
+    """Answer 413 before doing any work when the source is over the size limit."""
+    try:
+        check_source(code)
+    except SourceTooLarge as e:
+        raise HTTPException(status_code=413, detail=e.detail())
+
+
+def stream_event(event: str, **fields) -> bytes:
+    """One line of the streaming analysis response."""
+    line = json.dumps({"event": event, **fields}, ensure_ascii=False).encode() + b"\n"
+    RESPONSE_BYTES.observe(len(line))
+    return line
+
+
+async def run_with_deadline(
+    analysis: Awaitable[AnalyzeResponse],
+    http_request: Request,
+    deadline: Deadline,
+) -> AnalyzeResponse:
+    """
+    Await an analysis, cancelling it (and its upstream Lean session) when
+    the deadline passes or the HTTP client disconnects.
+    """
+    task = asyncio.ensure_future(analysis)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=min(DISCONNECT_POLL_INTERVAL, deadline.remaining()))
+            if done:
+                return task.result()
+            if deadline.expired:
+                ANALYSIS_CANCELLATIONS.inc(reason="deadline")
+                return AnalyzeResponse(error=f"Analysis did not finish within {deadline.seconds:g}s")
+            if await http_request.is_disconnected():
+                ANALYSIS_CANCELLATIONS.inc(reason="disconnect")
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+@router.get("/timeline/{timeline_hash}", response_model=AnalyzeResponse)
+async def get_timeline(timeline_hash: str, http_request: Request):
+    """
+    Return a finished timeline by the content hash of its source.
+    
+    The hash is the `source_hash` of the code (SHA-256 over the pipeline
+    version and the source). Only timelines that have already been built,
+    or were prebuilt for the bundled examples, are served; this never
+    starts a Lean session. Responses are immutable and carry a strong ETag,
+    so browsers and CDNs can cache them and revalidate with If-None-Match.
+    """
+    body = await get_timeline_cache().get(timeline_hash) if is_timeline_hash(timeline_hash) else None
+    if body is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Timeline not found; analyze the code first",
+            headers={"Cache-Control": "no-store"},
+        )
+    
+    etag = f'"{hashlib.sha256(body).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if etag_matches(http_request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    RESPONSE_BYTES.observe(len(body))
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/term/{term_hash}", response_model=TermResponse)
+async def get_term(term_hash: str, http_request: Request):
+    """
+    Return the full text of an elided goal or hypothesis type.
+    
+    Types longer than the configured threshold appear in timelines as a
+    preview with a `term` hash; this expands them. The hash is of the text
+    itself, so responses are immutable.
+    """
+    text = await get_term_store().get(term_hash) if is_timeline_hash(term_hash) else None
+    if text is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Term not found; analyze the code again",
+            headers={"Cache-Control": "no-store"},
+        )
+    
+    etag = f'"{term_hash}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if etag_matches(http_request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    body = TermResponse(hash=term_hash, text=text).model_dump_json().encode()
+    RESPONSE_BYTES.observe(len(body))
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether an If-None-Match header matches `etag` (weak comparison)."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def require_admin(http_request: Request) -> None:
+    """Reject the request unless it carries the configured admin token."""
+    token = get_settings().admin_token
+    supplied = http_request.headers.get("x-admin-token", "")
+    if not token or not hmac.compare_digest(supplied, token):
+        raise HTTPException(status_code=403, detail="Profiling requires a valid X-Admin-Token")
+
+
+async def run_profiled(code: str, trace: RequestTrace, flamegraph: bool = False) -> AnalyzeResponse:
+    """Run the analysis pipeline with a timing trace attached to the response."""
+    sampler = StackSampler() if flamegraph else None
+    if sampler is not None:
+        sampler.start()
+    try:
+        with tracing(trace):
+            response = await run_analysis(code)
+    finally:
+        if sampler is not None:
+            trace.flamegraph = sampler.stop()
+    response.profile = trace.to_model()
+    return response
+
+
+async def run_analysis(code: str) -> AnalyzeResponse:
+    """
+    Run the full analysis pipeline for a piece of Lean code.
+    
+    Finished timelines are cached by source hash (see `get_timeline`); with
+    a shared result store configured, each source is analyzed by only one
+    worker at a time.
+    """
+    if current_trace() is not None:
+        response, _ = await build_analysis(code)
+        return response
+    
+    computed: AnalyzeResponse | None = None
+    
+    key = source_hash(code)
+    
+    async def compute() -> bytes | None:
+        nonlocal computed
+        terms = TermTable.from_settings()
+        computed, complete = await build_analysis(code, terms)
+        if not complete or computed.error:
+            return None
+        await get_timeline_cache().keep_terms(key, terms.terms)
+        index = get_search_index()
+        if index is not None:
+            index.add_later(key, declaration_name(code), computed.timeline)
+        body = await offload("serialize", response_bytes(computed), computed.model_dump_json)
+        return body.encode()
+    
+    stored = await get_timeline_cache().compute_once(key, compute)
+    if computed is not None:
+        return computed
+    if stored is None:
+        # Another request computed an incomplete result that was not stored
+        response, _ = await build_analysis(code)
+        return response
+    return await offload("deserialize", len(stored), AnalyzeResponse.model_validate_json, stored)
+
+
+async def build_preview(code: str) -> ProofTimeline:
+    """
+    Approximate timeline from the local tactic simulator, without Lean.
+    
+    Takes microseconds per step; explanations use the local rules only.
+    Long terms are elided as in `build_analysis`.
+    """
+    budget = AnalysisBudget.from_settings()
+    terms = TermTable.from_settings()
+    positions = budget.clip_steps(extract_tactic_positions(code))
+    # The simulator works on the unelided states
+    full_state = ProofState(goals=[Goal(id="1", type=extract_goal_from_code(code))], hypotheses=[])
+    state = terms.elide_state(full_state)
+    steps = []
+    for i, pos in enumerate(positions):
+        with budget.cpu():
+            full_after = simulate_tactic_effect(pos.tactic, full_state, i)
+            after = mark_new_items(state, terms.elide_state(budget.clip_state(full_after)))
+        step = TacticStep(
+            index=i,
+            tactic=pos.tactic,
+            line=pos.line,
+            column=pos.column,
+            state_before=state,
+            state_after=after,
+            diff=compute_diff(state, after),
+            explanation=await explain_tactic(pos.tactic, before=state, after=after, llm=False),
+            simulated=True,
+        )
+        if not budget.admit(step):
+            break
+        steps.append(step)
+        state = after
+        full_state = full_after
+    await get_term_store().save(terms.terms)
+    return ProofTimeline(
+        steps=steps, source_code=code, success=False, provisional=True, truncated=budget.truncated,
+    )
+
+
+async def build_analysis(code: str, terms: TermTable | None = None) -> tuple[AnalyzeResponse, bool]:
+    """
+    Build the timeline for a piece of Lean code.
+    
+    Also returns whether the Lean session ran to completion, i.e. whether
+    the result is worth keeping.
+    
+    Steps whose transitions are in the transition cache are not queried
+    from Lean; their states come from the cache. If Lean turns out to run
+    on a different toolchain than the one they were cached under, their
+    goals are queried after all. The cache keeps Lean's
+    states as they are, before the budget clips them and long terms are
+    elided, so what a later request gets from it doesn't depend on this
+    one's limits or term table.
+    
+    The per-request limits of an AnalysisBudget apply; a timeline the CPU
+    limit cut short is not reported as complete, so it isn't kept; nor is
+    one where the deadline left no time to ask the LLM for an explanation.
+    
+    Long terms are elided into `terms` (a fresh table if not given), which
+    is saved to the term store.
     """
     try:
         client = get_lean_client()
+        budget = AnalysisBudget.from_settings()
+        
+        # Extract tactic positions and the initial goal from the code
+        with phase(ANALYSIS_PHASE_SECONDS, "parse"):
+            all_positions = extract_tactic_positions(code)
+            positions = budget.clip_steps(all_positions)
+            if terms is None:
+                terms = TermTable.from_settings()
+            initial_lean_state = ProofState(
+                goals=[Goal(id="1", type=extract_goal_from_code(code), is_new=False)],
+                hypotheses=[]
+            )
+            initial_state = terms.elide_state(initial_lean_state)
         
-        # Get real analysis from Lean4Web
-        lean_result = await client.analyze_code(request.code)
+        # Cached transitions are only looked up while every endpoint is on the same toolchain
+        transitions = get_transition_cache()
+        environment = None
+        if transitions is not None:
+            environment = transitions.environment(code, client.pool.toolchain())
+        statement = extract_statement(code)
+        cached_states = {}
+        if environment is not None:
+            cached_states = await cached_transitions(transitions, environment, statement, positions, initial_lean_state)
         
-        # Extract tactic positions from the code
-        positions = extract_tactic_positions(request.code)
+        # Get real analysis from Lean4Web, keeping some of the deadline
+        # back for building the timeline
+        deadline = current_deadline()
+        if deadline is not None:
+            deadline = deadline.reserve(min(get_settings().post_processing_reserve, deadline.seconds * 0.2))
+        with phase(ANALYSIS_PHASE_SECONDS, "lean"):
+            # Goals of cached steps and of steps past the limit aren't needed
+            clipped_lines = [pos.line - 1 for pos in all_positions[len(positions):]]
+            known_lines = frozenset([positions[i].line - 1 for i in cached_states] + clipped_lines)
+            lean_result = await client.analyze_code(code, deadline=deadline, known_lines=known_lines)
+            
+            if transitions is not None:
+                session_environment = transitions.environment(code, lean_result.get("toolchain"))
+                if cached_states and session_environment != environment:
+                    # Lean ran on another toolchain: the cached states may be
+                    # stale, and their goals weren't queried
+                    TRANSITION_INVALIDATIONS.inc()
+                    cached_states = {}
+                    lean_result = await client.analyze_code(
+                        code, deadline=deadline, known_lines=frozenset(clipped_lines)
+                    )
+                    session_environment = transitions.environment(code, lean_result.get("toolchain"))
+                environment = session_environment
+        
+        with phase(ANALYSIS_PHASE_SECONDS, "parse"):
+            # Map goals from Lean to positions
+            goal_map = {}
+            for goal_info in lean_result.get("goals", []):
+                line = goal_info.get("line", 0)
+                goal_map[line] = goal_info
+            
+            step_errors = map_errors_to_steps(positions, lean_result.get("diagnostics", []))
+            progress = lean_result.get("progress", [])
+            step_times = map_progress_to_steps(positions, progress)
+            
+            # Build Lean's goal states, off the event loop when they are large
+            step_lines = {pos.line for pos in positions}
+            goal_infos = {
+                line: info for line, info in goal_map.items()
+                if line in step_lines and (info.get("structured") is not None or info.get("rendered"))
+            }
+            size = sum(len(info.get("rendered") or "") for info in goal_infos.values())
+            lean_states = await offload("goals", size, lean_goal_states, goal_infos, budget)
         
         if not positions:
             return AnalyzeResponse(
                 timeline=ProofTimeline(
                     steps=[],
-                    source_code=request.code,
+                    source_code=code,
                     success=lean_result["success"],
                     error="No tactics found in code. Make sure you're using tactic mode (`:= by`)."
                 )
-            )
+            ), lean_result.get("complete", False)
         
         # Build timeline steps from Lean's response
         steps = []
         
-        # Parse the theorem signature to get initial goal
-        initial_goal = extract_goal_from_code(request.code)
-        
-        # Map goals from Lean to positions
-        goal_map = {}
-        for goal_info in lean_result.get("goals", []):
-            line = goal_info.get("line", 0)
-            goal_map[line] = goal_info
+        build_seconds = 0.0
+        explain_seconds = 0.0
+        rushed = False
+        trace = current_trace()
         
-        current_state = ProofState(
-            goals=[Goal(id="1", type=initial_goal, is_new=False)],
-            hypotheses=[]
-        )
+        current_state = initial_state
+        # The same state unclipped and unelided, for the transition cache
+        lean_state = initial_lean_state
         
         for i, pos in enumerate(positions):
+            if i and i % YIELD_EVERY_STEPS == 0:
+                await asyncio.sleep(0)
+            step_started = time.perf_counter()
             state_before = current_state
+            transition_key = None
+            if environment is not None:
+                transition_key = transitions.key(environment, lean_state, pos.tactic, statement if i == 0 else "")
             
             # Try to get real goal state from Lean
             goal_info = goal_map.get(pos.line)
+            source = "lean"
             
-            if goal_info and goal_info.get("rendered"):
-                # Parse the rendered goal state
-                rendered = goal_info["rendered"]
-                hypotheses, goals = parse_goal_state(rendered)
-                
-                state_after = ProofState(
-                    goals=[Goal(id=str(j+1), type=g, is_new=False) for j, g in enumerate(goals)],
-                    hypotheses=[parse_hypothesis(h) for h in hypotheses]
-                )
+            if pos.line in lean_states:
+                lean_after = lean_states[pos.line]
             elif goal_info and goal_info.get("goals"):
                 # Use goals array directly
                 goals_list = goal_info["goals"]
-                state_after = ProofState(
+                lean_after = ProofState(
                     goals=[Goal(id=str(j+1), type=str(g), is_new=False) for j, g in enumerate(goals_list)],
-                    hypotheses=list(state_before.hypotheses)
+                    hypotheses=list(lean_state.hypotheses)
                 )
+            elif i in cached_states:
+                lean_after = cached_states[i]
+                source = "cache"
+            elif transition_key is not None and (cached := await transitions.get(transition_key)) is not None:
+                lean_after = cached
+                source = "cache"
             else:
                 # Fallback: simulate based on tactic
-                state_after = simulate_tactic_effect(pos.tactic, state_before, i)
+                lean_after = simulate_tactic_effect(pos.tactic, lean_state, i)
+                source = "simulated"
+            ANALYSIS_STEPS.inc(source=source)
+            if source == "lean" and transition_key is not None and i not in step_errors:
+                await transitions.put(transition_key, lean_after)
+            with budget.cpu():
+                state_after = terms.elide_state(budget.clip_state(lean_after))
             
-            # Mark new items
-            state_after = mark_new_items(state_before, state_after)
-            
-            # Compute diff
-            diff = compute_diff(state_before, state_after)
+            diff_started = time.perf_counter()
+            with budget.cpu():
+                # Mark new items
+                state_after = mark_new_items(state_before, state_after)
+                
+                # Compute diff
+                diff = compute_diff(state_before, state_after)
             
-            explanation = explain_tactic(pos.tactic, before=state_before, after=state_after)
+            explain_started = time.perf_counter()
+            explanation, best = await explain_step(pos.tactic, before=state_before, after=state_after)
+            rushed = rushed or not best
+            explain_ended = time.perf_counter()
+            explain_seconds += explain_ended - explain_started
+            build_seconds += explain_started - step_started
+            if trace is not None:
+                trace.add_step(
+                    i,
+                    parse_seconds=diff_started - step_started,
+                    diff_seconds=explain_started - diff_started,
+                    explain_seconds=explain_ended - explain_started,
+                )
             
-            steps.append(TacticStep(
+            step = TacticStep(
                 index=i,
                 tactic=pos.tactic,
                 line=pos.line,
@@ -113,10 +578,21 @@ async def analyze_proof(request: AnalyzeRequest):
                 state_before=state_before,
                 state_after=state_after,
                 diff=diff,
-                explanation=explanation
-            ))
+                explanation=explanation,
+                error=step_errors.get(i),
+                elab_ms=step_times.get(i),
+                simulated=source == "simulated",
+            )
+            if not budget.admit(step):
+                break
+            steps.append(step)
             
             current_state = state_after
+            lean_state = lean_after
+        
+        ANALYSIS_PHASE_SECONDS.observe(build_seconds, phase="steps")
+        ANALYSIS_PHASE_SECONDS.observe(explain_seconds, phase="explain")
+        await get_term_store().save(terms.terms)
         
         # Get error messages from diagnostics
         error_msgs = [
@@ -128,16 +604,157 @@ async def analyze_proof(request: AnalyzeRequest):
         return AnalyzeResponse(
             timeline=ProofTimeline(
                 steps=steps,
-                source_code=request.code,
+                source_code=code,
                 success=lean_result["success"],
-                error="; ".join(error_msgs) if error_msgs else None
+                error="; ".join(error_msgs) if error_msgs else None,
+                elaboration_ms=round(progress[-1][0] * 1000, 1) if progress and progress[-1][1] is None else None,
+                slowest_steps=sorted(
+                    (i for i in step_times if i < len(steps)), key=step_times.get, reverse=True
+                )[:SLOWEST_STEPS],
+                truncated=budget.truncated,
             )
-        )
+        ), lean_result.get("complete", False) and not budget.aborted and not rushed
         
     except Exception as e:
         return AnalyzeResponse(
             error=f"Analysis failed: {str(e)}"
-        )
+        ), False
+
+
+def lean_goal_states(goal_infos: dict[int, dict], budget: AnalysisBudget) -> dict[int, ProofState]:
+    """
+    Proof states from Lean's goals, by line: built directly from
+    interactive goals, or parsed from the rendered text of plain ones.
+    Doesn't touch the event loop.
+    """
+    states = {}
+    with budget.cpu():
+        for line, info in goal_infos.items():
+            structured = info.get("structured")
+            if structured is not None:
+                states[line] = structured_state(structured)
+                continue
+            hypotheses, goals = parse_goal_state(info["rendered"])
+            states[line] = ProofState(
+                goals=[Goal(id=str(j+1), type=g, is_new=False) for j, g in enumerate(goals)],
+                hypotheses=[parse_hypothesis(h) for h in hypotheses]
+            )
+    return states
+
+
+def structured_state(goals: list[dict]) -> ProofState:
+    """
+    ProofState from interactive goals. The state's hypotheses are the
+    first goal's context; other goals carry theirs only when it differs.
+    """
+    main_context = goals[0]["hyps"] if goals else []
+    return ProofState(
+        goals=[
+            Goal(
+                id=str(j+1),
+                type=g["type"],
+                user_name=g["user_name"],
+                mvar_id=g["mvar_id"],
+                hypotheses=context_hypotheses(g["hyps"]) if g["hyps"] != main_context else None,
+            )
+            for j, g in enumerate(goals)
+        ],
+        hypotheses=context_hypotheses(main_context),
+    )
+
+
+def context_hypotheses(hyps: list[dict]) -> list[Hypothesis]:
+    """One Hypothesis per name of each (possibly grouped) interactive hypothesis."""
+    return [
+        Hypothesis(name=name, type=f"{h['type']} := {h['value']}" if h["value"] else h["type"])
+        for h in hyps
+        for name in h["names"]
+    ]
+
+
+async def cached_transitions(
+    transitions: TransitionCache,
+    environment: str,
+    statement: str,
+    positions: list,
+    initial_state: ProofState,
+) -> dict[int, ProofState]:
+    """
+    States after the leading steps whose transitions are all cached, by
+    step index. Following the chain stops at the first miss, since the
+    states after it are unknown.
+    """
+    states = {}
+    state = initial_state
+    for i, pos in enumerate(positions):
+        after = await transitions.get(transitions.key(environment, state, pos.tactic, statement if i == 0 else ""))
+        if after is None:
+            break
+        states[i] = state = after
+    return states
+
+
+def map_errors_to_steps(positions: list, diagnostics: list[dict]) -> dict[int, str]:
+    """
+    Attach Lean errors to the steps they were reported in.
+    
+    An error belongs to the last tactic starting at or before its line
+    (tactics can span several lines); errors before the first tactic,
+    such as unsolved goals reported on the declaration, belong to none.
+    """
+    step_errors: dict[int, list[str]] = {}
+    lines = [pos.line for pos in positions]
+    for diag in diagnostics:
+        if diag.get("severity") != 1 or "range" not in diag:
+            continue
+        line = diag["range"]["start"]["line"] + 1  # LSP lines are 0-indexed
+        index = bisect_right(lines, line) - 1
+        if index >= 0:
+            step_errors.setdefault(index, []).append(diag.get("message", "Unknown error"))
+    return {i: "; ".join(msgs) for i, msgs in step_errors.items()}
+
+
+def map_progress_to_steps(positions: list, progress: list[list]) -> dict[int, float]:
+    """
+    Estimate each step's elaboration time (ms) from Lean's progress reports.
+    
+    `progress` holds `[seconds, first line still processing]` pairs (0-indexed
+    line, None once done). A step is finished once processing has moved past
+    the line before the next step (the last one when the document is done),
+    and starts when the previous step finished. Steps that finish in the
+    same report can't be told apart and get no estimate; neither does the
+    first step unless a report shows its start.
+    """
+    if not progress:
+        return {}
+    times = [t for t, _ in progress]
+    # Furthest line reached so far, for bisecting
+    reached = []
+    for _, line in progress:
+        reached.append(max(reached[-1] if reached else -1, math.inf if line is None else line))
+    
+    def finished_at(line: float) -> int | None:
+        """Index of the first report with every line before `line` (1-indexed) done."""
+        index = bisect_left(reached, line - 1)
+        return index if index < len(reached) else None
+    
+    ends = [
+        finished_at(positions[i + 1].line if i + 1 < len(positions) else math.inf)
+        for i in range(len(positions))
+    ]
+    first_start = finished_at(positions[0].line) if positions else None
+    if first_start is not None and reached[first_start] == math.inf:
+        first_start = None  # Only the final report; the start is unknown
+    
+    step_times = {}
+    for i, end in enumerate(ends):
+        start = ends[i - 1] if i > 0 else first_start
+        if end is None or start is None or end == start:
+            continue
+        if i + 1 < len(ends) and ends[i + 1] == end:
+            continue
+        step_times[i] = round((times[end] - times[start]) * 1000, 1)
+    return step_times
 
 
 def parse_hypothesis(hyp_str: str) -> Hypothesis:
@@ -151,32 +768,41 @@ def parse_hypothesis(hyp_str: str) -> Hypothesis:
 def mark_new_items(before: ProofState, after: ProofState) -> ProofState:
     """Mark items that are new in the 'after' state."""
     before_hyp_names = {h.name for h in before.hypotheses}
-    before_goal_types = {g.type for g in before.goals}
+    # Elided types compare by the hash of their full text
+    before_goal_types = {g.term or g.type for g in before.goals}
+    # A goal whose metavariable is still there wasn't touched
+    before_mvars = {g.mvar_id for g in before.goals if g.mvar_id}
     
     marked_hypotheses = [
-        Hypothesis(
-            name=h.name,
-            type=h.type,
-            is_new=(h.name not in before_hyp_names)
-        )
+        h.model_copy(update={"is_new": h.name not in before_hyp_names})
         for h in after.hypotheses
     ]
     
     marked_goals = [
-        Goal(
-            id=g.id,
-            type=g.type,
-            is_new=(g.type not in before_goal_types)
-        )
+        g.model_copy(update={
+            "is_new": g.mvar_id not in before_mvars and (g.term or g.type) not in before_goal_types,
+        })
         for g in after.goals
     ]
     
     return ProofState(goals=marked_goals, hypotheses=marked_hypotheses)
 
 
+def declaration_name(code: str) -> str | None:
+    """Name of the first theorem or lemma in the code, if any."""
+    match = re.search(r'\b(?:theorem|lemma)\s+([^\s(:{\[]+)', code)
+    return match.group(1) if match else None
+
+
 def extract_goal_from_code(code: str) -> str:
     """Extract the goal type from theorem signature."""
-    import re
+    # The proof is the first tactic block; its declaration is the last
+    # theorem/lemma/example before it (earlier ones may be stubbed with sorry)
+    by_match = re.search(r':=\s*by', code)
+    if by_match:
+        starts = [m.start() for m in re.finditer(r'\b(?:theorem|lemma|example)\s', code[:by_match.start()])]
+        if starts:
+            code = code[starts[-1]:]
     
     # Look for pattern: theorem/lemma name ... : TYPE := by
     match = re.search(r'(?:theorem|lemma|example)\s+\w*[^:]*:\s*(.+?)\s*:=\s*by', code, re.DOTALL)
@@ -189,6 +815,25 @@ def extract_goal_from_code(code: str) -> str:
     return "(goal)"
 
 
+def extract_statement(code: str) -> str:
+    """
+    Binders and type of the proved declaration, without its name. The
+    initial state is parsed from the type alone, so this tells apart
+    statements whose variables have different types.
+    """
+    by_match = re.search(r':=\s*by', code)
+    if not by_match:
+        return ""
+    keywords = list(re.finditer(r'\b(theorem|lemma|example)\s', code[:by_match.start()]))
+    if not keywords:
+        return ""
+    statement = code[keywords[-1].end():by_match.start()].strip()
+    if keywords[-1].group(1) != "example":
+        parts = statement.split(None, 1)
+        statement = parts[1] if len(parts) > 1 else ""
+    return " ".join(statement.split())
+
+
 def simulate_tactic_effect(tactic: str, state: ProofState, step_index: int) -> ProofState:
     """
     Simulate the effect of a tactic on the proof state.
@@ -0,0 +1,54 @@
+"""
+Search Router
+
+API endpoints for searching analyzed timelines.
+"""
+
+import asyncio
+import time
+
+from fastapi import APIRouter, HTTPException, Query
+
+from ..models import SearchResponse, TacticStatsResponse
+from ..services.search_index import SearchQueryError, get_search_index
+
+
+router = APIRouter(prefix="/api/search", tags=["search"])
+
+
+@router.get("", response_model=SearchResponse)
+async def search_steps(
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(20, ge=1, le=100),
+    failed: bool | None = None,
+):
+    """
+    Search the steps of every analyzed timeline.
+    
+    Terms are ANDed and may be restricted to a field: `tactic:omega`,
+    `goal:Finset.sum`, `hyp:ih`, `error:linarith`. `failed=true` keeps only
+    steps Lean reported an error on (`false` excludes them). Hits are
+    ranked by relevance and reference the timeline by its source hash.
+    """
+    index = get_search_index()
+    if index is None:
+        raise HTTPException(status_code=503, detail="Search index is not configured")
+    
+    started = time.perf_counter()
+    try:
+        hits = await asyncio.to_thread(index.search, q, limit, failed)
+    except SearchQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return SearchResponse(query=q, hits=hits, took_ms=round((time.perf_counter() - started) * 1000, 3))
+
+
+@router.get("/tactic-stats", response_model=TacticStatsResponse)
+async def tactic_stats(limit: int = Query(50, ge=1, le=500)):
+    """
+    Elaboration time per tactic kind (`simp`, `omega`, `decide`, ...) across
+    every indexed timeline, highest total first.
+    """
+    index = get_search_index()
+    if index is None:
+        raise HTTPException(status_code=503, detail="Search index is not configured")
+    return TacticStatsResponse(kinds=await asyncio.to_thread(index.tactic_stats, limit))
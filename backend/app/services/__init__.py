@@ -2,7 +2,9 @@
 from .lean_client import Lean4WebClient, get_lean_client, parse_goal_state
 from .parser import extract_tactic_positions, TacticPosition
 from .differ import compute_diff, mark_new_items
-from .explainer import explain_tactic
+from .explainer import explain_tactic, explain_step
+from .balancer import EndpointPool, LeanEndpoint, NoHealthyEndpoint, get_endpoint_pool
+from .admission import AdmissionController, AdmissionRejected, get_admission_controller, client_key
 
 __all__ = [
     "Lean4WebClient",
@@ -13,4 +15,13 @@ __all__ = [
     "compute_diff",
     "mark_new_items",
     "explain_tactic",
+    "explain_step",
+    "EndpointPool",
+    "LeanEndpoint",
+    "NoHealthyEndpoint",
+    "get_endpoint_pool",
+    "AdmissionController",
+    "AdmissionRejected",
+    "get_admission_controller",
+    "client_key",
 ]
@@ -0,0 +1,240 @@
+"""
+Admission Control
+
+Limits how many analyses run against the Lean backend at once, queues the
+overflow fairly per client and sheds load early when a queued request could
+not start before its deadline.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+from ..config import get_settings
+from .metrics import REGISTRY
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted in time."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        # Whole seconds, as required by the Retry-After header
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionController:
+    """
+    Global concurrency cap with a bounded, per-client fair wait queue.
+
+    Each client has its own FIFO of waiters. When a slot frees up, clients
+    are served round-robin so one noisy client cannot starve the others.
+    A client may hold at most an equal share of the queue (`max_queued`
+    divided by the clients waiting, at least 1). When the queue is full, a
+    client under its share takes the place of the newest request of the
+    client furthest over it, so one client cannot fill the queue and get
+    everyone else rejected.
+    """
+
+    def __init__(self, max_concurrent: int, max_queued: int, deadline: float):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queued = max(0, max_queued)
+        self.deadline = deadline
+
+        self._active = 0
+        self._queued = 0
+        self._waiters: dict[str, deque[asyncio.Future]] = {}
+        self._rotation: deque[str] = deque()  # Clients with waiters, in serving order
+
+        # Exponentially weighted average of how long an admitted request holds a slot
+        self._avg_service_time: float | None = None
+
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_client_share = 0
+        self.rejected_deadline = 0
+        self.timed_out = 0
+
+    def estimated_wait(self) -> float:
+        """Estimate how long a newly queued request would wait for a slot."""
+        if self._active < self.max_concurrent and self._queued == 0:
+            return 0.0
+        service_time = self._avg_service_time or 1.0
+        return (self._queued + 1) * service_time / self.max_concurrent
+
+    @asynccontextmanager
+    async def admit(self, client_id: str, deadline: float | None = None) -> AsyncIterator[None]:
+        """
+        Hold an analysis slot for the duration of the block.
+
+        Raises AdmissionRejected if the queue is full, or if the expected or
+        actual wait exceeds the deadline (seconds).
+        """
+        budget = self.deadline if deadline is None else deadline
+        await self._acquire(client_id, budget)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._record_service_time(time.monotonic() - started)
+            self._release()
+
+    def client_share(self, client_id: str) -> int:
+        """How many queued requests `client_id` may have, counting it among the waiting clients."""
+        clients = len(self._waiters) + (client_id not in self._waiters)
+        return max(1, self.max_queued // clients)
+
+    async def _acquire(self, client_id: str, budget: float) -> None:
+        if self._active < self.max_concurrent and self._queued == 0:
+            self._active += 1
+            self.admitted += 1
+            ADMISSION_DECISIONS.inc(outcome="admitted")
+            return
+
+        wait = self.estimated_wait()
+        if self._queued >= self.max_queued and not self._make_room(client_id, wait):
+            self.rejected_queue_full += 1
+            ADMISSION_DECISIONS.inc(outcome="rejected_queue_full")
+            raise AdmissionRejected("Analysis queue is full", wait)
+        if len(self._waiters.get(client_id, ())) >= self.client_share(client_id):
+            self.rejected_client_share += 1
+            ADMISSION_DECISIONS.inc(outcome="rejected_client_share")
+            raise AdmissionRejected("Too many of your analyses are queued", wait)
+        if wait > budget:
+            self.rejected_deadline += 1
+            ADMISSION_DECISIONS.inc(outcome="rejected_deadline")
+            raise AdmissionRejected("Server is busy; queue wait would exceed the request deadline", wait)
+
+        future = asyncio.get_running_loop().create_future()
+        queue = self._waiters.get(client_id)
+        if queue is None:
+            queue = self._waiters[client_id] = deque()
+            self._rotation.append(client_id)
+        queue.append(future)
+        self._queued += 1
+
+        try:
+            await asyncio.wait_for(future, timeout=budget)
+        except BaseException as e:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # Slot was granted just as we gave up; hand it on
+                self._release()
+            else:
+                self._remove_waiter(client_id, future)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                ADMISSION_DECISIONS.inc(outcome="timed_out")
+                raise AdmissionRejected("Timed out waiting for an analysis slot", self.estimated_wait()) from None
+            raise
+        self.admitted += 1
+        ADMISSION_DECISIONS.inc(outcome="admitted")
+
+    def _release(self) -> None:
+        self._active -= 1
+        while self._rotation:
+            client_id = self._rotation.popleft()
+            queue = self._waiters[client_id]
+            future = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._rotation.append(client_id)
+            else:
+                del self._waiters[client_id]
+
+            if not future.done():
+                self._active += 1
+                future.set_result(None)
+                return
+
+    def _make_room(self, client_id: str, wait: float) -> bool:
+        """Reject the newest waiter of the client furthest over its share, if `client_id` is under its own."""
+        share = self.client_share(client_id)
+        if len(self._waiters.get(client_id, ())) >= share:
+            return False
+        over = max(self._waiters, key=lambda c: len(self._waiters[c]), default=None)
+        if over is None or len(self._waiters[over]) <= share:
+            return False
+        future = self._waiters[over][-1]
+        self._remove_waiter(over, future)
+        self.rejected_client_share += 1
+        ADMISSION_DECISIONS.inc(outcome="rejected_client_share")
+        future.set_exception(AdmissionRejected("Too many of your analyses are queued", wait))
+        return True
+
+    def _remove_waiter(self, client_id: str, future: asyncio.Future) -> None:
+        queue = self._waiters.get(client_id)
+        if queue is None or future not in queue:
+            return
+        queue.remove(future)
+        self._queued -= 1
+        if not queue:
+            del self._waiters[client_id]
+            self._rotation.remove(client_id)
+
+    def _record_service_time(self, elapsed: float) -> None:
+        if self._avg_service_time is None:
+            self._avg_service_time = elapsed
+        else:
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * elapsed
+
+    def stats(self) -> dict[str, Any]:
+        """Snapshot of the controller state for monitoring."""
+        return {
+            "active": self._active,
+            "queued": self._queued,
+            "queued_clients": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "avg_service_seconds": round(self._avg_service_time or 0.0, 3),
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_client_share": self.rejected_client_share,
+            "rejected_deadline": self.rejected_deadline,
+            "timed_out": self.timed_out,
+        }
+
+
+def client_key(headers: Any, host: str | None) -> str:
+    """
+    Identify the client for fair scheduling.
+
+    With `admission_trust_proxy` set (only behind a proxy that appends to
+    X-Forwarded-For), uses the last hop, the address the proxy saw; earlier
+    hops come from the client and can be forged. Otherwise the peer address. Credentials are not
+    used: they are never verified here, so any value would do.
+    """
+    if get_settings().admission_trust_proxy:
+        forwarded = headers.get("x-forwarded-for")
+        if forwarded:
+            return "ip:" + forwarded.split(",")[-1].strip()
+    return f"ip:{host or 'unknown'}"
+
+
+ADMISSION_DECISIONS = REGISTRY.counter(
+    "admission_decisions_total",
+    "Admission outcomes (admitted, rejected_queue_full, rejected_client_share, rejected_deadline, timed_out)",
+    ("outcome",),
+)
+REGISTRY.gauge("admission_active", "Analyses holding a slot", callback=lambda: get_admission_controller()._active)
+REGISTRY.gauge("admission_queued", "Analyses waiting for a slot", callback=lambda: get_admission_controller()._queued)
+
+
+# Singleton instance
+_controller: AdmissionController | None = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """Get or create the admission controller singleton."""
+    global _controller
+    if _controller is None:
+        settings = get_settings()
+        _controller = AdmissionController(
+            max_concurrent=settings.max_concurrent_analyses,
+            max_queued=settings.max_queued_analyses,
+            deadline=settings.request_deadline,
+        )
+    return _controller
@@ -0,0 +1,310 @@
+"""
+Lean Endpoint Balancing
+
+Routes Lean sessions across several Lean4Web endpoints with latency-aware
+selection, per-endpoint circuit breakers and optional hedged requests.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, TypeVar
+
+from ..config import get_settings
+from .metrics import REGISTRY
+from .deadline import Deadline, DeadlineExceeded, current_deadline
+
+
+T = TypeVar("T")
+
+# A fallback endpoint is only tried with at least this much of the deadline left
+MIN_FALLBACK_SECONDS = 1.0
+
+
+class NoHealthyEndpoint(Exception):
+    """Raised when every configured endpoint has its circuit open."""
+
+
+def to_ws_url(url: str) -> str:
+    """Turn a Lean4Web base URL into its WebSocket URL."""
+    ws_url = url.replace("https://", "wss://").replace("http://", "ws://")
+    return f"{ws_url}/websocket"
+
+
+def _out_of_time(deadline: Deadline | None, error: BaseException) -> bool:
+    """Whether a session failed because its own deadline ran out, rather than the endpoint."""
+    if isinstance(error, DeadlineExceeded):
+        return True
+    return deadline is not None and deadline.expired
+
+
+class LeanEndpoint:
+    """
+    One Lean4Web backend with its latency history and circuit breaker.
+
+    The breaker is closed while the endpoint works, opens after
+    `failure_threshold` consecutive failures and lets a single trial request
+    through (half-open) once `reset_timeout` seconds have passed.
+    """
+
+    def __init__(self, url: str, failure_threshold: int, reset_timeout: float):
+        self.url = url
+        self.ws_url = to_ws_url(url)
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+
+        self.latency: float | None = None  # EWMA of successful session durations
+        self.samples: deque[float] = deque(maxlen=100)
+        self.in_flight = 0
+
+        self.consecutive_failures = 0
+        self.opened_at: float | None = None
+        self._trial_in_flight = False
+
+        self.successes = 0
+        self.failures = 0
+
+        # Lean version the endpoint reported (see Lean4WebClient), and when
+        self.toolchain: str | None = None
+        self.toolchain_checked_at: float | None = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def available(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        return state == "half_open" and not self._trial_in_flight
+
+    def score(self) -> float:
+        """Expected cost of sending one more session here (lower is better)."""
+        # Endpoints without history are tried first so every backend gets measured
+        return (self.latency or 0.0) * (self.in_flight + 1)
+
+    def latency_percentile(self, percentile: float) -> float | None:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(percentile * len(ordered)))
+        return ordered[index]
+
+    def on_start(self) -> None:
+        self.in_flight += 1
+        if self.state == "half_open":
+            self._trial_in_flight = True
+
+    def on_success(self, elapsed: float) -> None:
+        self.in_flight -= 1
+        self.successes += 1
+        self.samples.append(elapsed)
+        self.latency = elapsed if self.latency is None else 0.7 * self.latency + 0.3 * elapsed
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def on_failure(self) -> None:
+        self.in_flight -= 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self._trial_in_flight or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def on_cancel(self) -> None:
+        self.in_flight -= 1
+        self._trial_in_flight = False
+
+    def stats(self) -> dict[str, Any]:
+        p90 = self.latency_percentile(0.9)
+        return {
+            "url": self.url,
+            "state": self.state,
+            "in_flight": self.in_flight,
+            "latency_seconds": round(self.latency, 3) if self.latency is not None else None,
+            "p90_seconds": round(p90, 3) if p90 is not None else None,
+            "successes": self.successes,
+            "failures": self.failures,
+            "toolchain": self.toolchain,
+        }
+
+
+class EndpointPool:
+    """Chooses endpoints for Lean sessions and runs sessions against them."""
+
+    def __init__(
+        self,
+        urls: list[str],
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+        hedge: bool = False,
+        hedge_percentile: float = 0.9,
+    ):
+        if not urls:
+            raise ValueError("At least one Lean endpoint is required")
+        self.endpoints = [LeanEndpoint(url, failure_threshold, reset_timeout) for url in urls]
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    def pick(self, exclude: tuple[LeanEndpoint, ...] = ()) -> LeanEndpoint | None:
+        """Pick the available endpoint with the lowest expected cost."""
+        candidates = [ep for ep in self.endpoints if ep not in exclude and ep.available()]
+        if not candidates:
+            return None
+        return min(candidates, key=LeanEndpoint.score)
+
+    def toolchain(self) -> str | None:
+        """The toolchain every endpoint reported, or None while they differ or one is unknown."""
+        toolchains = {ep.toolchain for ep in self.endpoints}
+        return toolchains.pop() if len(toolchains) == 1 else None
+
+    async def run(self, session: Callable[[LeanEndpoint], Awaitable[T]], deadline: Deadline | None = None) -> T:
+        """
+        Run `session` against the best endpoint.
+
+        `deadline` is the session's own deadline (defaults to the request's).
+        Sessions that fail because it ran out don't count against the
+        endpoint's breaker.
+
+        A failing session is retried once on an endpoint it hasn't been
+        tried on, if enough of the deadline is left. With hedging enabled, a
+        duplicate is started on a second endpoint when the first one runs
+        past its latency percentile; the slower one is cancelled.
+        """
+        deadline = deadline or current_deadline()
+        primary = self.pick()
+        if primary is None:
+            raise NoHealthyEndpoint("All Lean endpoints are unavailable")
+
+        tried = [primary]
+        try:
+            return await self._run_hedged(primary, session, deadline, tried)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            fallback = self.pick(exclude=tuple(tried))
+            if fallback is None or (deadline is not None and deadline.remaining() < MIN_FALLBACK_SECONDS):
+                raise
+            return await self.attempt(fallback, session, deadline)
+
+    async def _run_hedged(
+        self,
+        primary: LeanEndpoint,
+        session: Callable[[LeanEndpoint], Awaitable[T]],
+        deadline: Deadline | None,
+        tried: list[LeanEndpoint],
+    ) -> T:
+        """Run `session` on `primary`, hedged if enabled; adds the endpoints it ran on to `tried`."""
+        hedge_after = primary.latency_percentile(self.hedge_percentile) if self.hedge else None
+        if hedge_after is None or len(self.endpoints) < 2:
+            return await self.attempt(primary, session, deadline)
+
+        first = asyncio.create_task(self.attempt(primary, session, deadline))
+        second: asyncio.Task | None = None
+        try:
+            done, _ = await asyncio.wait({first}, timeout=hedge_after)
+            if done:
+                return first.result()
+
+            secondary = self.pick(exclude=(primary,))
+            if secondary is None:
+                return await first
+
+            tried.append(secondary)
+            self.hedges_sent += 1
+            HEDGES.inc(outcome="sent")
+            second = asyncio.create_task(self.attempt(secondary, session, deadline))
+            pending = {first, second}
+            error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedges_won += 1
+                            HEDGES.inc(outcome="won")
+                        for loser in pending:
+                            loser.cancel()
+                        return task.result()
+                    error = task.exception()
+            assert error is not None
+            raise error
+        finally:
+            for task in (first, second):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def attempt(
+        self,
+        endpoint: LeanEndpoint,
+        session: Callable[[LeanEndpoint], Awaitable[T]],
+        deadline: Deadline | None,
+    ) -> T:
+        """
+        Run `session` on `endpoint` once, recording the outcome and latency
+        on its breaker. Also used for sessions that must stay on a given
+        endpoint, like those of warm documents.
+        """
+        endpoint.on_start()
+        started = time.monotonic()
+        try:
+            result = await session(endpoint)
+        except asyncio.CancelledError:
+            endpoint.on_cancel()
+            raise
+        except Exception as e:
+            if _out_of_time(deadline, e):
+                # Ran out of the session's budget; not the endpoint's fault
+                endpoint.on_cancel()
+            else:
+                endpoint.on_failure()
+            raise
+        endpoint.on_success(time.monotonic() - started)
+        return result
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "endpoints": [ep.stats() for ep in self.endpoints],
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won,
+        }
+
+
+HEDGES = REGISTRY.counter("lean_hedges_total", "Hedged Lean sessions (sent, won by the hedge)", ("outcome",))
+REGISTRY.gauge(
+    "lean_endpoint_in_flight", "Lean sessions in flight per endpoint", ("url",),
+    callback=lambda: {(ep.url,): ep.in_flight for ep in get_endpoint_pool().endpoints},
+)
+REGISTRY.gauge(
+    "lean_endpoint_up", "Circuit state per endpoint (1 closed, 0.5 half-open, 0 open)", ("url",),
+    callback=lambda: {
+        (ep.url,): {"closed": 1.0, "half_open": 0.5, "open": 0.0}[ep.state]
+        for ep in get_endpoint_pool().endpoints
+    },
+)
+
+
+# Singleton instance
+_pool: EndpointPool | None = None
+
+
+def get_endpoint_pool() -> EndpointPool:
+    """Get or create the endpoint pool singleton."""
+    global _pool
+    if _pool is None:
+        settings = get_settings()
+        _pool = EndpointPool(
+            settings.lean_endpoints,
+            failure_threshold=settings.breaker_failure_threshold,
+            reset_timeout=settings.breaker_reset_timeout,
+            hedge=settings.hedge_requests,
+            hedge_percentile=settings.hedge_percentile,
+        )
+    return _pool
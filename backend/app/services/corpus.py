@@ -0,0 +1,202 @@
+"""
+Lean Corpus Splitting
+
+Finds Lean files in a directory or Lake project and splits each file into
+one analyzable snippet per tactic proof. The analysis pipeline handles one
+proof at a time, so each snippet is the file up to that declaration with
+the proofs of earlier theorems and lemmas replaced by `sorry`: they,
+earlier definitions (bodies unchanged, since later proofs may unfold them)
+and namespaces stay in scope, but only the target proof is elaborated.
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+from .result_store import source_hash
+
+# Directories that hold build outputs or dependencies rather than sources
+SKIP_DIRS = {".lake", "lake-packages", "build", ".git", "node_modules"}
+
+# Start of a top-level declaration, after attributes and modifiers
+DECLARATION = re.compile(
+    r"^(?:@\[.*?\]\s*)*"
+    r"(?:(?:private|protected|noncomputable|nonrec|partial|unsafe)\s+)*"
+    r"(theorem|lemma|example|def|abbrev|instance|structure|class|inductive|axiom|opaque)\b"
+    r"\s*([^\s(:{\[]*)"
+)
+SCOPE_OPEN = re.compile(r"^(?:noncomputable\s+)?(namespace|section)\b\s*(\S*)")
+SCOPE_END = re.compile(r"^end\b")
+# A tactic block: `:= by ...` or `by` on a line of its own
+TACTIC_BLOCK = re.compile(r":=\s*by\b.*$")
+# `by` starting a line, as in `:=` followed by an indented `by simp`
+BY_START = re.compile(r"^by\b")
+
+PROOF_KINDS = {"theorem", "lemma", "example"}
+# Declarations whose proofs later code can't depend on, so they can be stubbed;
+# definitions keep their bodies, which later proofs may unfold
+STUB_KINDS = {"theorem", "lemma"}
+
+
+@dataclass
+class LeanDeclaration:
+    """A tactic proof in a Lean file, with the snippet used to analyze it."""
+    name: str        # Qualified with enclosing namespaces
+    kind: str        # theorem, lemma or example
+    line: int        # 1-indexed line of the declaration in the file
+    code: str        # Preceding file content (proofs stubbed) + the declaration
+    line_offset: int  # Add to a snippet line number to get the file line number
+
+    @property
+    def key(self) -> str:
+        """Source hash of the snippet; changes when the proof or anything before it does."""
+        return source_hash(self.code)
+
+
+def find_lean_files(root: Path) -> list[Path]:
+    """All `.lean` sources under `root` (or `root` itself), skipping build and dependency directories."""
+    if root.is_file():
+        return [root]
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS and not d.startswith("."))
+        files.extend(Path(dirpath) / f for f in sorted(filenames) if f.endswith(".lean"))
+    return files
+
+
+def _chunks(lines: list[str]) -> Iterator[tuple[int, list[str], str]]:
+    """
+    Split source lines into top-level chunks, each starting at an unindented
+    line. Yields the start index, the chunk and its head: the line with the
+    declaration keyword, after any doc comment and attribute lines.
+    """
+    start = 0
+    head: str | None = None
+    in_block_comment = False
+    # Doc comments and attributes on their own lines belong to the next declaration
+    in_prefix = False
+
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if in_block_comment:
+            in_block_comment = "-/" not in stripped
+            continue
+        if not stripped or line[0].isspace() or stripped.startswith("--"):
+            continue
+
+        is_comment = stripped.startswith("/-")
+        if is_comment:
+            in_block_comment = "-/" not in stripped[2:]
+        is_prefix = is_comment or (stripped.startswith("@[") and not DECLARATION.match(stripped))
+
+        if in_prefix:
+            if not is_prefix:
+                head = line
+                in_prefix = False
+            continue
+        if i > start:
+            yield start, lines[start:i], head or lines[start]
+            start = i
+        head = None if is_prefix else line
+        in_prefix = is_prefix
+
+    if start < len(lines):
+        yield start, lines[start:], head or lines[start]
+
+
+def starts_tactic_block(stripped: str, previous: str) -> bool:
+    """Whether a line (stripped) opens a tactic block on its own, given the previous non-blank line."""
+    return stripped == "by" or (previous.endswith(":=") and BY_START.match(stripped) is not None)
+
+
+def has_tactic_block(lines: list[str]) -> bool:
+    previous = ""
+    for line in lines:
+        stripped = line.strip()
+        if TACTIC_BLOCK.search(line) or starts_tactic_block(stripped, previous):
+            return True
+        if stripped:
+            previous = stripped
+    return False
+
+
+def stub_proofs(lines: list[str]) -> list[str]:
+    """Replace the tactic blocks in a chunk with `sorry`."""
+    out = []
+    skip_deeper_than: int | None = None
+    in_where = False
+    previous = ""
+
+    for line in lines:
+        indent = len(line) - len(line.lstrip())
+        if skip_deeper_than is not None:
+            if not line.strip() or indent > skip_deeper_than:
+                continue
+            skip_deeper_than = None
+
+        stripped = line.strip()
+        if TACTIC_BLOCK.search(line):
+            out.append(TACTIC_BLOCK.sub(":= sorry", line))
+            # A structure field's proof ends with its indentation; a
+            # declaration's proof runs to the end of the chunk
+            skip_deeper_than = indent if in_where else 0
+            previous = ""
+            continue
+        if starts_tactic_block(stripped, previous):
+            out.append(line[:indent] + "sorry")
+            skip_deeper_than = indent - 1
+            previous = ""
+            continue
+        if stripped.endswith(" where") or stripped == "where":
+            in_where = True
+        if stripped:
+            previous = stripped
+        out.append(line)
+
+    return out
+
+
+def split_declarations(source: str) -> list[LeanDeclaration]:
+    """Split a Lean file into one snippet per tactic proof."""
+    lines = source.replace("\r\n", "\n").split("\n")
+    declarations = []
+    preamble: list[str] = []
+    scopes: list[tuple[str, str]] = []
+
+    for start, chunk, head in _chunks(lines):
+        match = DECLARATION.match(head)
+        kind = match.group(1) if match else None
+
+        if kind is None:
+            if scope := SCOPE_OPEN.match(head):
+                scopes.append((scope.group(1), scope.group(2)))
+            elif SCOPE_END.match(head) and scopes:
+                scopes.pop()
+            preamble.extend(chunk)
+            continue
+
+        body = list(chunk)
+        while body and not body[-1].strip():
+            body.pop()
+        has_proof = kind in PROOF_KINDS and has_tactic_block(body)
+
+        if has_proof:
+            prefix = ".".join(n for k, n in scopes if k == "namespace" and n)
+            name = match.group(2) if kind != "example" else f"example@{start + 1}"
+            declarations.append(LeanDeclaration(
+                name=f"{prefix}.{name}" if prefix else name,
+                kind=kind,
+                line=start + 1,
+                code="\n".join(preamble + body),
+                line_offset=start - len(preamble),
+            ))
+
+        # Examples declare nothing later code can use
+        if kind in STUB_KINDS:
+            preamble.extend(stub_proofs(chunk))
+        elif kind != "example":
+            preamble.extend(chunk)
+
+    return declarations
@@ -0,0 +1,67 @@
+"""
+Request Deadlines
+
+A single deadline per request, handed down through admission, the Lean
+session and explanation so every phase only gets the time that is left.
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Raised when a phase is started after the request deadline has passed."""
+
+
+class Deadline:
+    """Absolute point in (monotonic) time by which a request must finish."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def budget(self, cap: float | None = None) -> float:
+        """
+        Time available for the next phase, at most `cap` seconds.
+
+        Raises DeadlineExceeded if nothing is left.
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Request deadline of {self.seconds:g}s exceeded")
+        return remaining if cap is None else min(cap, remaining)
+
+    def reserve(self, seconds: float) -> "Deadline":
+        """A deadline that ends `seconds` earlier, leaving time for later work."""
+        child = Deadline.__new__(Deadline)
+        child.seconds = max(0.0, self.seconds - seconds)
+        child.expires_at = self.expires_at - seconds
+        return child
+
+
+_current_deadline: ContextVar[Deadline | None] = ContextVar("current_deadline", default=None)
+
+
+def current_deadline() -> Deadline | None:
+    """The deadline of the request being handled, if any."""
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Deadline) -> Iterator[Deadline]:
+    """Make `deadline` the active deadline for the enclosed block."""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
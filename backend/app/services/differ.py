@@ -4,7 +4,7 @@ State Diff Computation
 Computes the differences between proof states.
 """
 
-from ..models import ProofState, StateDiff, Hypothesis, Goal
+from ..models import ProofState, StateDiff
 
 
 def compute_diff(before: ProofState, after: ProofState) -> StateDiff:
@@ -43,23 +43,20 @@ def mark_new_items(before: ProofState, after: ProofState) -> ProofState:
     Return the 'after' state with is_new flags set for new items.
     """
     before_hyp_names = {h.name for h in before.hypotheses}
-    before_goal_types = {g.type for g in before.goals}
+    # Elided types compare by the hash of their full text
+    before_goal_types = {g.term or g.type for g in before.goals}
+    # A goal whose metavariable is still there wasn't touched
+    before_mvars = {g.mvar_id for g in before.goals if g.mvar_id}
     
     marked_hypotheses = [
-        Hypothesis(
-            name=h.name,
-            type=h.type,
-            is_new=(h.name not in before_hyp_names)
-        )
+        h.model_copy(update={"is_new": h.name not in before_hyp_names})
         for h in after.hypotheses
     ]
     
     marked_goals = [
-        Goal(
-            id=g.id,
-            type=g.type,
-            is_new=(g.type not in before_goal_types)
-        )
+        g.model_copy(update={
+            "is_new": g.mvar_id not in before_mvars and (g.term or g.type) not in before_goal_types,
+        })
         for g in after.goals
     ]
     
@@ -0,0 +1,136 @@
+"""
+Event Loop Health
+
+Every request of a worker shares one asyncio event loop, so CPU-bound work
+in one analysis delays WebSocket reads and keepalives for all the others.
+
+LoopMonitor measures how late a periodic sleep wakes up (the loop's lag)
+into the `event_loop_lag_seconds` histogram. A watchdog thread notices
+when the loop hasn't come back for `slow_callback_seconds` and logs the
+stack the loop thread is stuck in, which names the slow callback.
+
+`offload` runs CPU-heavy stages (goal parsing, (de)serializing timelines)
+in a small worker pool once their input passes `offload_min_bytes`, so
+the loop keeps serving I/O while a large timeline is processed. Smaller
+inputs run inline, where the pool's overhead would dominate.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from ..config import get_settings
+from .metrics import REGISTRY
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Innermost frames logged for a stall; the outer ones are the server's
+STALL_STACK_FRAMES = 12
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+LOOP_LAG = REGISTRY.histogram(
+    "event_loop_lag_seconds", "How late the event loop ran a timer it had scheduled", buckets=LAG_BUCKETS
+)
+LOOP_STALLS = REGISTRY.counter(
+    "event_loop_stalls_total", "Times the event loop was blocked past the slow-callback threshold"
+)
+OFFLOADED = REGISTRY.counter(
+    "cpu_offloads_total", "CPU-heavy stages run in the worker pool instead of on the event loop", ("stage",)
+)
+
+
+class LoopMonitor:
+    """Lag probe for the running event loop, with a watchdog for stalls."""
+
+    def __init__(self, interval: float, slow_seconds: float):
+        self.interval = interval
+        # 0 disables stall logging
+        self.slow_seconds = slow_seconds
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._beat = time.monotonic()
+        self._loop_thread: int | None = None
+
+    async def run(self) -> None:
+        """Probe until cancelled."""
+        self._loop_thread = threading.get_ident()
+        stop = threading.Event()
+        if self.slow_seconds:
+            threading.Thread(target=self._watch, args=(stop,), name="loop-watchdog", daemon=True).start()
+        try:
+            while True:
+                started = self._beat = time.monotonic()
+                await asyncio.sleep(self.interval)
+                self.lag = max(0.0, time.monotonic() - started - self.interval)
+                self.max_lag = max(self.max_lag, self.lag)
+                LOOP_LAG.observe(self.lag)
+        finally:
+            stop.set()
+
+    def _watch(self, stop: threading.Event) -> None:
+        reported = None
+        while not stop.wait(min(self.interval, self.slow_seconds)):
+            beat = self._beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked < self.slow_seconds or beat == reported:
+                continue
+            # Report each stall once, with where the loop thread is stuck
+            reported = beat
+            self.stalls += 1
+            LOOP_STALLS.inc()
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame, STALL_STACK_FRAMES)).rstrip() if frame else "(unavailable)"
+            logger.warning("Event loop blocked for %.0f ms, in:\n%s", blocked * 1000, stack)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "lag_ms": round(self.lag * 1000, 2),
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+            "stalls": self.stalls,
+        }
+
+
+# Singleton instances
+_monitor: LoopMonitor | None = None
+_pool: ThreadPoolExecutor | None = None
+
+
+def get_loop_monitor() -> LoopMonitor | None:
+    """Get the loop monitor, or None when it is disabled."""
+    global _monitor
+    settings = get_settings()
+    if _monitor is None and settings.loop_monitor_interval > 0:
+        _monitor = LoopMonitor(settings.loop_monitor_interval, settings.slow_callback_seconds)
+    return _monitor
+
+
+async def offload(stage: str, size: int, fn: Callable[..., T], *args: Any) -> T:
+    """
+    Call `fn(*args)` in the worker pool when `size` (bytes of input, roughly)
+    is past `offload_min_bytes`, otherwise right here on the loop.
+    """
+    global _pool
+    settings = get_settings()
+    if not settings.offload_min_bytes or size < settings.offload_min_bytes:
+        return fn(*args)
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=settings.offload_workers, thread_name_prefix="offload")
+    OFFLOADED.inc(stage=stage)
+    return await asyncio.get_running_loop().run_in_executor(_pool, fn, *args)
+
+
+def shutdown_offload_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -1,10 +1,38 @@
 import re
-import httpx
 from typing import Optional
 from ..models.schemas import ProofState, Hypothesis, Goal
 from ..config import get_settings
+from .deadline import current_deadline
 
-async def explain_tactic(tactic: str, before: Optional[ProofState] = None, after: Optional[ProofState] = None) -> str:
+# Shared LLM HTTP client, created on first use: httpx is only imported when
+# an explanation is actually requested, which keeps it out of cold starts
+_llm_client = None
+
+
+def _get_llm_client():
+    global _llm_client
+    if _llm_client is None:
+        import httpx
+        _llm_client = httpx.AsyncClient()
+    return _llm_client
+
+
+async def close_llm_client() -> None:
+    global _llm_client
+    if _llm_client is not None:
+        await _llm_client.aclose()
+        _llm_client = None
+
+# Least time the request must have left for the LLM to be asked
+LLM_MIN_SECONDS = 0.5
+
+
+async def explain_tactic(
+    tactic: str,
+    before: Optional[ProofState] = None,
+    after: Optional[ProofState] = None,
+    llm: bool = True,
+) -> str:
     """
     Generate a natural language explanation for a Lean 4 tactic using context.
     
@@ -12,22 +40,45 @@ async def explain_tactic(tactic: str, before: Optional[ProofState] = None, after
         tactic: The tactic string (e.g., "intro h")
         before: The proof state before the tactic.
         after: The proof state after the tactic.
+        llm: Whether the LLM may be asked (otherwise only the local rules are used).
     """
+    explanation, _ = await explain_step(tactic, before, after, llm)
+    return explanation
+
 
+async def explain_step(
+    tactic: str,
+    before: Optional[ProofState] = None,
+    after: Optional[ProofState] = None,
+    llm: bool = True,
+) -> tuple[str, bool]:
+    """
+    Like `explain_tactic`, but also returns whether the explanation is the
+    best one available: False if the LLM would have been asked, but the
+    request deadline left no time for it (or ran out while waiting).
+    """
     t = tactic.strip()
     settings = get_settings()
+    if not (llm and settings.openai_api_key):
+        return explain_locally(t, before, after), True
 
-    # Try LLM if Key is present
-    if settings.openai_api_key:
+    # Try LLM if the request still has time for it
+    deadline = current_deadline()
+    if deadline is None or deadline.remaining() > LLM_MIN_SECONDS:
         try:
             explanation = await explain_with_llm(t, before, after, settings.openai_api_key, settings.openai_model)
             if explanation:
-                return explanation
+                return explanation, True
         except Exception as e:
             print(f"LLM Explanation failed: {e}")
             # Fallback to regex
             pass
-    
+    rushed = deadline is not None and deadline.remaining() <= LLM_MIN_SECONDS
+    return explain_locally(t, before, after), not rushed
+
+
+def explain_locally(t: str, before: Optional[ProofState], after: Optional[ProofState]) -> str:
+    """Explanation from the local rules, for the stripped tactic `t`."""
     # Helper to get goal types
     def get_goal_type(state: Optional[ProofState], index: int = 0) -> str:
         if state and state.goals and len(state.goals) > index:
@@ -174,26 +225,29 @@ async def explain_with_llm(tactic: str, before: Optional[ProofState], after: Opt
     {context}
     """
     
-    async with httpx.AsyncClient(timeout=5.0) as client:
-        response = await client.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": model,
-                "messages": [
-                    {"role": "system", "content": "You are a helpful math tutor explaining formal proofs."},
-                    {"role": "user", "content": prompt}
-                ],
-                "max_tokens": 60,
-                "temperature": 0.7
-            }
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            return data["choices"][0]["message"]["content"].strip()
+    deadline = current_deadline()
+    timeout = deadline.budget(5.0) if deadline else 5.0
+    
+    response = await _get_llm_client().post(
+        "https://api.openai.com/v1/chat/completions",
+        headers={
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        },
+        json={
+            "model": model,
+            "messages": [
+                {"role": "system", "content": "You are a helpful math tutor explaining formal proofs."},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": 60,
+            "temperature": 0.7
+        },
+        timeout=timeout,
+    )
+    
+    if response.status_code == 200:
+        data = response.json()
+        return data["choices"][0]["message"]["content"].strip()
             
     return None
@@ -5,13 +5,131 @@ Communicates with the Lean4Web service using WebSocket and JSON-RPC over LSP pro
 """
 
 import asyncio
+import itertools
 import json
 import re
+import time
 from typing import Any
 import websockets
-from websockets.exceptions import WebSocketException
+from websockets.exceptions import ConnectionClosedError, WebSocketException
+from websockets.frames import CloseCode
 
 from ..config import get_settings
+from .balancer import EndpointPool, LeanEndpoint, NoHealthyEndpoint, get_endpoint_pool
+from .metrics import (
+    REGISTRY,
+    BYTES_BUCKETS,
+    LEAN_PHASE_SECONDS,
+    LEAN_UPSTREAM_ERRORS,
+    LEAN_UPSTREAM_TIMEOUTS,
+    LEAN_GOAL_QUERIES,
+    LEAN_GOAL_FORMATS,
+)
+from .profiling import current_trace
+from .deadline import Deadline, current_deadline
+from .warm_headers import WarmHeaderPool
+from .result_store import get_result_store, source_hash
+from .readiness import get_readiness
+from .replay import SessionRecorder, get_replay_store
+
+# Distinguishes the URIs of warm documents
+_warm_document_ids = itertools.count(1)
+
+# JSON-RPC error code for methods the server doesn't have
+METHOD_NOT_FOUND = -32601
+
+# Smallest useful document, for pre-warming endpoints
+PROBE_CODE = "example : True := by\n  trivial\n"
+
+# Document whose only message is the server's Lean version and commit
+TOOLCHAIN_URI = "file:///toolchain.lean"
+TOOLCHAIN_CODE = '#eval Lean.versionString ++ " " ++ Lean.githash\n'
+
+LEAN_RECEIVED_BYTES = REGISTRY.histogram(
+    "lean_received_bytes", "Bytes received from Lean per analysis", buckets=(*BYTES_BUCKETS, 16777216, 67108864)
+)
+LEAN_LIMITS_HIT = REGISTRY.counter(
+    "lean_limits_exceeded_total", "Analyses cut short by an upstream message limit", ("limit",)
+)
+
+
+class UpstreamLimitExceeded(Exception):
+    """Lean sent more than an analysis is allowed to receive."""
+    
+    def __init__(self, limit: str, message: str):
+        super().__init__(message)
+        self.limit = limit
+
+
+class MessageBudget:
+    """Per-analysis caps on the number and total size of messages received from Lean."""
+    
+    def __init__(self, max_bytes: int, max_messages: int):
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self.bytes = 0
+        self.messages = 0
+    
+    @classmethod
+    def from_settings(cls) -> "MessageBudget":
+        settings = get_settings()
+        return cls(settings.lean_max_session_bytes, settings.lean_max_session_messages)
+    
+    def charge(self, size: int) -> None:
+        self.bytes += size
+        self.messages += 1
+        if self.bytes > self.max_bytes:
+            raise UpstreamLimitExceeded("bytes", f"Lean output exceeded {self.max_bytes // 1024} KiB")
+        if self.messages > self.max_messages:
+            raise UpstreamLimitExceeded("messages", f"Lean sent more than {self.max_messages} messages")
+
+
+class LeanConnection:
+    """
+    A WebSocket to Lean that decodes each incoming message exactly once and
+    charges it to the current analysis's MessageBudget. With a recorder
+    set, every message is also added to a session trace.
+    """
+    
+    def __init__(self, ws, endpoint_url: str):
+        self.ws = ws
+        self.endpoint_url = endpoint_url
+        self.budget: MessageBudget | None = None
+        self.recorder: SessionRecorder | None = None
+        # Response to the initialize request, kept for session traces
+        self.initialize: dict[str, Any] | None = None
+    
+    async def send(self, payload: dict[str, Any]) -> None:
+        """Send a JSON-RPC message, recording it when the request is profiled."""
+        raw = json.dumps(payload)
+        trace = current_trace()
+        if trace is not None:
+            trace.add_message("send", payload, len(raw))
+        if self.recorder is not None:
+            self.recorder.add("send", payload)
+        await self.ws.send(raw)
+    
+    async def recv(self, timeout: float) -> dict[str, Any]:
+        """Receive and decode one JSON-RPC message."""
+        try:
+            raw = await asyncio.wait_for(self.ws.recv(), timeout=timeout)
+        except ConnectionClosedError as e:
+            # websockets closes with 1009 when a message exceeds max_size
+            if e.sent is not None and e.sent.code == CloseCode.MESSAGE_TOO_BIG:
+                raise UpstreamLimitExceeded("message_size", "Lean sent a message larger than the size limit") from e
+            raise
+        if self.budget is not None:
+            self.budget.charge(len(raw))
+        data = json.loads(raw)
+        trace = current_trace()
+        if trace is not None:
+            trace.add_message("recv", data, len(raw))
+        if self.recorder is not None:
+            self.recorder.add("recv", data)
+        return data
+    
+    async def close(self) -> None:
+        await self.ws.close()
 
 
 class Lean4WebClient:
@@ -19,179 +137,634 @@ class Lean4WebClient:
     Client for interacting with Lean4Web using WebSocket.
     
     The Lean4Web server uses JSON-RPC 2.0 over WebSocket with LSP protocol.
+    Sessions are spread over the configured endpoints by an EndpointPool.
+    Code whose header matches a warm document is analyzed as an edit on
+    that document instead of in a fresh session.
     """
     
-    def __init__(self):
+    def __init__(self, pool: EndpointPool | None = None):
         self.settings = get_settings()
-        # WebSocket URL for Lean4Web (wss for secure WebSocket)
-        self.ws_url = self.settings.lean4web_url.replace("https://", "wss://").replace("http://", "ws://")
-        self.ws_url = f"{self.ws_url}/websocket"
+        self.pool = pool or get_endpoint_pool()
         self._request_id = 0
+        # Endpoints without interactive goals; they are asked for plainGoal
+        self._plain_goal_endpoints: set[str] = set()
+        self.warm_headers: WarmHeaderPool | None = None
+        if self.settings.warm_header_slots > 0:
+            self.warm_headers = WarmHeaderPool(
+                self,
+                slots=self.settings.warm_header_slots,
+                min_uses=self.settings.warm_header_min_uses,
+                half_life=self.settings.warm_header_half_life,
+                warm_timeout=self.settings.warm_header_timeout,
+            )
     
     def _next_id(self) -> int:
         """Get next request ID."""
         self._request_id += 1
         return self._request_id
     
-    async def analyze_code(self, code: str, timeout: float = 30.0) -> dict[str, Any]:
+    async def analyze_code(
+        self,
+        code: str,
+        deadline: Deadline | None = None,
+        known_lines: frozenset[int] = frozenset(),
+    ) -> dict[str, Any]:
         """
         Send Lean code to Lean4Web and get diagnostics and goal states.
         
+        Every phase of the session (connect, initialize, elaboration, goal
+        queries) only gets the time left before `deadline`, which defaults
+        to the current request's deadline. Goals are not queried on
+        `known_lines` (0-indexed), whose states the caller already has.
+        
         Returns a dict with:
         - diagnostics: list of diagnostic messages
         - goals: list of goal states at various positions
+        - endpoint: the endpoint that ran the session
+        - toolchain: the Lean version and commit of that endpoint, if known
         - success: whether code compiled without errors
+        - complete: whether the session ran to the end (not cut short by
+          the deadline or an upstream error)
+        
+        Complete results are kept in the shared result store, if one is
+        configured, so other workers don't need to ask Lean again.
         """
-        result = {
-            "diagnostics": [],
-            "goals": [],
-            "success": True,
-            "messages": []
-        }
+        deadline = deadline or current_deadline() or Deadline(self.settings.request_deadline)
+        
+        # Profiled requests always talk to Lean so the trace shows the session
+        store = get_result_store() if current_trace() is None else None
+        if store is not None:
+            key = source_hash(code)
+            cached = await store.get("lean", key)
+            if cached is not None:
+                return json.loads(cached)
+        
+        result = await self._run_session(code, deadline, known_lines)
+        if result["complete"]:
+            get_readiness().lean_session_succeeded()
+        
+        # Results missing the known lines' goals are only good for this caller
+        if store is not None and result["complete"] and not known_lines:
+            await store.put("lean", key, json.dumps(result).encode())
+        return result
+    
+    async def probe(self, deadline: Deadline) -> int:
+        """
+        Run a trivial session on every endpoint at once, bypassing caches
+        and warm documents. Returns how many endpoints completed it.
+        """
+        async def probe_one(endpoint: LeanEndpoint) -> bool:
+            try:
+                result = await self._analyze_on(endpoint, PROBE_CODE, deadline, frozenset())
+            except Exception:
+                return False
+            return result["complete"]
+        
+        results = await asyncio.gather(*(probe_one(ep) for ep in self.pool.endpoints))
+        return sum(results)
+    
+    async def _run_session(self, code: str, deadline: Deadline, known_lines: frozenset[int]) -> dict[str, Any]:
+        """Analyze on a warm document if possible, otherwise in a fresh session."""
+        if self.warm_headers is not None:
+            result = await self.warm_headers.analyze(code, deadline, known_lines)
+            if result is not None:
+                return result
         
         try:
-            async with websockets.connect(
-                self.ws_url,
-                additional_headers={"Origin": self.settings.lean4web_url},
-                close_timeout=5,
-                open_timeout=10,
-            ) as ws:
-                # Initialize connection - similar to how lean4web does it
-                # Send the code as a didOpen notification
-                doc_uri = "file:///untitled.lean"
-                
-                # 1. Send initialize request
-                init_request = {
-                    "jsonrpc": "2.0",
-                    "id": self._next_id(),
-                    "method": "initialize",
-                    "params": {
-                        "processId": None,
-                        "clientInfo": {"name": "lean-visualizer"},
-                        "rootUri": None,
-                        "capabilities": {}
-                    }
-                }
-                await ws.send(json.dumps(init_request))
-                
-                # 2. Wait for initialize response and then send initialized notification
-                init_response = await asyncio.wait_for(ws.recv(), timeout=10)
-                
-                initialized_notification = {
-                    "jsonrpc": "2.0",
-                    "method": "initialized",
-                    "params": {}
-                }
-                await ws.send(json.dumps(initialized_notification))
-                
-                # 3. Open the document
-                did_open = {
-                    "jsonrpc": "2.0",
-                    "method": "textDocument/didOpen",
-                    "params": {
-                        "textDocument": {
-                            "uri": doc_uri,
-                            "languageId": "lean4",
-                            "version": 1,
-                            "text": code
-                        }
-                    }
-                }
-                await ws.send(json.dumps(did_open))
-                
-                # 4. Collect responses (diagnostics, etc.)
-                # The server will send diagnostics and other info as notifications
-                deadline = asyncio.get_event_loop().time() + timeout
-                
-                while asyncio.get_event_loop().time() < deadline:
-                    try:
-                        msg = await asyncio.wait_for(ws.recv(), timeout=2.0)
-                        data = json.loads(msg)
-                        
-                        # Handle diagnostic notifications
-                        if data.get("method") == "textDocument/publishDiagnostics":
-                            diagnostics = data.get("params", {}).get("diagnostics", [])
-                            result["diagnostics"].extend(diagnostics)
-                            
-                            # Check for errors
-                            for diag in diagnostics:
-                                if diag.get("severity") == 1:  # 1 = Error in LSP
-                                    result["success"] = False
-                        
-                        # Handle any info messages
-                        if "result" in data or "params" in data:
-                            result["messages"].append(data)
-                        
-                        # If we see the $/lean/fileProgress complete, we're done
-                        if data.get("method") == "$/lean/fileProgress":
-                            processing = data.get("params", {}).get("processing", [])
-                            if not processing:  # Empty means done processing
-                                break
-                                
-                    except asyncio.TimeoutError:
-                        # No more messages, we're probably done
-                        break
-                
-                # 5. Try to get goal state at various positions
-                # Find positions where we have tactics
-                tactic_positions = find_tactic_positions(code)
-                
-                for line, col in tactic_positions[:10]:  # Limit to 10 positions
-                    hover_request = {
-                        "jsonrpc": "2.0",
-                        "id": self._next_id(),
-                        "method": "$/lean/plainGoal",  # Lean-specific method for goals
-                        "params": {
-                            "textDocument": {"uri": doc_uri},
-                            "position": {"line": line, "character": col}
-                        }
-                    }
-                    await ws.send(json.dumps(hover_request))
-                    
-                    try:
-                        response = await asyncio.wait_for(ws.recv(), timeout=2.0)
-                        data = json.loads(response)
-                        
-                        if "result" in data and data["result"]:
-                            goal_info = data["result"]
-                            result["goals"].append({
-                                "line": line + 1,  # Convert to 1-indexed
-                                "column": col + 1,
-                                "goals": goal_info.get("goals", []),
-                                "rendered": goal_info.get("rendered") or str(goal_info)
-                            })
-                    except asyncio.TimeoutError:
-                        continue
-                
-                # Close document
-                did_close = {
-                    "jsonrpc": "2.0",
-                    "method": "textDocument/didClose",
-                    "params": {
-                        "textDocument": {"uri": doc_uri}
-                    }
-                }
-                await ws.send(json.dumps(did_close))
-                
+            return await self.pool.run(
+                lambda endpoint: self._analyze_on(endpoint, code, deadline, known_lines), deadline
+            )
         except WebSocketException as e:
-            result["success"] = False
-            result["diagnostics"].append({
-                "message": f"WebSocket error: {str(e)}",
-                "severity": 1
-            })
+            LEAN_UPSTREAM_ERRORS.inc(kind="websocket")
+            return _failed_result(f"WebSocket error: {str(e)}", severity=1)
         except asyncio.TimeoutError:
-            result["diagnostics"].append({
-                "message": "Timeout waiting for Lean server response",
-                "severity": 2
-            })
+            LEAN_UPSTREAM_TIMEOUTS.inc()
+            return _failed_result("Timeout waiting for Lean server response", severity=2)
+        except NoHealthyEndpoint as e:
+            LEAN_UPSTREAM_ERRORS.inc(kind="no_endpoint")
+            return _failed_result(str(e), severity=1)
         except Exception as e:
-            result["success"] = False
-            result["diagnostics"].append({
-                "message": f"Connection error: {str(e)}",
-                "severity": 1
-            })
+            LEAN_UPSTREAM_ERRORS.inc(kind="connection")
+            return _failed_result(f"Connection error: {str(e)}", severity=1)
+    
+    def _connect(self, endpoint: LeanEndpoint, deadline: Deadline):
+        """Open a WebSocket to an endpoint (use with `async with`, or await it)."""
+        replay = get_replay_store()
+        if replay is not None:
+            return replay.connect(endpoint.ws_url)
+        return websockets.connect(
+            endpoint.ws_url,
+            additional_headers={"Origin": endpoint.url},
+            close_timeout=5,
+            open_timeout=deadline.budget(10),
+            # Negotiated only if the server supports permessage-deflate
+            compression="deflate" if self.settings.lean_ws_compression else None,
+            max_size=self.settings.lean_max_message_bytes,
+        )
+    
+    async def _request(self, conn: LeanConnection, payload: dict[str, Any], timeout: float) -> dict[str, Any]:
+        """
+        Send a JSON-RPC request and wait for its response.
+        
+        Notifications that arrive in between (late diagnostics, progress)
+        are skipped.
+        """
+        await conn.send(payload)
+        loop = asyncio.get_running_loop()
+        give_up_at = loop.time() + timeout
+        while True:
+            data = await conn.recv(timeout=max(0.0, give_up_at - loop.time()))
+            if data.get("id") == payload["id"] and "method" not in data:
+                return data
+    
+    async def _initialize(self, conn: LeanConnection, deadline: Deadline) -> dict[str, Any]:
+        """Run the LSP initialize handshake, similar to how lean4web does it."""
+        init_request = {
+            "jsonrpc": "2.0",
+            "id": self._next_id(),
+            "method": "initialize",
+            "params": {
+                "processId": None,
+                "clientInfo": {"name": "lean-visualizer"},
+                "rootUri": None,
+                "capabilities": {}
+            }
+        }
+        init_response = await self._request(conn, init_request, timeout=deadline.budget(10))
+        conn.initialize = init_response
+        
+        initialized_notification = {
+            "jsonrpc": "2.0",
+            "method": "initialized",
+            "params": {}
+        }
+        await conn.send(initialized_notification)
+        return init_response
+    
+    async def _wait_for_elaboration(
+        self,
+        conn: LeanConnection,
+        version: int,
+        result: dict[str, Any],
+        deadline: Deadline,
+    ) -> bool:
+        """
+        Collect diagnostics until Lean reports the document as processed.
         
+        Only what the router uses is kept: each publishDiagnostics replaces
+        the document's diagnostics (LSP sends the full set every time), in
+        compacted form; everything else is dropped once its method is
+        known. Messages about other versions of the document (left over
+        from an earlier edit on a reused connection) are ignored. Returns
+        False if the deadline passed first.
+        
+        Progress reports are kept as `[seconds since the update, first line
+        still processing]` pairs (0-indexed, None once done), one per change
+        of line, for estimating per-tactic elaboration time.
+        """
+        started = time.perf_counter()
+        progress = result["progress"]
+        while not deadline.expired:
+            try:
+                data = await conn.recv(timeout=deadline.budget(2.0))
+            except asyncio.TimeoutError:
+                # No more messages, we're probably done
+                return not deadline.expired
+            
+            method = data.get("method")
+            params = data.get("params", {})
+            
+            # Handle diagnostic notifications
+            if method == "textDocument/publishDiagnostics":
+                if params.get("version", version) != version:
+                    continue
+                diagnostics = params.get("diagnostics", [])
+                result["success"] = not any(d.get("severity") == 1 for d in diagnostics)  # 1 = Error in LSP
+                result["diagnostics"] = compact_diagnostics(
+                    diagnostics,
+                    self.settings.lean_max_diagnostics,
+                    self.settings.lean_max_diagnostic_chars,
+                )
+            
+            # If we see the $/lean/fileProgress complete, we're done
+            elif method == "$/lean/fileProgress":
+                if params.get("textDocument", {}).get("version", version) != version:
+                    continue
+                processing = params.get("processing", [])
+                line = min((p["range"]["start"]["line"] for p in processing if "range" in p), default=None)
+                if not progress or progress[-1][1] != line:
+                    progress.append([round(time.perf_counter() - started, 4), line])
+                if not processing:  # Empty means done processing
+                    return True
+        
+        return False
+    
+    async def _query_goals(
+        self,
+        conn: LeanConnection,
+        doc_uri: str,
+        code: str,
+        result: dict[str, Any],
+        deadline: Deadline,
+        known_lines: frozenset[int],
+    ) -> None:
+        """
+        Ask Lean for the goal state at each position where a tactic starts,
+        except on known lines.
+        
+        Goals come from the interactive goals RPC where the server has it:
+        each with its own context, case tag and metavariable id, under
+        "structured". Otherwise (or if a call fails) `$/lean/plainGoal`
+        answers with rendered text only.
+        """
+        tactic_positions = [(line, col) for line, col in find_tactic_positions(code) if line not in known_lines]
+        session_id = await self._rpc_session(conn, doc_uri, deadline) if tactic_positions else None
+        
+        for line, col in tactic_positions[:10]:  # Limit to 10 positions
+            if deadline.expired:
+                break
+            request = goal_request(self._next_id(), doc_uri, line, col, session_id)
+            try:
+                data = await self._request(conn, request, timeout=deadline.budget(2.0))
+                interactive = session_id is not None and "error" not in data
+                if session_id is not None and "error" in data:
+                    # Ask for plain text instead; from now on if the server lacks the method
+                    if data["error"].get("code") == METHOD_NOT_FOUND:
+                        self._plain_goal_endpoints.add(conn.endpoint_url)
+                        session_id = None
+                    request = goal_request(self._next_id(), doc_uri, line, col, None)
+                    data = await self._request(conn, request, timeout=deadline.budget(2.0))
+            except asyncio.TimeoutError:
+                LEAN_GOAL_QUERIES.inc(result="timeout")
+                continue
+            
+            if "result" in data and data["result"]:
+                LEAN_GOAL_QUERIES.inc(result="hit")
+                goal_info = data["result"]
+                entry = {
+                    "line": line + 1,  # Convert to 1-indexed
+                    "column": col + 1,
+                }
+                if interactive:
+                    LEAN_GOAL_FORMATS.inc(format="interactive")
+                    structured = interactive_goals(goal_info)
+                    entry["goals"] = [g["type"] for g in structured]
+                    entry["rendered"] = render_goals(structured)
+                    entry["structured"] = structured
+                else:
+                    LEAN_GOAL_FORMATS.inc(format="plain")
+                    entry["goals"] = goal_info.get("goals", [])
+                    entry["rendered"] = goal_info.get("rendered") or str(goal_info)
+                result["goals"].append(entry)
+            else:
+                LEAN_GOAL_QUERIES.inc(result="empty")
+    
+    async def _rpc_session(self, conn: LeanConnection, doc_uri: str, deadline: Deadline) -> Any | None:
+        """
+        Open an RPC session on the document for interactive goals, or return
+        None when the server doesn't offer one. The session isn't kept
+        alive; Lean drops it shortly after the goal queries.
+        """
+        if not self.settings.lean_interactive_goals or conn.endpoint_url in self._plain_goal_endpoints:
+            return None
+        request = {
+            "jsonrpc": "2.0",
+            "id": self._next_id(),
+            "method": "$/lean/rpc/connect",
+            "params": {"uri": doc_uri},
+        }
+        try:
+            data = await self._request(conn, request, timeout=deadline.budget(2.0))
+        except asyncio.TimeoutError:
+            return None
+        session_id = (data.get("result") or {}).get("sessionId")
+        if session_id is None and (data.get("error") or {}).get("code") == METHOD_NOT_FOUND:
+            self._plain_goal_endpoints.add(conn.endpoint_url)
+        return session_id
+    
+    async def _analyze_on(
+        self,
+        endpoint: LeanEndpoint,
+        code: str,
+        deadline: Deadline,
+        known_lines: frozenset[int],
+    ) -> dict[str, Any]:
+        """
+        Run one Lean session against a single endpoint.
+        
+        Connection and protocol errors propagate so the pool can trip the
+        endpoint's circuit breaker and fail over.
+        """
+        doc_uri = "file:///untitled.lean"
+        
+        phase_started = time.perf_counter()
+        async with self._connect(endpoint, deadline) as ws:
+            conn = LeanConnection(ws, endpoint.url)
+            conn.budget = MessageBudget.from_settings()
+            phase_started = _end_phase("connect", phase_started)
+            
+            await self._initialize(conn, deadline)
+            phase_started = _end_phase("initialize", phase_started)
+            
+            update = did_open(doc_uri, code, version=1)
+            result = await self._collect(conn, doc_uri, code, update, 1, deadline, known_lines)
+            await self._check_toolchain(conn, endpoint, deadline)
+            result["endpoint"] = endpoint.url
+            result["toolchain"] = endpoint.toolchain
+            
+            if not conn.ws.close_code:
+                await conn.send(did_close(doc_uri))
+        
+        return result
+    
+    async def _collect(
+        self,
+        conn: LeanConnection,
+        doc_uri: str,
+        code: str,
+        update: dict[str, Any],
+        version: int,
+        deadline: Deadline,
+        known_lines: frozenset[int] = frozenset(),
+    ) -> dict[str, Any]:
+        """
+        Send a document update, wait for Lean to elaborate it and query the
+        goals.
+        
+        When Lean sends more than the analysis's message budget allows,
+        the result so far is returned as incomplete instead of failing the
+        session (the endpoint itself is healthy).
+        """
+        result = _new_result()
+        elaborated = False
+        if self.settings.lean_record_dir:
+            conn.recorder = SessionRecorder(self.settings.lean_record_dir, conn.endpoint_url, conn.initialize)
+        phase_started = time.perf_counter()
+        try:
+            await conn.send(update)
+            elaborated = await self._wait_for_elaboration(conn, version, result, deadline)
+            phase_started = _end_phase("elaboration", phase_started)
+            
+            await self._query_goals(conn, doc_uri, code, result, deadline, known_lines)
+            _end_phase("goals", phase_started)
+        except UpstreamLimitExceeded as e:
+            LEAN_LIMITS_HIT.inc(limit=e.limit)
+            result["diagnostics"].append({"message": f"{e}; results are partial", "severity": 2})
+            elaborated = False
+        finally:
+            if conn.budget is not None:
+                LEAN_RECEIVED_BYTES.observe(conn.budget.bytes)
+            recorder, conn.recorder = conn.recorder, None
+        
+        if recorder is not None:
+            await asyncio.to_thread(recorder.write)
+        result["complete"] = elaborated and not deadline.expired
+        return result
+    
+    async def _check_toolchain(self, conn: LeanConnection, endpoint: LeanEndpoint, deadline: Deadline) -> None:
+        """
+        Ask the endpoint for its Lean version and commit, on the session's
+        own connection, when it hasn't been asked for
+        `lean_toolchain_check_interval` seconds. `serverInfo.version` is
+        the protocol's, not the toolchain's, so a one-line document
+        evaluates `Lean.versionString` instead. Failing to get an answer
+        leaves the previous one.
+        """
+        checked_at = endpoint.toolchain_checked_at
+        if checked_at is not None and time.monotonic() - checked_at < self.settings.lean_toolchain_check_interval:
+            return
+        if get_replay_store() is not None or conn.ws.close_code or deadline.expired:
+            return
+        await conn.send(did_open(TOOLCHAIN_URI, TOOLCHAIN_CODE, version=1))
+        try:
+            while True:
+                data = await conn.recv(timeout=deadline.budget(2.0))
+                params = data.get("params", {})
+                if data.get("method") != "textDocument/publishDiagnostics" or params.get("uri") != TOOLCHAIN_URI:
+                    continue
+                # The #eval output is the document's only information message
+                info = [d.get("message", "") for d in params.get("diagnostics", []) if d.get("severity") == 3]
+                if info:
+                    endpoint.toolchain = info[0].strip().strip('"')
+                    endpoint.toolchain_checked_at = time.monotonic()
+                    return
+        except (asyncio.TimeoutError, UpstreamLimitExceeded, WebSocketException):
+            return
+        finally:
+            if not conn.ws.close_code:
+                await conn.send(did_close(TOOLCHAIN_URI))
+
+
+    async def open_warm_document(self, endpoint: LeanEndpoint, header: str, deadline: Deadline) -> "WarmDocument":
+        """Open a long-lived document containing only `header` and let Lean elaborate it."""
+        conn = LeanConnection(await self._connect(endpoint, deadline), endpoint.url)
+        uri = f"file:///warm-{next(_warm_document_ids)}.lean"
+        try:
+            await self._initialize(conn, deadline)
+            await conn.send(did_open(uri, header, version=1))
+            await self._wait_for_elaboration(conn, 1, _new_result(), deadline)
+            await self._check_toolchain(conn, endpoint, deadline)
+        except BaseException:
+            await conn.close()
+            raise
+        return WarmDocument(self, endpoint, conn, uri)
+
+
+class WarmDocument:
+    """
+    A Lean document kept open with its header already elaborated.
+    
+    Each analysis replaces the whole text with didChange; Lean keeps the
+    header snapshot because that prefix is unchanged and only re-elaborates
+    the rest.
+    """
+    
+    def __init__(self, client: Lean4WebClient, endpoint: LeanEndpoint, conn: LeanConnection, uri: str):
+        self.client = client
+        self.endpoint = endpoint
+        self.conn = conn
+        self.uri = uri
+        self.version = 1
+        self.lock = asyncio.Lock()
+    
+    async def analyze(self, code: str, deadline: Deadline, known_lines: frozenset[int] = frozenset()) -> dict[str, Any]:
+        """Analyze `code`, whose header matches this document's."""
+        self.version += 1
+        self.conn.budget = MessageBudget.from_settings()
+        update = did_change(self.uri, code, self.version)
+        result = await self.client._collect(self.conn, self.uri, code, update, self.version, deadline, known_lines)
+        # The connection's Lean process, and so its toolchain, is the one checked when it opened
+        result["endpoint"] = self.endpoint.url
+        result["toolchain"] = self.endpoint.toolchain
         return result
+    
+    async def close(self) -> None:
+        try:
+            await self.conn.close()
+        except Exception:
+            pass
+
+
+def did_open(uri: str, text: str, version: int) -> dict[str, Any]:
+    """textDocument/didOpen notification for a Lean document."""
+    return {
+        "jsonrpc": "2.0",
+        "method": "textDocument/didOpen",
+        "params": {
+            "textDocument": {
+                "uri": uri,
+                "languageId": "lean4",
+                "version": version,
+                "text": text
+            }
+        }
+    }
+
+
+def did_close(uri: str) -> dict[str, Any]:
+    """textDocument/didClose notification."""
+    return {
+        "jsonrpc": "2.0",
+        "method": "textDocument/didClose",
+        "params": {"textDocument": {"uri": uri}}
+    }
+
+
+def did_change(uri: str, text: str, version: int) -> dict[str, Any]:
+    """textDocument/didChange notification replacing the whole document."""
+    return {
+        "jsonrpc": "2.0",
+        "method": "textDocument/didChange",
+        "params": {
+            "textDocument": {"uri": uri, "version": version},
+            "contentChanges": [{"text": text}]
+        }
+    }
+
+
+def goal_request(request_id: int, uri: str, line: int, character: int, session_id: Any | None) -> dict[str, Any]:
+    """Request for the goals at a position: interactive within an RPC session, plain text otherwise."""
+    position = {"textDocument": {"uri": uri}, "position": {"line": line, "character": character}}
+    if session_id is None:
+        return {"jsonrpc": "2.0", "id": request_id, "method": "$/lean/plainGoal", "params": position}
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "method": "$/lean/rpc/call",
+        "params": {
+            **position,
+            "sessionId": session_id,
+            "method": "Lean.Widget.getInteractiveGoals",
+            "params": position,
+        },
+    }
+
+
+def flatten_tagged_text(tagged: Any) -> str:
+    """
+    Plain text of a TaggedText tree (`{"text"}`, `{"append": [...]}` or
+    `{"tag": [info, child]}`). Iterative, since large terms nest deeply.
+    """
+    parts = []
+    stack = [tagged]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        if "text" in node:
+            parts.append(node["text"])
+        elif "append" in node:
+            stack.extend(reversed(node["append"]))
+        elif "tag" in node:
+            stack.append(node["tag"][1])
+    return "".join(parts)
+
+
+def interactive_goals(result: dict[str, Any]) -> list[dict[str, Any]]:
+    """
+    The goals from a getInteractiveGoals result, without the widget
+    annotations: type, case tag, metavariable id and context of each.
+    Hypotheses keep Lean's grouping (`a b : ℕ` has two names).
+    """
+    return [
+        {
+            "type": flatten_tagged_text(goal.get("type")),
+            "user_name": goal.get("userName"),
+            "mvar_id": goal.get("mvarId"),
+            "hyps": [
+                {
+                    "names": hyp.get("names", []),
+                    "type": flatten_tagged_text(hyp.get("type")),
+                    "value": flatten_tagged_text(hyp["val"]) if hyp.get("val") else None,
+                }
+                for hyp in goal.get("hyps", [])
+            ],
+        }
+        for goal in result.get("goals", [])
+    ]
+
+
+def render_goals(goals: list[dict[str, Any]]) -> str:
+    """Interactive goals rendered as plainGoal would."""
+    if not goals:
+        return "no goals"
+    blocks = []
+    for goal in goals:
+        lines = [f"case {goal['user_name']}"] if goal["user_name"] else []
+        for hyp in goal["hyps"]:
+            value = f" := {hyp['value']}" if hyp["value"] else ""
+            lines.append(f"{' '.join(hyp['names'])} : {hyp['type']}{value}")
+        lines.append(f"⊢ {goal['type']}")
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+def _new_result() -> dict[str, Any]:
+    return {
+        "diagnostics": [],
+        "goals": [],
+        "progress": [],
+        "success": True,
+        "complete": True,
+    }
+
+
+def compact_diagnostics(diagnostics: list[dict[str, Any]], max_count: int, max_chars: int) -> list[dict[str, Any]]:
+    """
+    Keep the fields of Lean diagnostics the router uses, errors first, with
+    at most `max_count` entries and messages cut to `max_chars`.
+    """
+    ordered = sorted(diagnostics, key=lambda d: d.get("severity", 4))[:max_count]
+    compact = []
+    for diag in ordered:
+        message = diag.get("message", "")
+        if len(message) > max_chars:
+            message = message[:max_chars] + "…"
+        entry = {"severity": diag.get("severity"), "message": message}
+        if "range" in diag:
+            entry["range"] = diag["range"]
+        compact.append(entry)
+    return compact
+
+
+def _end_phase(phase: str, started: float) -> float:
+    """Record the duration of a session phase and return the next phase's start."""
+    now = time.perf_counter()
+    LEAN_PHASE_SECONDS.observe(now - started, phase=phase)
+    trace = current_trace()
+    if trace is not None:
+        trace.add_span(f"lean.{phase}", started, now)
+    return now
+
+
+def _failed_result(message: str, severity: int) -> dict[str, Any]:
+    """Result for a session that could not be completed on any endpoint."""
+    result = _new_result()
+    result["diagnostics"].append({"message": message, "severity": severity})
+    # A timeout is reported as a warning, like a slow but healthy server
+    result["success"] = severity != 1
+    result["complete"] = False
+    return result
 
 
 def find_tactic_positions(code: str) -> list[tuple[int, int]]:
@@ -262,6 +835,12 @@ def parse_goal_state(goal_text: str) -> tuple[list[str], list[str]]:
     return hypotheses, goals
 
 
+REGISTRY.gauge(
+    "lean_warm_documents", "Warm header documents currently open",
+    callback=lambda: len(_client.warm_headers._docs) if _client and _client.warm_headers else 0,
+)
+
+
 # Singleton instance
 _client: Lean4WebClient | None = None
 
@@ -0,0 +1,168 @@
+"""
+Per-Request Resource Limits
+
+Guards the analysis pipeline against pathological inputs. Sources over
+`max_source_bytes` are rejected before any work is done. Everything else
+is enforced while the timeline is built, by an AnalysisBudget that
+truncates instead of failing: steps past `max_tactic_steps` are dropped,
+proof states keep at most `max_goals_per_state` goals and
+`max_hypotheses_per_state` hypotheses, and steps stop being added once
+the estimated response size reaches `max_response_bytes` or the CPU time
+spent on the steps reaches `max_analysis_cpu_seconds`. The timeline lists
+the limits that cut it short in `truncated`.
+
+A limit of 0 disables it.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from ..config import get_settings
+from ..models import AnalyzeResponse, ProofState, TacticStep
+from .metrics import REGISTRY
+
+
+LIMITS_HIT = REGISTRY.counter(
+    "analysis_limits_total", "Analyses rejected or truncated by a per-request limit", ("limit",)
+)
+
+# Rough JSON overhead of a step besides its texts (field names, ids, flags)
+STEP_OVERHEAD_BYTES = 400
+ITEM_OVERHEAD_BYTES = 60
+
+
+class SourceTooLarge(Exception):
+    """The submitted source is over `max_source_bytes`."""
+
+    def __init__(self, size: int, maximum: int):
+        self.size = size
+        self.maximum = maximum
+        super().__init__(f"Source is {size} bytes; at most {maximum} bytes can be analyzed")
+
+    def detail(self) -> dict:
+        """Body of the 413 response."""
+        return {"limit": "source_bytes", "max": self.maximum, "actual": self.size, "message": str(self)}
+
+
+def check_source(code: str) -> None:
+    """Raise SourceTooLarge unless the source is within the configured size."""
+    maximum = get_settings().max_source_bytes
+    size = len(code.encode())
+    if maximum and size > maximum:
+        LIMITS_HIT.inc(limit="source_bytes")
+        raise SourceTooLarge(size, maximum)
+
+
+def state_bytes(state: ProofState) -> int:
+    """Approximate serialized size of a proof state."""
+    hypotheses = (*state.hypotheses, *(h for g in state.goals for h in g.hypotheses or ()))
+    return (
+        sum(len(g.type) + ITEM_OVERHEAD_BYTES for g in state.goals)
+        + sum(len(h.name) + len(h.type) + ITEM_OVERHEAD_BYTES for h in hypotheses)
+    )
+
+
+def response_bytes(response: AnalyzeResponse) -> int:
+    """Approximate serialized size of an analysis response."""
+    timeline = response.timeline
+    if timeline is None:
+        return 0
+    return len(timeline.source_code) + sum(
+        STEP_OVERHEAD_BYTES + state_bytes(step.state_before) + 2 * state_bytes(step.state_after)
+        for step in timeline.steps
+    )
+
+
+class AnalysisBudget:
+    """The limits of one analysis and what it has used of them so far."""
+
+    def __init__(
+        self,
+        max_steps: int,
+        max_goals: int,
+        max_hypotheses: int,
+        max_bytes: int,
+        max_cpu_seconds: float,
+    ):
+        self.max_steps = max_steps
+        self.max_goals = max_goals
+        self.max_hypotheses = max_hypotheses
+        self.max_bytes = max_bytes
+        self.max_cpu_seconds = max_cpu_seconds
+        self.bytes = 0
+        self.cpu_seconds = 0.0
+        # Limits that cut the timeline short, in the order they were hit
+        self.truncated: list[str] = []
+
+    @classmethod
+    def from_settings(cls) -> "AnalysisBudget":
+        settings = get_settings()
+        return cls(
+            settings.max_tactic_steps,
+            settings.max_goals_per_state,
+            settings.max_hypotheses_per_state,
+            settings.max_response_bytes,
+            settings.max_analysis_cpu_seconds,
+        )
+
+    @property
+    def aborted(self) -> bool:
+        """Whether the CPU limit stopped the analysis; such results depend on load and aren't kept."""
+        return "cpu" in self.truncated
+
+    def _hit(self, limit: str) -> None:
+        if limit not in self.truncated:
+            self.truncated.append(limit)
+            LIMITS_HIT.inc(limit=limit)
+
+    def clip_steps(self, positions: list) -> list:
+        if self.max_steps and len(positions) > self.max_steps:
+            self._hit("steps")
+            return positions[:self.max_steps]
+        return positions
+
+    def clip_state(self, state: ProofState) -> ProofState:
+        goals, hypotheses = state.goals, state.hypotheses
+        if self.max_goals and len(goals) > self.max_goals:
+            self._hit("goals")
+            goals = goals[:self.max_goals]
+        if self.max_hypotheses and len(hypotheses) > self.max_hypotheses:
+            self._hit("hypotheses")
+            hypotheses = hypotheses[:self.max_hypotheses]
+        if self.max_hypotheses and any(len(g.hypotheses or ()) > self.max_hypotheses for g in goals):
+            self._hit("hypotheses")
+            goals = [
+                g.model_copy(update={"hypotheses": g.hypotheses[:self.max_hypotheses]}) if g.hypotheses else g
+                for g in goals
+            ]
+        if goals is state.goals and hypotheses is state.hypotheses:
+            return state
+        return ProofState(goals=goals, hypotheses=hypotheses)
+
+    @contextmanager
+    def cpu(self) -> Iterator[None]:
+        """
+        Count the CPU time of a block against the budget. Wrap only code
+        that doesn't await, so other requests' work isn't counted.
+        """
+        started = time.thread_time()
+        try:
+            yield
+        finally:
+            self.cpu_seconds += time.thread_time() - started
+
+    def admit(self, step: TacticStep) -> bool:
+        """Charge a built step; False when it would go over the budget and must be left out."""
+        if self.max_cpu_seconds and self.cpu_seconds > self.max_cpu_seconds:
+            self._hit("cpu")
+            return False
+        size = (
+            STEP_OVERHEAD_BYTES + len(step.tactic) + len(step.explanation or "") + len(step.error or "")
+            + state_bytes(step.state_before) + 2 * state_bytes(step.state_after)
+        )
+        if self.max_bytes and self.bytes + size > self.max_bytes:
+            self._hit("response_bytes")
+            return False
+        self.bytes += size
+        return True
@@ -0,0 +1,228 @@
+"""
+Prometheus Metrics
+
+Minimal in-process metrics registry rendered in the Prometheus text
+exposition format. Recording a sample is a dict lookup plus an addition,
+so instrumentation can stay on in production.
+"""
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterator, Union
+
+
+LabelValues = tuple[str, ...]
+# A gauge callback returns either a single value or a value per label set
+GaugeCallback = Callable[[], Union[float, dict[LabelValues, float]]]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Base class for a named metric family with optional labels."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing count."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    """Value that can go up and down, or be read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), callback: GaugeCallback | None = None):
+        super().__init__(name, help, labels)
+        self._values: dict[LabelValues, float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels: str) -> Iterator[None]:
+        """Count the enclosed block as in flight."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self) -> Iterator[str]:
+        values = self._values
+        if self._callback is not None:
+            try:
+                result = self._callback()
+            except Exception:
+                return
+            values = result if isinstance(result, dict) else {(): result}
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    """Distribution of observations over fixed buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket..., overflow count, sum]
+        self._values: dict[LabelValues, list[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [0.0] * (len(self.buckets) + 2)
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the wall-clock duration of the enclosed block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> Iterator[str]:
+        for key, entry in self._values.items():
+            cumulative = 0.0
+            for bound, count in zip((*self.buckets, float("inf")), entry):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {_format_value(cumulative)}"
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {_format_value(entry[-1])}"
+            yield f"{self.name}_count{labels} {_format_value(cumulative)}"
+
+
+class Registry:
+    """Collection of metrics exposed together on /metrics."""
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: tuple[str, ...] = (), callback: GaugeCallback | None = None) -> Gauge:
+        return self.register(Gauge(name, help, labels, callback))
+
+    def histogram(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+# Lean session (analyze_code)
+LEAN_PHASE_SECONDS = REGISTRY.histogram(
+    "lean_phase_seconds", "Time spent in each phase of a Lean session", ("phase",)
+)
+LEAN_UPSTREAM_ERRORS = REGISTRY.counter(
+    "lean_upstream_errors_total", "Lean sessions that failed, by error kind", ("kind",)
+)
+LEAN_UPSTREAM_TIMEOUTS = REGISTRY.counter(
+    "lean_upstream_timeouts_total", "Lean sessions that timed out waiting for the server"
+)
+LEAN_GOAL_QUERIES = REGISTRY.counter(
+    "lean_goal_queries_total", "Goal queries sent to Lean, by outcome (hit, empty, timeout)", ("result",)
+)
+LEAN_GOAL_FORMATS = REGISTRY.counter(
+    "lean_goal_formats_total", "Goal states received from Lean, by format (interactive, plain)", ("format",)
+)
+
+# Analysis pipeline (analyze_proof)
+ANALYSIS_PHASE_SECONDS = REGISTRY.histogram(
+    "analysis_phase_seconds", "Time spent in each phase of a proof analysis", ("phase",)
+)
+ANALYSIS_STEPS = REGISTRY.counter(
+    "analysis_steps_total", "Timeline steps built, by where the state came from (lean, cache, simulated)", ("source",)
+)
+ANALYSIS_CANCELLATIONS = REGISTRY.counter(
+    "analysis_cancellations_total", "Analyses cancelled before finishing, by reason (deadline, disconnect)", ("reason",)
+)
+ANALYSES_IN_FLIGHT = REGISTRY.gauge(
+    "analyses_in_flight", "Proof analyses currently running"
+)
+REQUEST_BYTES = REGISTRY.histogram(
+    "analysis_request_bytes", "Size of submitted Lean source", buckets=BYTES_BUCKETS
+)
+RESPONSE_BYTES = REGISTRY.histogram(
+    "analysis_response_bytes", "Size of serialized analysis responses", buckets=BYTES_BUCKETS
+)
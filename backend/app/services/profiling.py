@@ -0,0 +1,148 @@
+"""
+Request Profiling
+
+Collects a per-request timing trace (phase spans, upstream JSON-RPC
+messages, per-step costs) and optionally samples the event loop thread into
+folded stacks for a flame graph. The active trace lives in a context
+variable, so instrumented code only pays a lookup when profiling is off.
+"""
+
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+
+from ..models import ProfileTrace, TraceSpan, TraceMessage, StepTiming
+from .metrics import Histogram
+
+
+class RequestTrace:
+    """Timing trace of one analysis request."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans: list[TraceSpan] = []
+        self.messages: list[TraceMessage] = []
+        self.steps: list[StepTiming] = []
+        self.flamegraph: str | None = None
+        self._sent_at: dict[Any, float] = {}
+
+    def _ms(self, t: float) -> float:
+        return round((t - self.origin) * 1000, 3)
+
+    def add_span(self, name: str, started: float, ended: float) -> None:
+        self.spans.append(TraceSpan(
+            name=name,
+            start_ms=self._ms(started),
+            duration_ms=round((ended - started) * 1000, 3),
+        ))
+
+    def add_message(self, direction: str, data: dict[str, Any], size: int) -> None:
+        now = time.perf_counter()
+        msg_id = data.get("id")
+        latency_ms = None
+        if msg_id is not None:
+            if direction == "send":
+                self._sent_at[msg_id] = now
+            elif msg_id in self._sent_at:
+                latency_ms = round((now - self._sent_at.pop(msg_id)) * 1000, 3)
+        self.messages.append(TraceMessage(
+            direction=direction,
+            method=data.get("method"),
+            id=msg_id,
+            at_ms=self._ms(now),
+            bytes=size,
+            latency_ms=latency_ms,
+        ))
+
+    def add_step(self, index: int, parse_seconds: float, diff_seconds: float, explain_seconds: float) -> None:
+        self.steps.append(StepTiming(
+            index=index,
+            parse_ms=round(parse_seconds * 1000, 3),
+            diff_ms=round(diff_seconds * 1000, 3),
+            explain_ms=round(explain_seconds * 1000, 3),
+        ))
+
+    def to_model(self) -> ProfileTrace:
+        return ProfileTrace(
+            total_ms=self._ms(time.perf_counter()),
+            spans=self.spans,
+            messages=self.messages,
+            steps=self.steps,
+            flamegraph=self.flamegraph,
+        )
+
+
+_current_trace: ContextVar[RequestTrace | None] = ContextVar("current_trace", default=None)
+
+
+def current_trace() -> RequestTrace | None:
+    """The trace of the request being handled, if it is being profiled."""
+    return _current_trace.get()
+
+
+@contextmanager
+def tracing(trace: RequestTrace) -> Iterator[RequestTrace]:
+    """Make `trace` the active trace for the enclosed block (and tasks it spawns)."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def phase(histogram: Histogram, name: str) -> Iterator[None]:
+    """Time a phase into `histogram` and, when profiling, into the trace."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        ended = time.perf_counter()
+        histogram.observe(ended - started, phase=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(name, started, ended)
+
+
+class StackSampler:
+    """
+    Sampling profiler for one thread, producing folded stacks.
+
+    Samples the target thread's Python stack from a background thread.
+    Other requests sharing the event loop show up in the samples too, so
+    flame graphs are most useful on a quiet instance.
+    """
+
+    def __init__(self, thread_id: int | None = None, interval: float = 0.005):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.samples: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> str:
+        """Stop sampling and return the folded stacks."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
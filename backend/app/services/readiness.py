@@ -0,0 +1,102 @@
+"""
+Startup and Readiness
+
+Tracks how long the process took to become useful after a cold start:
+importing the app, running the lifespan startup, and completing the first
+successful Lean session. Right after startup, a background task runs a
+trivial session on every Lean endpoint, which checks that it answers, and
+then opens warm documents for the `prewarm_headers`. Those stay open, so
+the first requests with a matching header reuse a connection whose Lean
+process has already started and elaborated the header. `GET /ready`
+reports the state: cold (no Lean session has succeeded yet), warming
+(the pre-warm is running) or warm, and how many warm documents the
+pre-warm opened.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any
+
+from .. import STARTED_AT
+from .deadline import Deadline
+from .metrics import REGISTRY
+
+
+logger = logging.getLogger(__name__)
+
+STARTUP_SECONDS = REGISTRY.gauge(
+    "startup_seconds", "Seconds from the first app import to each startup milestone", ("milestone",)
+)
+
+
+class Readiness:
+    """Startup milestones and warm/cold state of this worker."""
+
+    def __init__(self, started_at: float):
+        self.started_at = started_at
+        self.milestones: dict[str, float] = {}
+        self.state = "cold"
+        self.probe_error: str | None = None
+        self.warm_documents = 0
+
+    def mark(self, milestone: str) -> None:
+        """Record a milestone (imported, started, first_lean_session) the first time it is reached."""
+        if milestone not in self.milestones:
+            seconds = round(time.perf_counter() - self.started_at, 4)
+            self.milestones[milestone] = seconds
+            STARTUP_SECONDS.set(seconds, milestone=milestone)
+
+    def lean_session_succeeded(self) -> None:
+        self.mark("first_lean_session")
+        self.state = "warm"
+
+    async def prewarm(self, client, timeout: float, headers: list[str]) -> None:
+        """Check every Lean endpoint, then open warm documents for `headers`."""
+        if self.state == "warm":
+            return
+        self.state = "warming"
+        deadline = Deadline(timeout)
+        try:
+            warmed = await client.probe(deadline)
+        except Exception as e:
+            warmed = 0
+            self.probe_error = f"{type(e).__name__}: {e}"
+        if warmed and client.warm_headers is not None and headers:
+            self.warm_documents = await client.warm_headers.prewarm(headers, deadline)
+        if warmed:
+            self.lean_session_succeeded()
+        elif self.state == "warming":
+            self.state = "cold"
+            logger.warning("Lean pre-warm failed: %s", self.probe_error or "no endpoint answered")
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "state": self.state,
+            "uptime_seconds": round(time.perf_counter() - self.started_at, 1),
+            "startup_seconds": self.milestones,
+            "probe_error": self.probe_error,
+            "warm_documents": self.warm_documents,
+        }
+
+
+# Singleton instance
+_readiness: Readiness | None = None
+
+
+def get_readiness() -> Readiness:
+    """Get or create the readiness singleton."""
+    global _readiness
+    if _readiness is None:
+        _readiness = Readiness(STARTED_AT)
+    return _readiness
+
+
+async def run_prewarm(client, timeout: float, headers: list[str]) -> None:
+    """Background task body; never raises, so it can be fired and forgotten."""
+    try:
+        await get_readiness().prewarm(client, timeout, headers)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.exception("Lean pre-warm crashed")
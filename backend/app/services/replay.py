@@ -0,0 +1,328 @@
+"""
+Lean Session Record and Replay
+
+Recording captures every JSON-RPC message of an analysis (from the
+document update until the goals are collected) with its timing, into one
+gzipped JSONL trace per source. Replay stands in for the WebSocket to
+Lean and plays those traces back, in real time or compressed, so the
+pipeline can be benchmarked against a fixed corpus without network
+access.
+
+Trace format: the first line is a header
+`{"trace": 1, "key": <source hash>, "endpoint": ..., "initialize": ...}`,
+then one `{"t": <seconds since the update>, "dir": "send"|"recv", "msg": ...}`
+line per message.
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from typing import Any
+
+from ..config import get_settings
+from .metrics import REGISTRY
+from .result_store import source_hash
+
+
+logger = logging.getLogger(__name__)
+
+REPLAY_SESSIONS = REGISTRY.counter(
+    "lean_replay_sessions_total", "Document updates served from recorded traces (hit, miss)", ("outcome",)
+)
+
+TRACE_VERSION = 1
+TRACE_SUFFIX = ".jsonl.gz"
+
+
+def document_text(payload: dict[str, Any]) -> str | None:
+    """Full document text carried by a didOpen/didChange notification."""
+    method = payload.get("method")
+    params = payload.get("params", {})
+    if method == "textDocument/didOpen":
+        return params.get("textDocument", {}).get("text")
+    if method == "textDocument/didChange":
+        changes = params.get("contentChanges") or [{}]
+        return changes[-1].get("text")
+    return None
+
+
+class SessionRecorder:
+    """Collects the messages of one analysis and writes them as a trace file."""
+
+    def __init__(self, directory: str, endpoint: str, initialize: dict[str, Any] | None):
+        self.directory = directory
+        self.endpoint = endpoint
+        self.initialize = initialize
+        self.started = time.perf_counter()
+        self.key: str | None = None
+        self.events: list[dict[str, Any]] = []
+
+    def add(self, direction: str, payload: dict[str, Any]) -> None:
+        if self.key is None:
+            text = document_text(payload)
+            if text is not None:
+                self.key = source_hash(text)
+        self.events.append({
+            "t": round(time.perf_counter() - self.started, 6),
+            "dir": direction,
+            "msg": payload,
+        })
+
+    def write(self) -> str | None:
+        """Write the trace (blocking); returns its path, or None if there was no document update."""
+        if self.key is None:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, self.key + TRACE_SUFFIX)
+        header = {
+            "trace": TRACE_VERSION,
+            "key": self.key,
+            "endpoint": self.endpoint,
+            "recorded_at": time.time(),
+            "initialize": self.initialize,
+        }
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            for entry in (header, *self.events):
+                f.write(json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n")
+        os.replace(tmp, path)
+        return path
+
+
+def read_trace(path: str) -> tuple[dict[str, Any], list[dict[str, Any]]]:
+    """Header and events of a trace file."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines or lines[0].get("trace") != TRACE_VERSION:
+        raise ValueError(f"{path} is not a version {TRACE_VERSION} Lean trace")
+    return lines[0], lines[1:]
+
+
+class ReplayStore:
+    """Recorded traces by source hash, loaded lazily from a directory."""
+
+    def __init__(self, directory: str, speed: float):
+        self.directory = directory
+        # 1 replays with recorded timing, 10 ten times faster, 0 without delays
+        self.speed = speed
+        self._traces: dict[str, list[dict[str, Any]]] = {}
+        self._initialize: dict[str, Any] | None = None
+
+    def keys(self) -> list[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(n[: -len(TRACE_SUFFIX)] for n in os.listdir(self.directory) if n.endswith(TRACE_SUFFIX))
+
+    def trace(self, key: str) -> list[dict[str, Any]] | None:
+        """Recorded events for a source hash, or None; blocking, reads the file on first use."""
+        if key not in self._traces:
+            path = os.path.join(self.directory, key + TRACE_SUFFIX)
+            if not os.path.exists(path):
+                return None
+            header, events = read_trace(path)
+            self._traces[key] = events
+            self._initialize = self._initialize or header.get("initialize")
+        return self._traces[key]
+
+    def initialize_result(self) -> dict[str, Any]:
+        """Recorded result of the `initialize` request (blocking, like `trace`)."""
+        if self._initialize is None:
+            for key in self.keys():
+                self.trace(key)
+                if self._initialize is not None:
+                    break
+        return (self._initialize or {}).get("result") or {"capabilities": {}}
+
+    def connect(self, endpoint_url: str) -> "ReplayConnector":
+        return ReplayConnector(self)
+
+
+class ReplayConnector:
+    """Stand-in for `websockets.connect(...)`: awaitable and usable with `async with`."""
+
+    def __init__(self, store: ReplayStore):
+        self.store = store
+        self.ws: ReplayWebSocket | None = None
+
+    def __await__(self):
+        return self._open().__await__()
+
+    async def _open(self) -> "ReplayWebSocket":
+        return ReplayWebSocket(self.store)
+
+    async def __aenter__(self) -> "ReplayWebSocket":
+        self.ws = await self._open()
+        return self.ws
+
+    async def __aexit__(self, *exc) -> None:
+        await self.ws.close()
+
+
+class ReplayWebSocket:
+    """
+    Plays recorded traces back to the Lean client.
+
+    A document update selects the trace recorded for that text. Recorded
+    messages from Lean are released in order, each after the delay it
+    originally had (scaled by the store's speed) and never before the
+    client has sent the messages that preceded it. Request ids are mapped
+    from the recording to the client's current ones.
+    """
+
+    def __init__(self, store: ReplayStore):
+        self.store = store
+        self.close_code: int | None = None
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._events: list[dict[str, Any]] = []
+        self._cursor = 0
+        self._last_t = 0.0
+        self._last_at = 0.0
+        self._sent = asyncio.Event()
+        self._ids: dict[Any, Any] = {}
+        # Ids of recorded requests the client didn't make; their replies are dropped
+        self._skipped: set[Any] = set()
+        self._player: asyncio.Task | None = None
+
+    async def send(self, raw: str) -> None:
+        payload = json.loads(raw)
+        method = payload.get("method")
+        if method == "initialize":
+            # Traces are gzipped files; read them off the event loop
+            result = await asyncio.to_thread(self.store.initialize_result)
+            self._queue.put_nowait(json.dumps({"jsonrpc": "2.0", "id": payload["id"], "result": result}))
+            return
+
+        text = document_text(payload)
+        if text is not None:
+            await self._start(payload, text)
+            return
+
+        if "id" in payload:
+            if not self._match_request(payload):
+                # Not in the recording (the client asks differently now)
+                self._queue.put_nowait(json.dumps({"jsonrpc": "2.0", "id": payload["id"], "result": None}))
+        self._sent.set()
+
+    async def _start(self, payload: dict[str, Any], text: str) -> None:
+        if self._player is not None:
+            self._player.cancel()
+        events = await asyncio.to_thread(self.store.trace, source_hash(text))
+        version = payload["params"]["textDocument"].get("version")
+        if events is None:
+            REPLAY_SESSIONS.inc(outcome="miss")
+            logger.warning("No recorded Lean session for %s; replaying an empty elaboration", source_hash(text))
+            events = _empty_elaboration(payload["params"]["textDocument"]["uri"], version)
+        else:
+            REPLAY_SESSIONS.inc(outcome="hit")
+            events = [_with_version(e, version) for e in events]
+        # The first recorded event is the update the client just sent
+        self._events = events
+        self._cursor = 1 if events and events[0]["dir"] == "send" else 0
+        self._last_t = events[0]["t"] if events else 0.0
+        self._last_at = time.monotonic()
+        self._ids = {}
+        self._skipped = set()
+        self._player = asyncio.create_task(self._play())
+
+    def _match_request(self, payload: dict[str, Any]) -> bool:
+        """
+        Pair a client request with the next recorded request, if that has
+        the same method.
+        
+        Otherwise the recorded request is skipped, so the playback doesn't
+        wait for a request the client won't make.
+        """
+        for i in range(self._cursor, len(self._events)):
+            event = self._events[i]
+            if event["dir"] != "send" or "id" not in event["msg"] or event.get("sent"):
+                continue
+            event["sent"] = True
+            if event["msg"].get("method") != payload.get("method"):
+                self._skipped.add(event["msg"]["id"])
+                return False
+            self._ids[event["msg"]["id"]] = payload["id"]
+            return True
+        return False
+
+    async def _play(self) -> None:
+        while self._cursor < len(self._events):
+            event = self._events[self._cursor]
+            if event["dir"] == "send":
+                if "id" in event["msg"] and not event.get("sent"):
+                    # Lean's reply can't come before the client's request
+                    self._sent.clear()
+                    await self._sent.wait()
+                    continue
+                self._advance(event, time.monotonic())
+                continue
+
+            if self.store.speed > 0:
+                due = self._last_at + (event["t"] - self._last_t) / self.store.speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            msg = event["msg"]
+            if "id" in msg and "method" not in msg:
+                if msg["id"] in self._skipped:
+                    self._advance(event, time.monotonic())
+                    continue
+                msg = {**msg, "id": self._ids.get(msg["id"], msg["id"])}
+            self._queue.put_nowait(json.dumps(msg))
+            self._advance(event, max(time.monotonic(), self._last_at))
+
+    def _advance(self, event: dict[str, Any], at: float) -> None:
+        self._cursor += 1
+        self._last_t = event["t"]
+        self._last_at = at
+
+    async def recv(self) -> str:
+        return await self._queue.get()
+
+    async def close(self) -> None:
+        if self._player is not None:
+            self._player.cancel()
+        self.close_code = 1000
+
+
+def _with_version(event: dict[str, Any], version: int | None) -> dict[str, Any]:
+    """Point a recorded notification at the document version being replayed."""
+    msg = event["msg"]
+    params = msg.get("params")
+    if event["dir"] != "recv" or not isinstance(params, dict):
+        return dict(event)
+    params = dict(params)
+    if "version" in params:
+        params["version"] = version
+    if isinstance(params.get("textDocument"), dict) and "version" in params["textDocument"]:
+        params["textDocument"] = {**params["textDocument"], "version": version}
+    return {**event, "msg": {**msg, "params": params}}
+
+
+def _empty_elaboration(uri: str, version: int | None) -> list[dict[str, Any]]:
+    """Events of a document that elaborates instantly without diagnostics."""
+    return [
+        {"t": 0.0, "dir": "recv", "msg": {
+            "jsonrpc": "2.0", "method": "textDocument/publishDiagnostics",
+            "params": {"uri": uri, "version": version, "diagnostics": []},
+        }},
+        {"t": 0.0, "dir": "recv", "msg": {
+            "jsonrpc": "2.0", "method": "$/lean/fileProgress",
+            "params": {"textDocument": {"uri": uri, "version": version}, "processing": []},
+        }},
+    ]
+
+
+# Singleton instance
+_store: ReplayStore | None = None
+
+
+def get_replay_store() -> ReplayStore | None:
+    """Get the replay store, or None when replay is not enabled."""
+    global _store
+    settings = get_settings()
+    if _store is None and settings.lean_replay_dir:
+        _store = ReplayStore(settings.lean_replay_dir, settings.lean_replay_speed)
+    return _store
@@ -0,0 +1,310 @@
+"""
+Shared Result Store
+
+SQLite (WAL mode) store for analysis results that every worker process on
+a host can use. Workers coordinate through a lock table so only one of them
+computes a given source hash at a time; the others wait for its result.
+Size is kept under a disk budget by evicting least recently used entries,
+and SQLite's page cache and memory map are sized from a memory budget.
+"""
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, TypeVar
+
+from ..config import get_settings
+from .deadline import current_deadline
+from .metrics import REGISTRY
+
+
+T = TypeVar("T")
+
+STORE_LOOKUPS = REGISTRY.counter(
+    "result_store_lookups_total",
+    "Shared result store lookups (hit, miss, waited for another worker, coalesced in-process)",
+    ("namespace", "outcome"),
+)
+STORE_EVICTIONS = REGISTRY.counter(
+    "result_store_evictions_total", "Entries evicted from the shared result store to stay within budget"
+)
+
+# Bump when the analysis pipeline changes shape so stale timelines are not served
+PIPELINE_VERSION = "1"
+
+# How often a worker waiting on another worker's computation checks for the result
+LOCK_POLL_INTERVAL = 0.1
+
+# Entries are evicted down to this fraction of the disk budget
+EVICT_TO = 0.9
+
+# Don't rewrite the access time of hot entries on every read
+ACCESS_TOUCH_INTERVAL = 60.0
+
+# A compute lock outlives its request's deadline by this much, in case the
+# worker dies right at the end
+LOCK_TTL_MARGIN = 5.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE TABLE IF NOT EXISTS locks (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+
+def source_hash(code: str) -> str:
+    """Content hash identifying the analysis of a piece of Lean source."""
+    return hashlib.sha256(f"{PIPELINE_VERSION}\0{code}".encode()).hexdigest()
+
+
+class SharedResultStore:
+    """
+    Result store backed by a single SQLite database in WAL mode.
+
+    Blocking SQLite calls run one at a time on a dedicated thread with a
+    single connection, so the memory budget is spent once per worker.
+    """
+
+    def __init__(self, path: str, max_bytes: int, memory_bytes: int, lock_ttl: float):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self.lock_ttl = lock_ttl
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="result-store")
+        self._conn: sqlite3.Connection | None = None
+        self._inflight: dict[tuple[str, str], asyncio.Future] = {}
+        self._approx_bytes: int | None = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        The store's connection; only used on its thread. Opened, with the
+        schema, by the first operation, so creating the store doesn't block.
+        """
+        conn = self._conn
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            # Only takes effect on a new database, so it must come before
+            # anything writes the header; lets eviction shrink the file
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={int(self.memory_bytes)}")
+            # Negative cache_size is in KiB; give the page cache half the budget
+            conn.execute(f"PRAGMA cache_size={-max(1, self.memory_bytes // 2048)}")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return conn
+
+    async def _run(self, fn: Callable[..., T], *args: Any) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    # Blocking operations (run on the store's thread via _run)
+
+    def _get(self, namespace: str, key: str) -> bytes | None:
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value, accessed FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] > ACCESS_TOUCH_INTERVAL:
+            conn.execute(
+                "UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ?", (now, namespace, key)
+            )
+        return row[0]
+
+    def _put(self, namespace: str, key: str, value: bytes) -> None:
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (namespace, key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+            (namespace, key, value, len(value), now, now),
+        )
+        if self._approx_bytes is None:
+            self._approx_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        else:
+            self._approx_bytes += len(value)
+        if self._approx_bytes > self.max_bytes:
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Delete least recently used entries until under the disk budget."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        target = int(self.max_bytes * EVICT_TO)
+        if total > self.max_bytes:
+            excess = total - target
+            victims = []
+            for namespace, key, size in conn.execute(
+                "SELECT namespace, key, size FROM entries ORDER BY accessed"
+            ):
+                victims.append((namespace, key))
+                excess -= size
+                if excess <= 0:
+                    break
+            conn.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", victims)
+            STORE_EVICTIONS.inc(len(victims))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            # Give the freed pages back to the file system
+            conn.execute("PRAGMA incremental_vacuum")
+        self._approx_bytes = total
+
+    def _try_lock(self, key: str, ttl: float) -> bool:
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM locks WHERE key = ? AND expires < ?", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO locks (key, owner, expires) VALUES (?, ?, ?)",
+                (key, self.owner, now + ttl),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def _unlock(self, key: str) -> None:
+        self._connection().execute("DELETE FROM locks WHERE key = ? AND owner = ?", (key, self.owner))
+
+    # Async API
+
+    async def get(self, namespace: str, key: str) -> bytes | None:
+        return await self._run(self._get, namespace, key)
+
+    async def put(self, namespace: str, key: str, value: bytes) -> None:
+        await self._run(self._put, namespace, key, value)
+
+    async def compute_once(
+        self,
+        namespace: str,
+        key: str,
+        compute: Callable[[], Awaitable[bytes | None]],
+    ) -> bytes | None:
+        """
+        Return the stored value for `key`, computing it at most once per host.
+
+        Concurrent callers in this process share one computation; callers
+        in other processes wait for the worker holding the lock. `compute`
+        may return None for results that should not be stored.
+        """
+        flight_key = (namespace, key)
+        while (pending := self._inflight.get(flight_key)) is not None:
+            STORE_LOOKUPS.inc(namespace=namespace, outcome="coalesced")
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The computing request went away; take over
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[flight_key] = future
+        try:
+            value = await self._compute_once(namespace, key, compute)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark as retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            del self._inflight[flight_key]
+
+    async def _compute_once(
+        self,
+        namespace: str,
+        key: str,
+        compute: Callable[[], Awaitable[bytes | None]],
+    ) -> bytes | None:
+        lock_key = f"{namespace}:{key}"
+        waited = False
+        while True:
+            value = await self.get(namespace, key)
+            if value is not None:
+                STORE_LOOKUPS.inc(namespace=namespace, outcome="wait" if waited else "hit")
+                return value
+
+            if await self._run(self._try_lock, lock_key, self._lock_ttl()):
+                try:
+                    value = await self.get(namespace, key)
+                    if value is not None:
+                        STORE_LOOKUPS.inc(namespace=namespace, outcome="hit")
+                        return value
+                    STORE_LOOKUPS.inc(namespace=namespace, outcome="miss")
+                    value = await compute()
+                    if value is not None:
+                        await self.put(namespace, key, value)
+                    return value
+                finally:
+                    await self._run(self._unlock, lock_key)
+
+            # Another worker is computing it
+            deadline = current_deadline()
+            if deadline is not None and deadline.remaining() <= LOCK_POLL_INTERVAL:
+                STORE_LOOKUPS.inc(namespace=namespace, outcome="miss")
+                return await compute()
+            waited = True
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+
+    def _lock_ttl(self) -> float:
+        """
+        How long a compute lock is held at most: until the computing
+        request's deadline (it is cancelled then) or, outside a request,
+        the configured TTL.
+        """
+        deadline = current_deadline()
+        if deadline is None:
+            return self.lock_ttl
+        return deadline.remaining() + LOCK_TTL_MARGIN
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "path": self.path,
+            "approx_bytes": self._approx_bytes,
+            "max_bytes": self.max_bytes,
+            "computing": len(self._inflight),
+        }
+
+
+# Singleton instance
+_store: SharedResultStore | None = None
+
+
+def get_result_store() -> SharedResultStore | None:
+    """Get the shared result store, or None when it is not configured."""
+    global _store
+    settings = get_settings()
+    if _store is None and settings.shared_store_path:
+        _store = SharedResultStore(
+            settings.shared_store_path,
+            max_bytes=settings.shared_store_max_bytes,
+            memory_bytes=settings.shared_store_memory_bytes,
+            lock_ttl=settings.shared_store_lock_ttl,
+        )
+    return _store
@@ -0,0 +1,316 @@
+"""
+Timeline Search Index
+
+Inverted index over analyzed timelines: every step's tactic, hypotheses,
+goals and errors are tokenized into a SQLite FTS5 table as timelines are
+produced, so queries like `tactic:omega` or `goal:Finset.sum` return
+ranked step references without scanning stored JSON.
+
+Tokenization is Lean-aware: dotted names are indexed whole and by
+component (`Finset.sum`, `Finset`, `sum`), and operators such as `∧` or
+`∑` are indexed as terms of their own.
+"""
+
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Iterable
+
+from ..config import get_settings
+from ..models import ProofTimeline, SearchHit, TacticKindStats
+from .metrics import REGISTRY
+
+
+SEARCH_QUERIES = REGISTRY.histogram("search_query_seconds", "Time to answer a search query")
+SEARCH_INDEXED_STEPS = REGISTRY.counter("search_indexed_steps_total", "Timeline steps added to the search index")
+
+# Identifiers (with dotted namespaces and Lean's ' ! ? suffixes), numbers, or single symbols
+TOKEN = re.compile(r"[^\W\d][\w.'!?]*|\d+|[^\w\s]")
+# Punctuation that carries no meaning on its own
+IGNORED_SYMBOLS = set("()[]{},:;`\"⟨⟩")
+# Token added to the errors column of steps that failed, for filtering
+FAILED_MARKER = "__failed__"
+
+# Query fields and the index columns they search
+FIELDS = {
+    "tactic": "tactic",
+    "hyp": "hypotheses",
+    "hypothesis": "hypotheses",
+    "goal": "goals",
+    "error": "errors",
+}
+# bm25 weights for (tactic, hypotheses, goals, errors)
+COLUMN_WEIGHTS = (4.0, 1.0, 2.0, 2.0)
+
+# Only the most recent matches are ranked, which bounds the cost of
+# queries for very common terms
+MAX_RANKED_CANDIDATES = 5000
+
+# Display text stored per step
+SNIPPET_CHARS = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS timelines (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    label TEXT,
+    success INTEGER NOT NULL,
+    steps INTEGER NOT NULL,
+    indexed REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS steps (
+    id INTEGER PRIMARY KEY,
+    timeline_id INTEGER NOT NULL,
+    step_index INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    tactic TEXT NOT NULL,
+    goal TEXT,
+    error TEXT,
+    kind TEXT,
+    elab_ms REAL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS step_terms USING fts5(
+    tactic, hypotheses, goals, errors,
+    content='',
+    tokenize="unicode61 remove_diacritics 0 tokenchars '._'"
+);
+"""
+
+# Columns added to `steps` after the first release, for existing databases
+ADDED_STEP_COLUMNS = {"kind": "TEXT", "elab_ms": "REAL"}
+
+
+class SearchQueryError(ValueError):
+    """The search query has no searchable terms."""
+
+
+def _term(token: str) -> str | None:
+    """Normalize one raw token into an index term (letters, digits, '.', '_')."""
+    if token[0].isalnum() or token[0] == "_":
+        term = re.sub(r"[^\w.]", "", token).strip(".")
+        return term or None
+    if token in IGNORED_SYMBOLS:
+        return None
+    return f"u{ord(token):04x}"
+
+
+def tokenize(text: str) -> list[str]:
+    """Index terms of a piece of Lean text, in order."""
+    return [t for t in (_term(raw) for raw in TOKEN.findall(text)) if t]
+
+
+def tactic_kind(tactic: str) -> str:
+    """
+    The tactic's name: `simp` for `simp only [h] at *` or `· simp`. Case
+    arms (`| succ n ih => omega`) count as the tactic they run, or `case`.
+    """
+    text = tactic.strip().lstrip("·").strip()
+    if text.startswith(("|", "case ", "next")):
+        _, arrow, text = text.partition("=>")
+        if not arrow or not text.strip():
+            return "case"
+    match = re.match(r"[^\s\[\](){}<;,]+", text.strip())
+    return match.group(0) if match else "?"
+
+
+def index_text(text: str) -> str:
+    """
+    Text to store in an index column: the terms in order (so phrases
+    match), followed by the components of dotted names.
+    """
+    terms = tokenize(text)
+    parts = [p for t in terms if "." in t for p in t.split(".") if p]
+    return " ".join(terms + parts)
+
+
+def parse_query(query: str) -> str:
+    """
+    Translate a search query into an FTS5 match expression.
+
+    Terms are ANDed; `field:term` restricts a term to tactic, hyp, goal or
+    error. A term with several tokens (`a+b`, `Nat.succ n`) must match as
+    a phrase.
+    """
+    clauses = []
+    for word in query.split():
+        field, sep, value = word.partition(":")
+        column = FIELDS.get(field.lower()) if sep and value else None
+        if column is None:
+            value = word
+        terms = tokenize(value)
+        if not terms:
+            continue
+        phrase = '"' + " ".join(terms) + '"'
+        clauses.append(f"{{{column}}} : {phrase}" if column else phrase)
+    if not clauses:
+        raise SearchQueryError("Query has no searchable terms")
+    return " AND ".join(clauses)
+
+
+class SearchIndex:
+    """
+    Step search index in a SQLite database (WAL mode, so several workers
+    can add to it). Blocking calls run in worker threads.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._tasks: set[asyncio.Task] = set()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(steps)")}
+        for name, type_ in ADDED_STEP_COLUMNS.items():
+            if name not in columns:
+                conn.execute(f"ALTER TABLE steps ADD COLUMN {name} {type_}")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add_many(self, timelines: Iterable[tuple[str, str | None, ProofTimeline]]) -> int:
+        """
+        Index (key, label, timeline) entries in one transaction, skipping
+        keys that are already indexed. Returns the number of steps added.
+        """
+        conn = self._connection()
+        added = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key, label, timeline in timelines:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO timelines (key, label, success, steps, indexed) VALUES (?, ?, ?, ?, ?)",
+                    (key, label, int(timeline.success), len(timeline.steps), time.time()),
+                )
+                if cursor.rowcount == 0:
+                    continue
+                timeline_id = cursor.lastrowid
+                for step in timeline.steps:
+                    before = step.state_before
+                    goal = before.goals[0].type if before.goals else None
+                    cursor = conn.execute(
+                        "INSERT INTO steps (timeline_id, step_index, line, tactic, goal, error, kind, elab_ms)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (timeline_id, step.index, step.line, step.tactic,
+                         goal[:SNIPPET_CHARS] if goal else None, step.error,
+                         tactic_kind(step.tactic), step.elab_ms),
+                    )
+                    errors = index_text(step.error or "")
+                    conn.execute(
+                        "INSERT INTO step_terms (rowid, tactic, hypotheses, goals, errors) VALUES (?, ?, ?, ?, ?)",
+                        (
+                            cursor.lastrowid,
+                            index_text(step.tactic),
+                            index_text(" ".join(f"{h.name} : {h.type}" for h in before.hypotheses)),
+                            index_text("\n".join(g.type for g in before.goals)),
+                            f"{errors} {FAILED_MARKER}" if step.error else errors,
+                        ),
+                    )
+                    added += 1
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        SEARCH_INDEXED_STEPS.inc(added)
+        return added
+
+    def add_later(self, key: str, label: str | None, timeline: ProofTimeline) -> None:
+        """Index a timeline in the background, off the request path."""
+        task = asyncio.create_task(asyncio.to_thread(self.add_many, [(key, label, timeline)]))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def search(self, query: str, limit: int = 20, failed: bool | None = None) -> list[SearchHit]:
+        """Best matching steps for `query`, most relevant first."""
+        match = parse_query(query)
+        if failed:
+            match = f"({match}) AND {{errors}} : {FAILED_MARKER}"
+        elif failed is False:
+            match = f"({match}) NOT {{errors}} : {FAILED_MARKER}"
+
+        conn = self._connection()
+        with SEARCH_QUERIES.time():
+            floor = conn.execute(
+                "SELECT rowid FROM step_terms WHERE step_terms MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+                (match, MAX_RANKED_CANDIDATES - 1),
+            ).fetchone()
+            rows = conn.execute(
+                f"""
+                SELECT t.key, t.label, s.step_index, s.line, s.tactic, s.goal, s.error,
+                       bm25(step_terms, {", ".join(map(str, COLUMN_WEIGHTS))}) AS score
+                FROM step_terms
+                JOIN steps s ON s.id = step_terms.rowid
+                JOIN timelines t ON t.id = s.timeline_id
+                WHERE step_terms MATCH ? AND step_terms.rowid >= ?
+                ORDER BY score
+                LIMIT ?
+                """,
+                (match, floor[0] if floor else 0, limit),
+            ).fetchall()
+
+        return [
+            SearchHit(
+                timeline_key=key,
+                label=label,
+                step_index=step_index,
+                line=line,
+                tactic=tactic,
+                goal=goal,
+                error=error,
+                # bm25 scores are negative, lower is better
+                score=round(-score, 4),
+            )
+            for key, label, step_index, line, tactic, goal, error, score in rows
+        ]
+
+    def tactic_stats(self, limit: int = 50) -> list[TacticKindStats]:
+        """Elaboration time per tactic kind over all indexed steps, highest total first."""
+        rows = self._connection().execute(
+            """
+            SELECT kind, COUNT(*), AVG(elab_ms), MAX(elab_ms), SUM(elab_ms) AS total
+            FROM steps
+            WHERE elab_ms IS NOT NULL AND kind IS NOT NULL
+            GROUP BY kind
+            ORDER BY total DESC
+            LIMIT ?
+            """,
+            (limit,),
+        ).fetchall()
+        return [
+            TacticKindStats(
+                kind=kind,
+                count=count,
+                mean_ms=round(mean, 1),
+                max_ms=round(max_ms, 1),
+                total_ms=round(total, 1),
+            )
+            for kind, count, mean, max_ms, total in rows
+        ]
+
+    def stats(self) -> dict[str, Any]:
+        conn = self._connection()
+        timelines, steps = conn.execute("SELECT COUNT(*), COALESCE(SUM(steps), 0) FROM timelines").fetchone()
+        return {"path": self.path, "timelines": timelines, "steps": steps}
+
+
+# Singleton instance
+_index: SearchIndex | None = None
+
+
+def get_search_index() -> SearchIndex | None:
+    """Get the search index, or None when it is not configured."""
+    global _index
+    settings = get_settings()
+    if _index is None and settings.search_index_path:
+        _index = SearchIndex(settings.search_index_path)
+    return _index
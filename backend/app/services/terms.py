@@ -0,0 +1,134 @@
+"""
+Large Term Elision
+
+Goals and hypotheses from real proofs can be tens of kilobytes each, and
+the same term tends to appear in many steps. Types longer than the
+configured threshold are replaced in timelines by a short preview plus
+the SHA-256 of the full text. Each analysis collects its elided terms in
+a TermTable (one entry per distinct term), which is saved to the
+TermStore so `GET /api/proof/term/{hash}` can expand them on demand. The
+timeline cache keeps each table with its timeline and saves it again
+whenever the timeline is served from there.
+"""
+
+import hashlib
+from collections import OrderedDict
+from typing import Any
+
+from ..config import get_settings
+from ..models import Goal, Hypothesis, ProofState
+from .metrics import REGISTRY
+from .result_store import get_result_store
+
+
+TERMS_ELIDED = REGISTRY.counter("terms_elided_total", "Goal and hypothesis types replaced by a preview")
+TERM_LOOKUPS = REGISTRY.counter(
+    "term_lookups_total", "Elided term lookups, by where they were found", ("source",)
+)
+
+
+def term_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class TermTable:
+    """The elided terms of one analysis, by hash."""
+
+    def __init__(self, max_chars: int, preview_chars: int):
+        # 0 disables elision
+        self.max_chars = max_chars
+        self.preview_chars = preview_chars
+        self.terms: dict[str, str] = {}
+
+    @classmethod
+    def from_settings(cls) -> "TermTable":
+        settings = get_settings()
+        return cls(settings.term_elision_chars, settings.term_preview_chars)
+
+    def elide(self, text: str) -> tuple[str, str | None]:
+        """The text to show for a type, and the hash of the full text when it was elided."""
+        if not self.max_chars or len(text) <= self.max_chars:
+            return text, None
+        key = term_hash(text)
+        self.terms.setdefault(key, text)
+        TERMS_ELIDED.inc()
+        return text[:self.preview_chars].rstrip() + "…", key
+
+    def elide_state(self, state: ProofState) -> ProofState:
+        """`state` with its long goal and hypothesis types (including per-goal contexts) elided."""
+        items = (*state.goals, *state.hypotheses, *(h for g in state.goals for h in g.hypotheses or ()))
+        if not self.max_chars or not any(len(item.type) > self.max_chars for item in items):
+            return state
+        goals = []
+        for g in state.goals:
+            goal = self._elide_item(g)
+            if g.hypotheses:
+                goal = goal.model_copy(update={"hypotheses": [self._elide_item(h) for h in g.hypotheses]})
+            goals.append(goal)
+        return ProofState(goals=goals, hypotheses=[self._elide_item(h) for h in state.hypotheses])
+
+    def _elide_item(self, item: Goal | Hypothesis) -> Goal | Hypothesis:
+        text, key = self.elide(item.type)
+        return item if key is None else item.model_copy(update={"type": text, "term": key})
+
+
+class TermStore:
+    """Full text of elided terms, in a memory LRU backed by the shared result store."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._bytes = 0
+
+    def _remember(self, key: str, text: str) -> None:
+        size = len(text.encode())
+        if key in self._entries or size > self.max_bytes:
+            return
+        self._entries[key] = text
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted.encode())
+
+    async def save(self, terms: dict[str, str]) -> None:
+        """Keep the terms of an analysis (a TermTable's `terms`); the shared store makes them visible to every worker."""
+        store = get_result_store()
+        for key, text in terms.items():
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                continue
+            self._remember(key, text)
+            if store is not None:
+                await store.put("term", key, text.encode())
+
+    async def get(self, key: str) -> str | None:
+        text = self._entries.get(key)
+        if text is not None:
+            self._entries.move_to_end(key)
+            TERM_LOOKUPS.inc(source="memory")
+            return text
+        store = get_result_store()
+        if store is not None:
+            value = await store.get("term", key)
+            if value is not None:
+                TERM_LOOKUPS.inc(source="store")
+                text = value.decode()
+                self._remember(key, text)
+                return text
+        TERM_LOOKUPS.inc(source="miss")
+        return None
+
+    def stats(self) -> dict[str, Any]:
+        return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+# Singleton instance
+_store: TermStore | None = None
+
+
+def get_term_store() -> TermStore:
+    """Get or create the term store singleton."""
+    global _store
+    if _store is None:
+        _store = TermStore(get_settings().term_cache_bytes)
+    return _store
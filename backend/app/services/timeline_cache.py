@@ -0,0 +1,175 @@
+"""
+Timeline Cache
+
+Finished timelines addressed by the content hash of their source, so they
+can be served by `GET /api/proof/timeline/{hash}` without touching Lean.
+Lookups go through a small in-memory LRU, then the prebuilt timelines
+shipped with the app (see `scripts/build_example_timelines.py`), then the
+shared result store when one is configured.
+
+Each timeline's table of elided terms is kept next to it (`<hash>.terms.json`
+for prebuilt ones, the `timeline_terms` namespace in the store) and handed
+to the TermStore again on every hit, so the terms of a served timeline
+can always be expanded, however long ago it was built.
+"""
+
+import asyncio
+import json
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from ..config import get_settings
+from .metrics import REGISTRY
+from .result_store import get_result_store
+from .terms import get_term_store
+
+
+TIMELINE_LOOKUPS = REGISTRY.counter(
+    "timeline_cache_lookups_total", "Timeline lookups by content hash, by where they were found", ("source",)
+)
+
+# Content hashes are hex SHA-256 digests
+HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_timeline_hash(value: str) -> bool:
+    return HASH_PATTERN.match(value) is not None
+
+
+class TimelineCache:
+    """Serialized timelines by source hash, from memory, prebuilt files or the shared store."""
+
+    def __init__(self, max_bytes: int, prebuilt_dir: str | None):
+        self.max_bytes = max_bytes
+        self.prebuilt_dir = prebuilt_dir
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        # Term tables of the timelines in memory, empty when nothing was elided
+        self._terms: dict[str, dict[str, str]] = {}
+        self._bytes = 0
+        self._prebuilt = self._index_prebuilt()
+
+    def _index_prebuilt(self) -> set[str]:
+        if not self.prebuilt_dir or not os.path.isdir(self.prebuilt_dir):
+            return set()
+        names = (name.removesuffix(".json") for name in os.listdir(self.prebuilt_dir) if name.endswith(".json"))
+        return {name for name in names if is_timeline_hash(name)}
+
+    def _read_prebuilt(self, name: str) -> bytes:
+        with open(os.path.join(self.prebuilt_dir, name), "rb") as f:
+            return f.read()
+
+    def remember(self, key: str, value: bytes) -> None:
+        """Keep a serialized timeline in memory, evicting the least recently used."""
+        if len(value) > self.max_bytes:
+            self._terms.pop(key, None)
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = value
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes:
+            evicted_key, evicted = self._entries.popitem(last=False)
+            self._terms.pop(evicted_key, None)
+            self._bytes -= len(evicted)
+
+    async def keep_terms(self, key: str, terms: dict[str, str]) -> None:
+        """Keep the term table of a timeline that is about to be cached."""
+        self._terms[key] = terms
+        store = get_result_store()
+        if store is not None and terms:
+            await store.put("timeline_terms", key, json.dumps(terms).encode())
+
+    async def _restore_terms(self, key: str) -> None:
+        terms = self._terms.get(key)
+        if terms is None:
+            value = None
+            if key in self._prebuilt:
+                try:
+                    value = await asyncio.to_thread(self._read_prebuilt, f"{key}.terms.json")
+                except OSError:
+                    pass  # Nothing was elided
+            store = get_result_store()
+            if value is None and store is not None:
+                value = await store.get("timeline_terms", key)
+            terms = json.loads(value) if value is not None else {}
+            if key in self._entries:
+                self._terms[key] = terms
+        if terms:
+            await get_term_store().save(terms)
+
+    async def get(self, key: str) -> bytes | None:
+        """Look up a finished timeline without computing anything."""
+        value = await self._lookup(key)
+        if value is not None:
+            await self._restore_terms(key)
+        return value
+
+    async def _lookup(self, key: str) -> bytes | None:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+            TIMELINE_LOOKUPS.inc(source="memory")
+            return value
+
+        if key in self._prebuilt:
+            try:
+                value = await asyncio.to_thread(self._read_prebuilt, f"{key}.json")
+            except OSError:
+                self._prebuilt.discard(key)
+            else:
+                TIMELINE_LOOKUPS.inc(source="prebuilt")
+                self.remember(key, value)
+                return value
+
+        store = get_result_store()
+        if store is not None:
+            value = await store.get("timeline", key)
+            if value is not None:
+                TIMELINE_LOOKUPS.inc(source="store")
+                self.remember(key, value)
+                return value
+
+        TIMELINE_LOOKUPS.inc(source="miss")
+        return None
+
+    async def compute_once(self, key: str, compute: Callable[[], Awaitable[bytes | None]]) -> bytes | None:
+        """
+        Return the timeline for `key`, computing it when it is not cached.
+
+        `compute` returns None for results that should not be kept.
+        """
+        value = await self.get(key)
+        if value is not None:
+            return value
+        store = get_result_store()
+        if store is not None:
+            value = await store.compute_once("timeline", key, compute)
+        else:
+            value = await compute()
+        if value is not None:
+            self.remember(key, value)
+        return value
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "prebuilt": len(self._prebuilt),
+        }
+
+
+# Singleton instance
+_cache: TimelineCache | None = None
+
+
+def get_timeline_cache() -> TimelineCache:
+    """Get or create the timeline cache singleton."""
+    global _cache
+    if _cache is None:
+        settings = get_settings()
+        _cache = TimelineCache(settings.timeline_cache_bytes, settings.prebuilt_timelines_dir)
+    return _cache
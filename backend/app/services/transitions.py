@@ -0,0 +1,145 @@
+"""
+Tactic Transition Cache
+
+Maps (proof state before a step, normalized tactic, Lean environment) to
+the state after it, so transitions that recur across submissions of the
+same exercise don't need a goal query. The environment fingerprint
+combines the toolchain (the configured LEAN_TOOLCHAIN and the Lean version
+and commit the endpoint's elaborator reports) with the source's header
+(imports, opens, variables). Entries made under another toolchain are
+never looked up again and age out of the LRU; endpoints on different
+toolchains each use their own entries.
+
+Entries hold states as Lean reported them, before per-request limits
+clip them or long terms are elided. They live in a per-worker LRU and,
+when configured, in the shared result store so all workers on a host
+benefit.
+"""
+
+import hashlib
+import re
+from collections import OrderedDict
+from typing import Any
+
+from ..config import get_settings
+from ..models import ProofState
+from .metrics import REGISTRY
+from .result_store import get_result_store
+from .warm_headers import header_key, split_header
+
+
+# Bumped when the meaning of entries changes, so stored ones are ignored
+KEY_VERSION = 2
+
+TRANSITION_LOOKUPS = REGISTRY.counter(
+    "transition_cache_lookups_total", "Tactic transition cache lookups (hit, miss)", ("result",)
+)
+TRANSITION_INVALIDATIONS = REGISTRY.counter(
+    "transition_cache_invalidations_total",
+    "Analyses whose cached transitions were dropped because Lean ran on another toolchain",
+)
+
+
+def normalize_tactic(tactic: str) -> str:
+    """Tactic text without comments and with whitespace collapsed."""
+    without_comments = re.sub(r"--.*$", "", tactic, flags=re.MULTILINE)
+    return " ".join(without_comments.split())
+
+
+def state_fingerprint(state: ProofState, context: str = "") -> str:
+    """
+    Canonical hash of a proof state: goal and hypothesis types with
+    whitespace collapsed, case tags and per-goal contexts, ignoring ids,
+    metavariables (numbered per document) and diff flags. `context` is
+    mixed in where the state alone is not enough to identify it (the
+    initial state is parsed from the statement without its binders).
+    """
+    parts = [" ".join(context.split())]
+    parts += [f"{h.name}:{h.term or ' '.join(h.type.split())}" for h in state.hypotheses]
+    parts.append("⊢")
+    for g in state.goals:
+        goal = g.term or " ".join(g.type.split())
+        parts.append(f"case {g.user_name}: {goal}" if g.user_name else goal)
+        parts += [f"  {h.name}:{h.term or ' '.join(h.type.split())}" for h in g.hypotheses or ()]
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+class TransitionCache:
+    """Resulting proof states by transition key, scoped to a toolchain."""
+
+    def __init__(self, max_entries: int, toolchain: str):
+        self.max_entries = max_entries
+        self.configured_toolchain = toolchain
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def environment(self, code: str, toolchain: str | None) -> str | None:
+        """
+        Fingerprint of a toolchain reported by Lean and the source's header,
+        or None when the toolchain isn't known.
+        """
+        if toolchain is None:
+            return None
+        header, _ = split_header(code)
+        material = f"{self.configured_toolchain}|{toolchain}\n{header_key(header)}"
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def key(self, environment: str, before: ProofState, tactic: str, context: str = "") -> str:
+        material = f"{KEY_VERSION}\n{environment}\n{state_fingerprint(before, context)}\n{normalize_tactic(tactic)}"
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    async def get(self, key: str) -> ProofState | None:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        else:
+            store = get_result_store()
+            stored = await store.get("transition", key) if store is not None else None
+            if stored is not None:
+                value = stored.decode()
+                self._remember(key, value)
+        if value is None:
+            self.misses += 1
+            TRANSITION_LOOKUPS.inc(result="miss")
+            return None
+        self.hits += 1
+        TRANSITION_LOOKUPS.inc(result="hit")
+        return ProofState.model_validate_json(value)
+
+    async def put(self, key: str, after: ProofState) -> None:
+        if key in self._entries:
+            return
+        value = after.model_dump_json(exclude_defaults=True)
+        self._remember(key, value)
+        store = get_result_store()
+        if store is not None:
+            await store.put("transition", key, value.encode())
+
+    def _remember(self, key: str, value: str) -> None:
+        self._entries[key] = value
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+# Singleton instance
+_cache: TransitionCache | None = None
+
+
+def get_transition_cache() -> TransitionCache | None:
+    """Get the transition cache, or None when it is disabled."""
+    global _cache
+    settings = get_settings()
+    if _cache is None and settings.transition_cache_entries > 0:
+        _cache = TransitionCache(settings.transition_cache_entries, settings.lean_toolchain)
+    return _cache
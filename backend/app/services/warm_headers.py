@@ -0,0 +1,233 @@
+"""
+Warm Header Snapshots
+
+Most submissions start with the same preamble (`import Mathlib`, `open`,
+`variable` ...), and Lean spends most of a cold analysis re-elaborating it.
+This module keeps long-lived documents whose header is already elaborated;
+a submission with a matching header is applied as an edit on top of one,
+so Lean only re-checks the part after the header. Header usage is tracked
+with a decaying score so popular headers stay warm and cold ones are
+evicted.
+"""
+
+import asyncio
+import hashlib
+import math
+import re
+import time
+from typing import TYPE_CHECKING, Any
+
+from ..config import get_settings
+from .deadline import Deadline
+from .metrics import REGISTRY
+
+if TYPE_CHECKING:
+    from .lean_client import Lean4WebClient, WarmDocument
+
+
+WARM_HEADER_LOOKUPS = REGISTRY.counter(
+    "lean_warm_header_lookups_total", "Warm header lookups (hit, busy, miss)", ("outcome",)
+)
+WARM_HEADER_EVENTS = REGISTRY.counter(
+    "lean_warm_header_events_total", "Warm documents opened, evicted or dropped after an error", ("event",)
+)
+
+# Lines that belong to a file's preamble rather than its declarations
+HEADER_LINE = re.compile(r'^\s*(?:import|open|variable|universe|set_option|namespace|section|noncomputable\s+section)\b')
+# `open Foo in` scopes a single declaration and is not part of the header
+OPEN_IN = re.compile(r'^\s*open\b.*\bin\s*$')
+
+# Popularity table size; the lowest scores are dropped beyond this
+MAX_TRACKED_HEADERS = 1000
+
+
+def split_header(code: str) -> tuple[str, str]:
+    """
+    Split Lean source into its preamble and the rest.
+
+    The header is the leading run of import/open/variable/... lines,
+    together with blank lines and comments in between.
+    """
+    lines = code.split("\n")
+    header_end = 0
+    in_block_comment = False
+
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if in_block_comment:
+            if "-/" in stripped:
+                in_block_comment = False
+            continue
+        if stripped.startswith("/-"):
+            in_block_comment = "-/" not in stripped[2:]
+            continue
+        if not stripped or stripped.startswith("--"):
+            continue
+        if HEADER_LINE.match(line) and not OPEN_IN.match(line):
+            header_end = i + 1
+            continue
+        break
+
+    return "\n".join(lines[:header_end]), "\n".join(lines[header_end:])
+
+
+def header_key(header: str) -> str:
+    """Identity of a header, insensitive to trailing whitespace."""
+    normalized = "\n".join(line.rstrip() for line in header.strip().split("\n"))
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+class WarmHeaderPool:
+    """
+    Keeps up to `slots` warm documents for the most popular headers.
+
+    Each warm document serves one analysis at a time; when it is busy the
+    caller falls back to a cold session.
+    """
+
+    def __init__(self, client: "Lean4WebClient", slots: int, min_uses: float, half_life: float, warm_timeout: float):
+        self.client = client
+        self.slots = slots
+        self.min_uses = min_uses
+        self.half_life = half_life
+        self.warm_timeout = warm_timeout
+
+        self._docs: dict[str, "WarmDocument"] = {}
+        self._warming: set[str] = set()
+        self._popularity: dict[str, tuple[float, float]] = {}  # key -> (score, updated_at)
+        self._tasks: set[asyncio.Task] = set()
+
+    def _score(self, key: str, now: float) -> float:
+        score, updated_at = self._popularity.get(key, (0.0, now))
+        return score * math.pow(0.5, (now - updated_at) / self.half_life)
+
+    def _touch(self, key: str) -> float:
+        now = time.monotonic()
+        score = self._score(key, now) + 1.0
+        self._popularity[key] = (score, now)
+        if len(self._popularity) > MAX_TRACKED_HEADERS:
+            coldest = min(self._popularity, key=lambda k: self._score(k, now))
+            del self._popularity[coldest]
+        return score
+
+    async def analyze(
+        self,
+        code: str,
+        deadline: Deadline,
+        known_lines: frozenset[int] = frozenset(),
+    ) -> dict[str, Any] | None:
+        """
+        Analyze `code` on a warm document for its header.
+
+        Returns None when no idle warm document is available; the header's
+        use is still counted and may trigger warming one for next time.
+        """
+        header, _ = split_header(code)
+        key = header_key(header)
+        score = self._touch(key)
+
+        doc = self._docs.get(key)
+        if doc is None:
+            WARM_HEADER_LOOKUPS.inc(outcome="miss")
+            if score >= self.min_uses:
+                self._schedule_warm(key, header)
+            return None
+
+        if doc.lock.locked() or not doc.endpoint.available():
+            WARM_HEADER_LOOKUPS.inc(outcome="busy")
+            return None
+
+        async with doc.lock:
+            try:
+                result = await self.client.pool.attempt(
+                    doc.endpoint, lambda _: doc.analyze(code, deadline, known_lines), deadline
+                )
+            except asyncio.CancelledError:
+                # The document may be mid-edit; don't hand it to anyone else
+                self._drop(key, doc)
+                raise
+            except Exception:
+                WARM_HEADER_EVENTS.inc(event="dropped")
+                self._drop(key, doc)
+                return None
+
+        WARM_HEADER_LOOKUPS.inc(outcome="hit")
+        return result
+
+    def _schedule_warm(self, key: str, header: str) -> None:
+        if key in self._warming:
+            return
+        if len(self._docs) + len(self._warming) >= self.slots:
+            if not self._evict_colder_than(key):
+                return
+        self._warming.add(key)
+        task = asyncio.create_task(self._warm(key, header))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _evict_colder_than(self, key: str) -> bool:
+        """Evict the least popular idle warm document if it is colder than `key`."""
+        now = time.monotonic()
+        idle = [k for k, doc in self._docs.items() if not doc.lock.locked()]
+        if not idle:
+            return False
+        coldest = min(idle, key=lambda k: self._score(k, now))
+        if self._score(coldest, now) >= self._score(key, now):
+            return False
+        WARM_HEADER_EVENTS.inc(event="evicted")
+        self._drop(coldest, self._docs[coldest])
+        return True
+
+    async def prewarm(self, headers: list[str], deadline: Deadline) -> int:
+        """
+        Open warm documents for `headers` right away, without waiting for
+        them to become popular, so the first requests after a cold start
+        find a connection with their header elaborated. Returns how many
+        were opened.
+        """
+        opened = 0
+        for header in headers[:self.slots]:
+            key = header_key(header)
+            if key in self._docs or key in self._warming:
+                continue
+            # Popular enough not to be evicted by the first other header
+            self._popularity[key] = (self.min_uses, time.monotonic())
+            self._warming.add(key)
+            opened += await self._warm(key, header, deadline)
+        return opened
+
+    async def _warm(self, key: str, header: str, deadline: Deadline | None = None) -> bool:
+        try:
+            endpoint = self.client.pool.pick()
+            if endpoint is None:
+                return False
+            deadline = deadline or Deadline(self.warm_timeout)
+            doc = await self.client.pool.attempt(
+                endpoint, lambda ep: self.client.open_warm_document(ep, header, deadline), deadline
+            )
+            self._docs[key] = doc
+            WARM_HEADER_EVENTS.inc(event="opened")
+            return True
+        except Exception:
+            WARM_HEADER_EVENTS.inc(event="failed")
+            return False
+        finally:
+            self._warming.discard(key)
+
+    def _drop(self, key: str, doc: "WarmDocument") -> None:
+        if self._docs.get(key) is doc:
+            del self._docs[key]
+        task = asyncio.create_task(doc.close())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "warm": len(self._docs),
+            "warming": len(self._warming),
+            "slots": self.slots,
+            "busy": sum(1 for doc in self._docs.values() if doc.lock.locked()),
+            "tracked_headers": len(self._popularity),
+            "scores": sorted((round(self._score(k, now), 2) for k in self._docs), reverse=True),
+        }
@@ -1,13 +1,52 @@
 // API client for communicating with the backend
 
-import type { AnalyzeResponse } from './types';
+import type { AnalyzeResponse, ProofTimeline, TacticStep } from './types';
 
 // Use environment variable for API URL if set (production), otherwise default to relative (proxy)
 const BASE_URL = import.meta.env.VITE_API_URL || '';
 const API_BASE = `${BASE_URL}/api`;
 
-export async function analyzeProof(code: string): Promise<AnalyzeResponse> {
-    const response = await fetch(`${API_BASE}/proof/analyze`, {
+// Must match PIPELINE_VERSION in backend/app/services/result_store.py
+const PIPELINE_VERSION = '1';
+
+// Content hash the backend uses to address finished timelines
+async function timelineHash(code: string): Promise<string | null> {
+    // crypto.subtle is only available in secure contexts
+    if (!globalThis.crypto?.subtle) {
+        return null;
+    }
+    const data = new TextEncoder().encode(`${PIPELINE_VERSION}\0${code}`);
+    const digest = await crypto.subtle.digest('SHA-256', data);
+    return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, '0')).join('');
+}
+
+// Finished (or prebuilt) timeline for this code, if the backend already has one
+async function fetchCachedTimeline(code: string): Promise<AnalyzeResponse | null> {
+    const hash = await timelineHash(code);
+    if (!hash) {
+        return null;
+    }
+    try {
+        const response = await fetch(`${API_BASE}/proof/timeline/${hash}`);
+        return response.ok ? response.json() : null;
+    } catch {
+        return null;
+    }
+}
+
+// Analyze with the streaming endpoint. `onPreview` gets the provisional
+// timeline from the local simulator at once, then again each time a
+// Lean-backed step replaces one of its steps.
+export async function analyzeProof(
+    code: string,
+    onPreview?: (timeline: ProofTimeline) => void,
+): Promise<AnalyzeResponse> {
+    const cached = await fetchCachedTimeline(code);
+    if (cached) {
+        return cached;
+    }
+
+    const response = await fetch(`${API_BASE}/proof/analyze/stream`, {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
@@ -15,11 +54,59 @@ export async function analyzeProof(code: string): Promise<AnalyzeResponse> {
         body: JSON.stringify({ code }),
     });
 
-    if (!response.ok) {
+    if (response.status === 413) {
+        const { detail } = await response.json();
+        throw new Error(detail.message);
+    }
+    if (!response.ok || !response.body) {
         throw new Error(`API error: ${response.status} ${response.statusText}`);
     }
 
-    return response.json();
+    let preview: ProofTimeline | null = null;
+    const steps: TacticStep[] = [];
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = '';
+    for (;;) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += value;
+        let newline: number;
+        while ((newline = buffer.indexOf('\n')) >= 0) {
+            const line = buffer.slice(0, newline);
+            buffer = buffer.slice(newline + 1);
+            if (!line.trim()) {
+                continue;
+            }
+            const event = JSON.parse(line);
+            if (event.event === 'preview') {
+                preview = event.timeline as ProofTimeline;
+                onPreview?.(preview);
+            } else if (event.event === 'step') {
+                steps.push(event.step);
+                if (preview) {
+                    const merged = [...preview.steps];
+                    merged[event.step.index] = event.step;
+                    preview = { ...preview, steps: merged };
+                    onPreview?.(preview);
+                }
+            } else if (event.event === 'final') {
+                const result = event.response as AnalyzeResponse;
+                return result.timeline ? { ...result, timeline: { ...result.timeline, steps } } : result;
+            }
+        }
+    }
+    throw new Error('Analysis stream ended early');
+}
+
+// Full text of an elided goal or hypothesis type
+export async function fetchTerm(hash: string): Promise<string> {
+    const response = await fetch(`${API_BASE}/proof/term/${hash}`);
+    if (!response.ok) {
+        throw new Error(`API error: ${response.status} ${response.statusText}`);
+    }
+    return (await response.json()).text;
 }
 
 export async function healthCheck(): Promise<boolean> {
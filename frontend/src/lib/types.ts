@@ -4,12 +4,17 @@ export interface Hypothesis {
     name: string;
     type: string;
     is_new: boolean;
+    term?: string | null;  // Hash of the full type when `type` is a preview
 }
 
 export interface Goal {
     id: string;
     type: string;
     is_new: boolean;
+    term?: string | null;
+    user_name?: string | null;  // Case tag
+    mvar_id?: string | null;  // Lean's metavariable id
+    hypotheses?: Hypothesis[] | null;  // Own context, when it differs from the state's
 }
 
 export interface ProofState {
@@ -34,6 +39,9 @@ export interface TacticStep {
     state_after: ProofState;
     diff: StateDiff;
     explanation: string;
+    error?: string | null;
+    elab_ms?: number | null;  // Estimated Lean elaboration time
+    simulated?: boolean;  // Guessed locally rather than reported by Lean
 }
 
 export interface ProofTimeline {
@@ -41,6 +49,10 @@ export interface ProofTimeline {
     source_code: string;
     success: boolean;
     error: string | null;
+    elaboration_ms?: number | null;
+    slowest_steps?: number[];  // Step indices, slowest first
+    provisional?: boolean;  // Preview shown while Lean runs
+    truncated?: string[];  // Server limits that cut the timeline short
 }
 
 export interface AnalyzeResponse {
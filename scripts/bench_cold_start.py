@@ -0,0 +1,114 @@
+"""
+Benchmark cold starts of the backend.
+
+Starts a fresh uvicorn process per run, the way a scale-to-zero host does,
+sends `POST /api/proof/analyze` as soon as the port answers and measures
+the time until it returns a successful timeline. The server's own startup
+milestones (from `GET /ready`) are reported alongside. Caches that would
+survive between runs are disabled.
+
+Usage:
+    python scripts/bench_cold_start.py [--runs 5] [--no-prewarm] [--json]
+
+Lean is reached through LEAN4WEB_URL as usual; point it at
+scripts/fake_lean_server.py to measure the backend alone.
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+PROOF = "theorem add_zero' (n : Nat) : n + 0 = n := by\n  simp\n"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_once(prewarm: bool, timeout: float) -> dict:
+    port = free_port()
+    env = {
+        **os.environ,
+        "STARTUP_PREWARM": "true" if prewarm else "false",
+        "TIMELINE_CACHE_BYTES": "0",
+        "PREBUILT_TIMELINES_DIR": "",
+    }
+    for name in ("SHARED_STORE_PATH", "SEARCH_INDEX_PATH", "LEAN_RECORD_DIR"):
+        env.pop(name, None)
+
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=ROOT / "backend", env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    result = {"listening": None, "warm": None, "first_analysis": None, "success": False}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=timeout) as client:
+            while time.perf_counter() - started < timeout:
+                try:
+                    client.get("/ready")
+                except httpx.TransportError:
+                    time.sleep(0.02)
+                    continue
+                result["listening"] = time.perf_counter() - started
+                break
+            else:
+                return result
+
+            # The request that woke the instance up, sent as soon as it listens
+            response = client.post("/api/proof/analyze", json={"code": PROOF})
+            result["first_analysis"] = time.perf_counter() - started
+            timeline = response.json().get("timeline") if response.status_code == 200 else None
+            result["success"] = bool(timeline and timeline["success"])
+
+            # Milestones as the server measured them, from its first import
+            result["server"] = client.get("/ready").json()["startup_seconds"]
+            result["warm"] = result["server"].get("first_lean_session")
+    finally:
+        server.terminate()
+        server.wait()
+    return result
+
+
+def summarize(name: str, values: list[float]) -> str:
+    if not values:
+        return f"  {name:<16} n/a"
+    return (f"  {name:<16} median {statistics.median(values) * 1000:7.0f} ms, "
+            f"min {min(values) * 1000:7.0f} ms, max {max(values) * 1000:7.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes to start")
+    parser.add_argument("--no-prewarm", action="store_true", help="Disable the startup pre-warm (STARTUP_PREWARM=false)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Give up on a run after this many seconds")
+    parser.add_argument("--json", action="store_true", help="Print the raw results as JSON")
+    args = parser.parse_args()
+
+    runs = [run_once(not args.no_prewarm, args.timeout) for _ in range(args.runs)]
+    if args.json:
+        print(json.dumps(runs, indent=2))
+        return
+
+    print(f"{len(runs)} cold starts, pre-warm {'off' if args.no_prewarm else 'on'}")
+    print(summarize("listening", [r["listening"] for r in runs if r["listening"] is not None]))
+    print(summarize("app imported", [r["server"]["imported"] for r in runs if r.get("server")]))
+    print(summarize("lean warm", [r["warm"] for r in runs if r["warm"] is not None]))
+    print(summarize("first analysis", [r["first_analysis"] for r in runs if r["success"]]))
+    print(f"  {sum(not r['success'] for r in runs)} runs without a successful first analysis")
+
+
+if __name__ == "__main__":
+    main()
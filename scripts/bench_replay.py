@@ -0,0 +1,101 @@
+"""
+Benchmark the analysis pipeline against recorded Lean sessions.
+
+Replays every trace in a directory (recorded with LEAN_RECORD_DIR set)
+through `POST /api/proof/analyze` in-process, with Lean replaced by the
+recordings, and reports latency percentiles and throughput. Result,
+timeline and transition caches are disabled so every request runs the
+full pipeline, goal queries included.
+
+Usage:
+    python scripts/bench_replay.py TRACE_DIR [--speed 0] [--iterations 3] [--concurrency 4]
+
+--speed 1 replays Lean with its recorded timing, higher values compress
+it, and 0 removes Lean's latency entirely to measure the backend alone.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / "backend"))
+
+
+def load_sources(trace_dir: Path) -> list[str]:
+    """The analyzed source of each recorded session."""
+    from app.services.replay import TRACE_SUFFIX, document_text, read_trace
+
+    sources = []
+    for path in sorted(trace_dir.glob(f"*{TRACE_SUFFIX}")):
+        _, events = read_trace(str(path))
+        text = next((t for e in events if e["dir"] == "send" for t in [document_text(e["msg"])] if t is not None), None)
+        if text is not None:
+            sources.append(text)
+    return sources
+
+
+async def bench(sources: list[str], iterations: int, concurrency: int) -> None:
+    import httpx
+    from app.main import app
+
+    latencies: list[float] = []
+    failures = 0
+    limit = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def analyze(code: str) -> None:
+            nonlocal failures
+            async with limit:
+                started = time.perf_counter()
+                response = await client.post("/api/proof/analyze", json={"code": code})
+                latencies.append(time.perf_counter() - started)
+            timeline = response.json().get("timeline") if response.status_code == 200 else None
+            if not timeline or not timeline["success"]:
+                failures += 1
+
+        started = time.perf_counter()
+        for _ in range(iterations):
+            await asyncio.gather(*(analyze(code) for code in sources))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{len(latencies)} analyses of {len(sources)} traces, concurrency {concurrency}")
+    print(f"  p50 {statistics.median(latencies) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms, "
+          f"mean {statistics.fmean(latencies) * 1000:.1f} ms")
+    print(f"  {len(latencies) / elapsed:.1f} analyses/s, {failures} without a successful timeline")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace_dir", type=Path, help="Directory of recorded traces")
+    parser.add_argument("--speed", type=float, default=0.0, help="Replay speed (1 = recorded timing, 0 = no delays)")
+    parser.add_argument("--iterations", type=int, default=3, help="Passes over the traces")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight")
+    args = parser.parse_args()
+
+    # Settings are read from the environment when the app is imported
+    os.environ["LEAN_REPLAY_DIR"] = str(args.trace_dir)
+    os.environ["LEAN_REPLAY_SPEED"] = str(args.speed)
+    os.environ.pop("LEAN_RECORD_DIR", None)
+    os.environ.pop("SHARED_STORE_PATH", None)
+    os.environ.pop("SEARCH_INDEX_PATH", None)
+    os.environ["TIMELINE_CACHE_BYTES"] = "0"
+    os.environ["PREBUILT_TIMELINES_DIR"] = ""
+    os.environ["WARM_HEADER_SLOTS"] = "0"
+    os.environ["TRANSITION_CACHE_ENTRIES"] = "0"
+
+    sources = load_sources(args.trace_dir)
+    if not sources:
+        sys.exit(f"No traces found in {args.trace_dir}")
+    asyncio.run(bench(sources, args.iterations, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Precompute timelines for the bundled example proofs.
+
+Runs every example in `frontend/src/lib/examples.ts` through the analysis
+pipeline and writes the results as `<source hash>.json` files, which the
+backend serves from `GET /api/proof/timeline/{hash}` without contacting
+Lean. The full text of terms a timeline elides goes next to it in
+`<source hash>.terms.json`. A `manifest.json` maps example names to their
+hashes.
+
+Usage:
+    python scripts/build_example_timelines.py [--out DIR] [--timeout 300]
+
+Uses the backend's settings (LEAN4WEB_URL etc.) to reach Lean; examples
+whose analysis fails or is incomplete are reported and left out.
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / "backend"))
+
+from app.config import get_settings
+from app.routers.proof import build_analysis
+from app.services.deadline import Deadline, deadline_scope
+from app.services.result_store import source_hash
+from app.services.terms import TermTable
+
+EXAMPLES_FILE = ROOT / "frontend" / "src" / "lib" / "examples.ts"
+
+# `name: `...`` entries and `export const name = `...``; the examples
+# contain no backticks, escapes or ${} interpolation
+TEMPLATE_LITERAL = re.compile(r"^\s*(?:export\s+const\s+)?(\w+)\s*[:=]\s*`([^`]*)`", re.MULTILINE)
+
+
+def load_examples(path: Path) -> dict[str, str]:
+    return {name: code for name, code in TEMPLATE_LITERAL.findall(path.read_text(encoding="utf-8"))}
+
+
+async def build(out_dir: Path, timeout: float) -> int:
+    examples = load_examples(EXAMPLES_FILE)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {}
+    failed = 0
+
+    for name, code in examples.items():
+        key = source_hash(code)
+        terms = TermTable.from_settings()
+        with deadline_scope(Deadline(timeout)):
+            response, complete = await build_analysis(code, terms)
+        if response.error or not complete:
+            print(f"  {name}: skipped ({response.error or 'incomplete Lean session'})")
+            failed += 1
+            continue
+        (out_dir / f"{key}.json").write_bytes(response.model_dump_json().encode())
+        if terms.terms:
+            (out_dir / f"{key}.terms.json").write_text(json.dumps(terms.terms), encoding="utf-8")
+        manifest[name] = key
+        print(f"  {name}: {key} ({len(response.timeline.steps)} steps)")
+
+    (out_dir / "manifest.json").write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+    print(f"Built {len(manifest)}/{len(examples)} timelines into {out_dir}")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", type=Path, default=Path(get_settings().prebuilt_timelines_dir))
+    parser.add_argument("--timeout", type=float, default=300.0, help="Seconds allowed per example")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(build(args.out, args.timeout)))
+
+
+if __name__ == "__main__":
+    main()
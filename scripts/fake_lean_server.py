@@ -0,0 +1,172 @@
+"""
+Local stand-in for a Lean4Web server.
+
+Speaks just enough of the LSP-over-WebSocket protocol for the backend's
+Lean client: answers `initialize`, publishes diagnostics and an empty
+`$/lean/fileProgress` after `didOpen`, and answers goal queries, both
+`$/lean/plainGoal` and `getInteractiveGoals` over `$/lean/rpc/call`
+(unless `--plain-goals`, which makes the RPC methods unknown).
+Lines using the `fail` tactic get an error diagnostic, `#eval
+Lean.versionString` reports `--toolchain`, and `--chatter`
+adds progress notifications to stress the client's message limits.
+`--progress` reports elaboration line by line, spending the delay mostly
+on heavy tactics (simp, decide, omega, ...), like Lean's progress bar.
+Latency and failures can be injected to exercise endpoint balancing,
+circuit breaking and hedging without touching live.lean-lang.org.
+
+Usage:
+    python scripts/fake_lean_server.py --port 9001 --delay 0.5 --fail-rate 0.2
+
+Then point the backend at it:
+    LEAN4WEB_URLS="http://127.0.0.1:9001,http://127.0.0.1:9002"
+"""
+
+import argparse
+import asyncio
+import json
+import random
+
+import websockets
+
+
+# Tactics that take longer to "elaborate" with --progress
+HEAVY_TACTICS = ("simp", "decide", "omega", "norm_num", "linarith", "aesop")
+
+# The goal state reported at every position, in both formats
+PLAIN_GOAL = {"goals": ["a b : ℕ\n⊢ True"], "rendered": "```lean\na b : ℕ\n⊢ True\n```"}
+
+
+def interactive_goal(line: int) -> dict:
+    return {
+        "hyps": [{"names": ["a", "b"], "fvarIds": ["_uniq.1", "_uniq.2"], "type": {"tag": [{"info": {"p": "0"}}, {"text": "ℕ"}]}}],
+        "type": {"append": [{"tag": [{"info": {"p": "1"}}, {"text": "True"}]}]},
+        "goalPrefix": "⊢ ",
+        "mvarId": f"_uniq.{100 + line}",
+    }
+
+
+def build_handler(
+    delay: float,
+    fail_rate: float,
+    chatter: int = 0,
+    progress: bool = False,
+    plain_goals: bool = False,
+    toolchain: str = "4.0.0",
+):
+    async def handler(ws, *args):
+        if random.random() < fail_rate:
+            await ws.close(code=1011, reason="injected failure")
+            return
+
+        try:
+            await serve_messages(ws)
+        except websockets.ConnectionClosed:
+            pass  # Client gave up (deadline, hedge loser); nothing to do
+
+    async def serve_messages(ws):
+        async for raw in ws:
+            msg = json.loads(raw)
+            method = msg.get("method")
+
+            if method == "initialize":
+                await ws.send(json.dumps({
+                    "jsonrpc": "2.0",
+                    "id": msg["id"],
+                    "result": {"capabilities": {}, "serverInfo": {"name": "fake-lean", "version": "0.0.0"}},
+                }))
+            elif method in ("textDocument/didOpen", "textDocument/didChange"):
+                doc = msg["params"]["textDocument"]
+                uri, version = doc["uri"], doc.get("version")
+                text = doc.get("text") or msg["params"].get("contentChanges", [{}])[0].get("text", "")
+                if progress:
+                    await report_progress(ws, uri, version, text)
+                else:
+                    await asyncio.sleep(delay)
+                await ws.send(json.dumps({
+                    "jsonrpc": "2.0",
+                    "method": "textDocument/publishDiagnostics",
+                    "params": {"uri": uri, "version": version, "diagnostics": fake_errors(text, toolchain)},
+                }))
+                for line in range(chatter):
+                    await ws.send(json.dumps({
+                        "jsonrpc": "2.0",
+                        "method": "$/lean/fileProgress",
+                        "params": {
+                            "textDocument": {"uri": uri, "version": version},
+                            "processing": [{"range": {"start": {"line": line, "character": 0}, "end": {"line": line + 1, "character": 0}}, "kind": 1}],
+                        },
+                    }))
+                await ws.send(json.dumps({
+                    "jsonrpc": "2.0",
+                    "method": "$/lean/fileProgress",
+                    "params": {"textDocument": {"uri": uri, "version": version}, "processing": []},
+                }))
+            elif method == "$/lean/plainGoal":
+                await ws.send(json.dumps({"jsonrpc": "2.0", "id": msg["id"], "result": PLAIN_GOAL}))
+            elif method == "$/lean/rpc/connect" and not plain_goals:
+                await ws.send(json.dumps({"jsonrpc": "2.0", "id": msg["id"], "result": {"sessionId": "1"}}))
+            elif method == "$/lean/rpc/call" and not plain_goals and msg["params"]["method"] == "Lean.Widget.getInteractiveGoals":
+                line = msg["params"]["position"]["line"]
+                await ws.send(json.dumps({"jsonrpc": "2.0", "id": msg["id"], "result": {"goals": [interactive_goal(line)]}}))
+            elif "id" in msg:
+                await ws.send(json.dumps({
+                    "jsonrpc": "2.0",
+                    "id": msg["id"],
+                    "error": {"code": -32601, "message": f"Method not found: {method}"},
+                }))
+
+    async def report_progress(ws, uri, version, text):
+        lines = text.split("\n")
+        weights = [5 if line.strip().startswith(HEAVY_TACTICS) else 1 for line in lines]
+        end = {"line": len(lines), "character": 0}
+        for i, weight in enumerate(weights):
+            await ws.send(json.dumps({
+                "jsonrpc": "2.0",
+                "method": "$/lean/fileProgress",
+                "params": {
+                    "textDocument": {"uri": uri, "version": version},
+                    "processing": [{"range": {"start": {"line": i, "character": 0}, "end": end}, "kind": 1}],
+                },
+            }))
+            await asyncio.sleep(delay * weight / sum(weights))
+
+    return handler
+
+
+def fake_errors(text: str, toolchain: str) -> list[dict]:
+    diagnostics = []
+    for i, line in enumerate(text.split("\n")):
+        if line.strip() == "fail":
+            severity, message = 1, "tactic 'fail' failed"
+        elif line.startswith("#eval Lean.versionString"):
+            severity, message = 3, f'"{toolchain} fake"'
+        else:
+            continue
+        diagnostics.append({
+            "range": {"start": {"line": i, "character": 0}, "end": {"line": i, "character": len(line)}},
+            "severity": severity,
+            "message": message,
+        })
+    return diagnostics
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to 'elaborate' each document")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of connections to drop")
+    parser.add_argument("--chatter", type=int, default=0, help="Progress notifications sent per document update")
+    parser.add_argument("--progress", action="store_true", help="Report elaboration progress line by line")
+    parser.add_argument("--plain-goals", action="store_true", help="Answer only $/lean/plainGoal, like servers without RPC")
+    parser.add_argument("--toolchain", default="4.0.0", help="Lean version reported to #eval Lean.versionString")
+    args = parser.parse_args()
+
+    handler = build_handler(args.delay, args.fail_rate, args.chatter, args.progress, args.plain_goals, args.toolchain)
+    async with websockets.serve(handler, args.host, args.port):
+        print(f"Fake Lean server on ws://{args.host}:{args.port}/websocket")
+        await asyncio.Future()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())